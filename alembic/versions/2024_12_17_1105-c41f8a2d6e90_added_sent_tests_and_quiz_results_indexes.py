@@ -0,0 +1,39 @@
+"""added sent tests and quiz results indexes
+
+Revision ID: c41f8a2d6e90
+Revises: 5b7e0c91d3f2
+Create Date: 2024-12-17 11:05:42.917305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f8a2d6e90'
+down_revision: Union[str, None] = '5b7e0c91d3f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built without locking the tables for writes, CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_sent_tests_receiver_username_pending', 'sent_tests', ['receiver_username', 'sender_username', 'created_at'], unique=False, postgresql_where=sa.text("status IN ('SENT', 'DELIVERED')"), postgresql_concurrently=True)
+        op.create_index('ix_sent_tests_receiver_id_pending', 'sent_tests', ['receiver_id', 'sender_username'], unique=False, postgresql_where=sa.text("status IN ('SENT', 'DELIVERED')"), postgresql_concurrently=True)
+        op.create_index('ix_sent_tests_sender_id_receiver_username_updated_at', 'sent_tests', ['sender_id', 'receiver_username', 'updated_at'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_sent_tests_sender_id_test_id_created_at', 'sent_tests', ['sender_id', 'test_id', 'created_at'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_sent_tests_sender_id_receiver_username_completed', 'sent_tests', ['sender_id', 'receiver_username', 'test_id', 'completed_at'], unique=False, postgresql_where=sa.text("status = 'COMPLETED'"), postgresql_concurrently=True)
+        op.create_index('ix_quiz_results_user_id_test_id_category_id_created_at', 'quiz_results', ['user_id', 'test_id', 'category_id', sa.text('created_at DESC')], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_quiz_results_user_id_test_id_category_id_created_at', table_name='quiz_results', postgresql_concurrently=True)
+        op.drop_index('ix_sent_tests_sender_id_receiver_username_completed', table_name='sent_tests', postgresql_concurrently=True)
+        op.drop_index('ix_sent_tests_sender_id_test_id_created_at', table_name='sent_tests', postgresql_concurrently=True)
+        op.drop_index('ix_sent_tests_sender_id_receiver_username_updated_at', table_name='sent_tests', postgresql_concurrently=True)
+        op.drop_index('ix_sent_tests_receiver_id_pending', table_name='sent_tests', postgresql_concurrently=True)
+        op.drop_index('ix_sent_tests_receiver_username_pending', table_name='sent_tests', postgresql_concurrently=True)
@@ -0,0 +1,151 @@
+# benchmarks/query_plans.py
+
+"""
+Query plans of the hot sent_tests / quiz_results lookups without and with the indexes of the models.
+
+Seeds a scratch "benchmark" schema of the configured database with copies of the tables, so the app data
+is never touched, prints EXPLAIN ANALYZE of every lookup before and after the indexes are created and drops
+the schema at the end.
+
+Usage: python benchmarks/query_plans.py [--rows 2000000] [--keep]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.schema import CreateIndex
+
+# Current file directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Add project root to sys.path
+project_root = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, project_root)
+
+from core import log
+from core.models import db_helper, SentTest, QuizResult
+
+
+SCHEMA = "benchmark"
+
+SEED = [
+    f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE",
+    f"CREATE SCHEMA {SCHEMA}",
+    f"CREATE TABLE {SCHEMA}.sent_tests (LIKE public.sent_tests INCLUDING DEFAULTS)",
+    f"CREATE TABLE {SCHEMA}.quiz_results (LIKE public.quiz_results INCLUDING DEFAULTS)",
+    # 20k senders, 200k receivers, 30 tests, statuses evenly spread over a year
+    f"""
+    INSERT INTO {SCHEMA}.sent_tests (
+        sender_id, sender_username, test_id, test_name, receiver_id, receiver_username,
+        status, completed_at, is_active, created_at, updated_at
+    )
+    SELECT
+        1000 + i % 20000, 'sender_' || i % 20000, md5('test' || i % 30)::uuid, 'Test ' || i % 30,
+        500000 + i % 200000, 'user_' || i % 200000,
+        (ARRAY['SENT', 'DELIVERED', 'COMPLETED', 'REJECTED'])[1 + i % 4]::teststatus,
+        CASE WHEN i % 4 = 2 THEN now() - (i % 525600) * interval '1 minute' + interval '1 hour' END,
+        true, now() - (i % 525600) * interval '1 minute', now() - (i % 525600) * interval '1 minute'
+    FROM generate_series(1, :rows) AS i
+    """,
+    # 100k users passing 30 tests with 4 categories each
+    f"""
+    INSERT INTO {SCHEMA}.quiz_results (user_id, test_id, is_psychological, category_id, score, result_text, is_active, created_at, updated_at)
+    SELECT
+        md5('user' || i % 100000)::uuid, md5('test' || i % 30)::uuid, true, 1 + i % 4, i % 50, 'Result',
+        true, now() - i * interval '1 second', now() - i * interval '1 second'
+    FROM generate_series(1, :rows) AS i
+    """,
+    f"ANALYZE {SCHEMA}.sent_tests",
+    f"ANALYZE {SCHEMA}.quiz_results",
+]
+
+QUERIES = {
+    "received tests senders (received_tests.py)": """
+        SELECT sender_username, max(created_at) FROM sent_tests
+        WHERE receiver_username = 'user_42' AND status IN ('SENT', 'DELIVERED')
+        GROUP BY sender_username
+    """,
+    "received tests count (received_tests.py)": """
+        SELECT count(DISTINCT sender_username) FROM sent_tests
+        WHERE receiver_id = 500042 AND status IN ('SENT', 'DELIVERED')
+    """,
+    "sent tests to the user (send_test.py)": """
+        SELECT * FROM sent_tests
+        WHERE sender_id = 1042 AND receiver_username = 'user_42'
+        ORDER BY updated_at DESC
+    """,
+    "sent tests list (send_test.py)": """
+        SELECT test_name, test_id, max(created_at) FROM sent_tests
+        WHERE sender_id = 1042
+        GROUP BY test_name, test_id
+        ORDER BY max(created_at) DESC
+    """,
+    "latest completed tests (ai_test_result_transcription.py)": """
+        SELECT DISTINCT ON (test_id) * FROM sent_tests
+        WHERE sender_id = 1042 AND receiver_username = 'user_42' AND status = 'COMPLETED'
+        ORDER BY test_id, completed_at DESC NULLS LAST
+    """,
+    "latest result of one category, old N+1 loop (received_tests.py)": """
+        SELECT * FROM quiz_results
+        WHERE user_id = md5('user42')::uuid AND test_id = md5('test12')::uuid AND category_id = 3
+        ORDER BY created_at DESC
+        LIMIT 1
+    """,
+    "latest results of all categories, DISTINCT ON (received_tests.py)": """
+        SELECT DISTINCT ON (category_id) * FROM quiz_results
+        WHERE user_id = md5('user42')::uuid AND test_id = md5('test12')::uuid AND category_id IS NOT NULL
+        ORDER BY category_id, created_at DESC
+    """,
+}
+
+
+async def explain_all(conn, title: str) -> None:
+    print(f"\n{'=' * 30} {title} {'=' * 30}")
+    for name, query in QUERIES.items():
+        plan = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"))
+        print(f"\n--- {name}")
+        print("\n".join(row[0] for row in plan))
+
+
+async def create_indexes(conn) -> None:
+    metadata = MetaData()
+    for model in (SentTest, QuizResult):
+        table = model.__table__.to_metadata(metadata, schema=SCHEMA)
+        for index in table.indexes:
+            await conn.execute(CreateIndex(index))
+    await conn.execute(text(f"ANALYZE {SCHEMA}.sent_tests"))
+    await conn.execute(text(f"ANALYZE {SCHEMA}.quiz_results"))
+
+
+async def main(rows: int, keep: bool) -> None:
+    async with db_helper.engine.connect() as conn:
+        try:
+            log.info("Seeding %s rows into %s.sent_tests and %s.quiz_results", rows, SCHEMA, SCHEMA)
+            for statement in SEED:
+                await conn.execute(text(statement), {"rows": rows} if ":rows" in statement else {})
+            await conn.commit()
+
+            await conn.execute(text(f"SET search_path TO {SCHEMA}, public"))
+            await explain_all(conn, "WITHOUT INDEXES")
+
+            await create_indexes(conn)
+            await conn.commit()
+            await explain_all(conn, "WITH INDEXES")
+        finally:
+            if not keep:
+                await conn.rollback()
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+                await conn.commit()
+    await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Rows seeded into every table")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark schema for manual queries")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.keep))
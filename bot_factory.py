@@ -0,0 +1,30 @@
+# bot_factory.py
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from core import settings
+from core.models import create_fsm_storage
+from middlewares import DBSessionMiddleware, UserContextMiddleware, request_rate_limiter
+
+
+def create_bot(token: str) -> Bot:
+    """Bot used by both entry points, the webhook app (main.py) and the polling runner (run_polling.py)"""
+    if settings.bot.api_server_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.bot.api_server_url), timeout=60)
+    else:
+        session = AiohttpSession(timeout=60)
+    # Rate limits and RetryAfter handling for everything the bot sends
+    session.middleware(request_rate_limiter)
+    return Bot(token=token, session=session, default=DefaultBotProperties(parse_mode='HTML'))
+
+
+def create_dispatcher(router: Router) -> Dispatcher:
+    dp = Dispatcher(storage=create_fsm_storage())
+    # The session middleware goes first, so the user lookup shares the session of the update
+    dp.update.outer_middleware(DBSessionMiddleware())
+    dp.update.outer_middleware(UserContextMiddleware())
+    dp.include_router(router)
+    return dp
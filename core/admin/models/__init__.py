@@ -17,6 +17,8 @@ from .sent_test import SentTestAdmin
 
 from .ai_transcripts import AITranscriptsAdmin
 
+from .broadcast import BroadcastJobAdmin
+
 # Register admin views
 def setup_admin(admin):
     admin.add_view(UserAdmin)
@@ -34,3 +36,5 @@ def setup_admin(admin):
     admin.add_view(SentTestAdmin)
     
     admin.add_view(AITranscriptsAdmin)
+
+    admin.add_view(BroadcastJobAdmin)
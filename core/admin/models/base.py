@@ -58,6 +58,16 @@ class BaseAdminModel(ModelView):
             if hasattr(model, key):
                 setattr(model, key, value)
 
+    async def invalidate_cache(self) -> None:
+        """Drop bot-side caches built from this model, override in the models which are cached"""
+        pass
+
+    async def after_model_change(self, data: dict, model: Any, is_created: bool, request: Request) -> None:
+        await self.invalidate_cache()
+
+    async def after_model_delete(self, model: Any, request: Request) -> None:
+        await self.invalidate_cache()
+
     async def _process_action(self, request: Request, is_active: bool) -> None:
         pks = request.query_params.get("pks", "").split(",")
         if pks:
@@ -69,6 +79,7 @@ class BaseAdminModel(ModelView):
                             model.is_active = is_active
                     await session.commit()
                 log.info(f"Successfully {'activated' if is_active else 'deactivated'} {len(pks)} {self.name}(s)")
+            await self.invalidate_cache()
 
     @action(
         name="activate",
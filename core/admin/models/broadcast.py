@@ -0,0 +1,53 @@
+# core/admin/models/broadcast.py
+
+from sqladmin import action
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
+
+from core import log
+from .base import BaseAdminModel
+from core.models import BroadcastJob
+from services.broadcast_service import BroadcastJobService
+
+
+class BroadcastJobAdmin(BaseAdminModel, model=BroadcastJob):
+    column_list = [
+        BroadcastJob.id,
+        BroadcastJob.status,
+        BroadcastJob.owner_chat_id,
+        BroadcastJob.total_recipients,
+        BroadcastJob.sent_count,
+        BroadcastJob.failed_count,
+        BroadcastJob.blocked_count,
+        BroadcastJob.retry_count,
+        BroadcastJob.throughput,
+        BroadcastJob.started_at,
+        BroadcastJob.finished_at,
+        BroadcastJob.created_at,
+    ]
+    column_sortable_list = [BroadcastJob.status, BroadcastJob.started_at, BroadcastJob.finished_at, BroadcastJob.created_at]
+    column_filters = [BroadcastJob.status, BroadcastJob.owner_chat_id]
+    column_details_exclude_list = [BroadcastJob.payload]
+    column_default_sort = ("created_at", True)
+
+    can_create = False
+    can_edit = False
+    can_delete = True
+    name = "Broadcast"
+    name_plural = "Broadcasts"
+    category = "Do NOT touch Data"
+    icon = "fas fa-bullhorn"
+
+    @action(
+        name="cancel_broadcast",
+        label="Cancel broadcast",
+        confirmation_message="Stop sending selected %(model)s? Already sent messages stay delivered.",
+        add_in_detail=True,
+        add_in_list=True,
+    )
+    async def cancel_broadcast(self, request: Request) -> RedirectResponse:
+        pks = [pk for pk in request.query_params.get("pks", "").split(",") if pk]
+        for pk in pks:
+            if await BroadcastJobService.cancel_job(pk):
+                log.info(f"{self.name} {pk} cancelled from the admin panel")
+        return RedirectResponse(request.url_for("admin:list", identity=self.identity), status_code=302)
@@ -4,6 +4,8 @@ from wtforms import validators
 
 from core.admin.models.base import BaseAdminModel
 from core.models import Button
+from services.cluster_service import cluster
+from services.button_service import BUTTONS_CACHE
 
 
 class ButtonAdmin(BaseAdminModel, model=Button):
@@ -31,3 +33,6 @@ class ButtonAdmin(BaseAdminModel, model=Button):
     name_plural = "Buttons"
     icon = "fa-solid fa-rectangle-list"
     category = "Important Data"
+
+    async def invalidate_cache(self) -> None:
+        await cluster.invalidate_cache(BUTTONS_CACHE)
@@ -8,6 +8,8 @@ from .base import BaseAdminModel
 from core.models import Media
 from core import log
 from services import main_storage
+from services.cluster_service import cluster
+from services.text_service import TEXTS_CACHE
 
 
 class MediaAdmin(BaseAdminModel, model=Media):
@@ -24,3 +26,6 @@ class MediaAdmin(BaseAdminModel, model=Media):
     icon = "fa-solid fa-image"
 
     category = "Important Data"
+
+    async def invalidate_cache(self) -> None:
+        await cluster.invalidate_cache(TEXTS_CACHE)
@@ -1,12 +1,18 @@
 # core/admin/models/quiz.py
 
 from typing import Type
+from sqladmin import action
 from sqlalchemy import select
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
 from wtforms import Form, TextAreaField, IntegerField
 from wtforms.validators import Optional, DataRequired
 
+from core import log
 from core.admin.models.base import BaseAdminModel
 from core.models import Test, Question, Result
+from services.cluster_service import cluster
+from services.quiz_service import QuizService, TESTS_CACHE
 
 
 class TestAdmin(BaseAdminModel, model=Test):
@@ -59,6 +65,28 @@ class TestAdmin(BaseAdminModel, model=Test):
     name_plural = "Tests"
     icon = "fa-solid fa-clipboard-question"
     category = "Quiz Management"
+
+    async def invalidate_cache(self) -> None:
+        await cluster.invalidate_cache(TESTS_CACHE)
+
+    @action(
+        name="rescore_results",
+        label="Rescore results",
+        confirmation_message="Recalculate saved results of selected %(model)s with the current result thresholds?",
+        add_in_detail=True,
+        add_in_list=True,
+    )
+    async def rescore_results(self, request: Request) -> RedirectResponse:
+        pks = [pk for pk in request.query_params.get("pks", "").split(",") if pk]
+        async with self.session as session:
+            for pk in pks:
+                try:
+                    updated = await QuizService.rescore_quiz_results(pk, session)
+                    log.info(f"Rescored {updated} results of {self.name} {pk}")
+                except Exception as e:
+                    await session.rollback()
+                    log.exception(f"Error rescoring results of {self.name} {pk}: {e}")
+        return RedirectResponse(request.url_for("admin:list", identity=self.identity), status_code=302)
     
     async def scaffold_form(self) -> Type[Form]:
         form_class = await super().scaffold_form()
@@ -112,6 +140,9 @@ class QuestionAdmin(BaseAdminModel, model=Question):
     icon = "fa-solid fa-question"
     category = "Quiz Management"
 
+    async def invalidate_cache(self) -> None:
+        await cluster.invalidate_cache(TESTS_CACHE)
+
     async def scaffold_list_query(self):
         query = select(self.model).order_by(self.model.created_at.desc())
         return query
@@ -134,6 +165,9 @@ class ResultAdmin(BaseAdminModel, model=Result):
     icon = "fa-solid fa-star"
     category = "Quiz Management"
 
+    async def invalidate_cache(self) -> None:
+        await cluster.invalidate_cache(TESTS_CACHE)
+
     async def scaffold_list_query(self):
         query = select(self.model).order_by(self.model.created_at.desc())
         return query
@@ -11,6 +11,8 @@ from core.admin.models.base import BaseAdminModel
 from core.models import Text, Media
 from core import log
 from core.admin import async_sqladmin_db_helper
+from services.cluster_service import cluster
+from services.text_service import TEXTS_CACHE
 
 
 class TextAdmin(BaseAdminModel, model=Text):
@@ -50,6 +52,9 @@ class TextAdmin(BaseAdminModel, model=Text):
         )
         return form_class
 
+    async def invalidate_cache(self) -> None:
+        await cluster.invalidate_cache(TEXTS_CACHE)
+
     def _coerce_media(self, value):
         if hasattr(value, 'id'):
             return str(value.id)
@@ -139,3 +144,5 @@ class TextAdmin(BaseAdminModel, model=Text):
 
         except Exception as e:
             log.error(f"Error in after_model_change for {self.name}: {str(e)}")
+        finally:
+            await self.invalidate_cache()
@@ -2,6 +2,8 @@
 
 from core.admin.models.base import BaseAdminModel
 from core.models import User
+from services.cluster_service import cluster
+from services.user_services import USERS_CACHE
 
 
 class UserAdmin(BaseAdminModel, model=User):
@@ -18,3 +20,6 @@ class UserAdmin(BaseAdminModel, model=User):
     name_plural = "Users"
     category = "Do NOT touch Data"
     icon = "fas fa-user-alt"
+
+    async def invalidate_cache(self) -> None:
+        await cluster.invalidate_cache(USERS_CACHE)
@@ -26,6 +26,9 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 
 POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", 10))
 POSTGRES_MAX_OVERFLOW = int(os.getenv("POSTGRES_MAX_OVERFLOW", 20))
+# Connections budget of the whole app, split between the workers. 0 to use POSTGRES_POOL_SIZE / POSTGRES_MAX_OVERFLOW per worker
+POSTGRES_TOTAL_POOL_SIZE = int(os.getenv("POSTGRES_TOTAL_POOL_SIZE", 0))
+POSTGRES_TOTAL_MAX_OVERFLOW = int(os.getenv("POSTGRES_TOTAL_MAX_OVERFLOW", 0))
 
 POSTGRES_ECHO = os.getenv("POSTGRES_ECHO", "False").lower() in ('true', '1')
 
@@ -34,6 +37,7 @@ ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", ["*"])
 
 # Bot ENV variables
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_API_SERVER_URL = os.getenv("BOT_API_SERVER_URL", "")  # Local Bot API server or a fake one for load tests, empty for api.telegram.org
 
 # SQLAdmin ENV variables
 SQLADMIN_SECRET_KEY = os.getenv("SQLADMIN_SECRET_KEY", "sqladmin_secret_key")
@@ -46,6 +50,60 @@ BASE_SERVER_URL = os.getenv("BASE_SERVER_URL", "https://9a42-184-22-18-75.ngrok-
 
 HTTP_CLIENT_TIMEOUT = int(os.getenv("HTTP_CLIENT_TIMEOUT", "300"))
 HTTP_CLIENTS_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_CLIENTS_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_CLIENTS_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_CLIENTS_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_CLIENTS_MAX_CONCURRENCY_PER_HOST = int(os.getenv("HTTP_CLIENTS_MAX_CONCURRENCY_PER_HOST", "100"))  # In-flight requests, the rest wait in a queue
+HTTP_CLIENTS_HTTP2 = os.getenv("HTTP_CLIENTS_HTTP2", "True").lower() in ('true', '1')  # Needs the h2 package
+
+# Media warm-up ENV variables
+MEDIA_WARMUP_CHAT_ID = int(os.getenv("MEDIA_WARMUP_CHAT_ID", "0"))  # Private service chat the media is uploaded to, 0 to disable
+MEDIA_WARMUP_ON_STARTUP = os.getenv("MEDIA_WARMUP_ON_STARTUP", "True").lower() in ('true', '1')
+MEDIA_WARMUP_CONCURRENCY = int(os.getenv("MEDIA_WARMUP_CONCURRENCY", "4"))
+
+# FSM storage ENV variables
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")  # memory | redis
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+FSM_CODEC = os.getenv("FSM_CODEC", "orjson")  # orjson | msgpack
+FSM_STATE_TTL_SECONDS = int(os.getenv("FSM_STATE_TTL_SECONDS", 60 * 60 * 24 * 7))
+FSM_DATA_TTL_SECONDS = int(os.getenv("FSM_DATA_TTL_SECONDS", 60 * 60 * 24 * 7))
+
+# Broadcast ENV variables
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "20"))
+# Telegram allows ~30 messages per second, the rest of BOT_API_GLOBAL_RATE is left to the handlers.
+# Both rates are per app worker: every worker runs broadcast jobs, N workers send up to N x the rate, divide it by APP_RUN_WORKERS
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "1"))  # ~1 message per second into the same chat
+BROADCAST_CHAT_BURST = int(os.getenv("BROADCAST_CHAT_BURST", "3"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_PROGRESS_INTERVAL_SECONDS = float(os.getenv("BROADCAST_PROGRESS_INTERVAL_SECONDS", "5"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))  # Recipients claimed from the DB at once
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", "120"))  # Job is taken over by another worker after that
+BROADCAST_POLL_INTERVAL_SECONDS = float(os.getenv("BROADCAST_POLL_INTERVAL_SECONDS", "30"))
+
+# Outgoing Bot API requests ENV variables
+BOT_API_GLOBAL_RATE = float(os.getenv("BOT_API_GLOBAL_RATE", "30"))  # Messages per second of one app worker, broadcasts included
+BOT_API_CHAT_RATE = float(os.getenv("BOT_API_CHAT_RATE", "1"))
+BOT_API_CHAT_BURST = int(os.getenv("BOT_API_CHAT_BURST", "5"))  # Handlers often send a few messages in a row
+BOT_API_MAX_RETRIES = int(os.getenv("BOT_API_MAX_RETRIES", "3"))  # On RetryAfter
+BOT_API_RETRY_JITTER_SECONDS = float(os.getenv("BOT_API_RETRY_JITTER_SECONDS", "1"))
+
+# Webhook ENV variables
+WEBHOOK_MAX_PENDING_UPDATES = int(os.getenv("WEBHOOK_MAX_PENDING_UPDATES", "1000"))  # Telegram gets 503 and redelivers when full
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "64"))  # Updates handled concurrently by one app worker
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_SECONDS", "20"))
+WEBHOOK_DROP_PENDING_UPDATES = os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "False").lower() in ('true', '1')  # On webhook (re)registration
+
+# Polling ENV variables (run_polling.py)
+POLLING_LIMIT = int(os.getenv("POLLING_LIMIT", "100"))  # Updates per getUpdates call, Telegram allows up to 100
+POLLING_TIMEOUT_SECONDS = int(os.getenv("POLLING_TIMEOUT_SECONDS", "30"))  # Long polling timeout
+POLLING_RETRY_DELAY_SECONDS = float(os.getenv("POLLING_RETRY_DELAY_SECONDS", "1"))
+
+# Cache ENV variables
+CONTENT_CACHE_TTL_SECONDS = int(os.getenv("CONTENT_CACHE_TTL_SECONDS", "600"))
+CONTENT_CACHE_MAX_SIZE = int(os.getenv("CONTENT_CACHE_MAX_SIZE", "512"))
+USERS_CACHE_TTL_SECONDS = int(os.getenv("USERS_CACHE_TTL_SECONDS", "300"))
+USERS_CACHE_MAX_SIZE = int(os.getenv("USERS_CACHE_MAX_SIZE", "10000"))
+RENDERS_CACHE_TTL_SECONDS = int(os.getenv("RENDERS_CACHE_TTL_SECONDS", "3600"))
+RENDERS_CACHE_MAX_SIZE = int(os.getenv("RENDERS_CACHE_MAX_SIZE", "50000"))  # Bot messages with a known content
 
 
 class RunConfig(BaseModel):
@@ -61,6 +119,8 @@ class DBConfig(BaseModel):
     url: PostgresDsn = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_ADDRESS}:5432/{POSTGRES_DB}"
     pool_size: int = POSTGRES_POOL_SIZE
     max_overflow: int = POSTGRES_MAX_OVERFLOW
+    total_pool_size: int = POSTGRES_TOTAL_POOL_SIZE
+    total_max_overflow: int = POSTGRES_TOTAL_MAX_OVERFLOW
     echo: bool = POSTGRES_ECHO
 
     naming_convention: dict[str, str] = {
@@ -77,6 +137,23 @@ class DBConfig(BaseModel):
             raise ValueError("Must be a positive integer")
         return v
 
+    @field_validator('total_pool_size', 'total_max_overflow')
+    def validate_non_negative_int(cls, v):
+        if v < 0:
+            raise ValueError("Must be a non-negative integer")
+        return v
+
+    def get_worker_pool(self, workers: int) -> tuple[int, int]:
+        """
+        Pool size and max overflow of one worker, every app worker has its own engine.
+        The cluster connection (services/cluster_service.py) is opened outside the pool, one more per worker.
+
+        :return: The total budgets divided between the workers if set, the per worker values otherwise
+        """
+        pool_size = max(1, self.total_pool_size // workers) if self.total_pool_size else self.pool_size
+        max_overflow = self.total_max_overflow // workers if self.total_max_overflow else self.max_overflow
+        return pool_size, max_overflow
+
 
 class CORSConfig(BaseModel):
     allowed_origins: list = ALLOWED_ORIGINS
@@ -84,10 +161,7 @@ class CORSConfig(BaseModel):
 
 class BotConfig(BaseModel):
     token: str = BOT_TOKEN
-    
-    # TODO: Move to conf vars
-    # max_users_cached_time_seconds: int = 300
-    # max_users_cached: int = 1000 
+    api_server_url: str = BOT_API_SERVER_URL
 
 
 class SQLAdminConfig(BaseModel):
@@ -102,6 +176,11 @@ class MediaConfig(BaseModel):
     base_url: str = BASE_SERVER_URL  # TODO: Move to main configurations
     allowed_image_extensions: list[str] = list(MEDIA_FILES_ALLOWED_EXTENSIONS)
 
+    @property
+    def directory(self) -> str:
+        """Directory of the media on the disk, root is also the URL path of the media under BASE_SERVER_URL"""
+        return os.path.normpath(self.root.removeprefix("app/"))
+
     @field_validator('allowed_image_extensions')
     def validate_extensions(cls, v):
         if not all(ext.startswith('.') for ext in v):
@@ -109,9 +188,86 @@ class MediaConfig(BaseModel):
         return v
 
 
+class MediaWarmupConfig(BaseModel):
+    chat_id: int = MEDIA_WARMUP_CHAT_ID
+    on_startup: bool = MEDIA_WARMUP_ON_STARTUP
+    concurrency: int = MEDIA_WARMUP_CONCURRENCY
+
+    @field_validator('concurrency')
+    def validate_positive_int(cls, v):
+        if v <= 0:
+            raise ValueError("Must be a positive integer")
+        return v
+
+
 class HTTPClientConfig(BaseModel):
     timeout: int = HTTP_CLIENT_TIMEOUT
     max_keepalive_connections: int = HTTP_CLIENTS_MAX_KEEPALIVE_CONNECTIONS
+    max_connections_per_host: int = HTTP_CLIENTS_MAX_CONNECTIONS_PER_HOST
+    max_concurrency_per_host: int = HTTP_CLIENTS_MAX_CONCURRENCY_PER_HOST
+    http2: bool = HTTP_CLIENTS_HTTP2
+
+    @field_validator('timeout', 'max_keepalive_connections', 'max_connections_per_host', 'max_concurrency_per_host')
+    def validate_positive_int(cls, v):
+        if v <= 0:
+            raise ValueError("Must be a positive integer")
+        return v
+
+
+class FSMStorageConfig(BaseModel):
+    storage: str = FSM_STORAGE
+    redis_url: str = FSM_REDIS_URL
+    codec: str = FSM_CODEC
+    key_prefix: str = "fsm"
+    state_ttl_seconds: int = FSM_STATE_TTL_SECONDS
+    data_ttl_seconds: int = FSM_DATA_TTL_SECONDS
+
+    @field_validator('storage')
+    def validate_storage(cls, v):
+        if v not in ("memory", "redis"):
+            raise ValueError("FSM storage must be 'memory' or 'redis'")
+        return v
+
+    @field_validator('codec')
+    def validate_codec(cls, v):
+        if v not in ("orjson", "msgpack"):
+            raise ValueError("FSM codec must be 'orjson' or 'msgpack'")
+        return v
+
+
+class BroadcastConfig(BaseModel):
+    workers: int = BROADCAST_WORKERS
+    global_rate: float = BROADCAST_GLOBAL_RATE
+    chat_rate: float = BROADCAST_CHAT_RATE
+    chat_burst: int = BROADCAST_CHAT_BURST
+    max_retries: int = BROADCAST_MAX_RETRIES
+    progress_interval_seconds: float = BROADCAST_PROGRESS_INTERVAL_SECONDS
+    batch_size: int = BROADCAST_BATCH_SIZE
+    lease_seconds: int = BROADCAST_LEASE_SECONDS
+    poll_interval_seconds: float = BROADCAST_POLL_INTERVAL_SECONDS
+
+    @field_validator('workers', 'global_rate', 'chat_rate', 'chat_burst', 'progress_interval_seconds',
+                     'batch_size', 'lease_seconds', 'poll_interval_seconds')
+    def validate_positive(cls, v):
+        if v <= 0:
+            raise ValueError("Must be a positive number")
+        return v
+
+
+class CacheConfig(BaseModel):
+    content_ttl_seconds: int = CONTENT_CACHE_TTL_SECONDS
+    content_max_size: int = CONTENT_CACHE_MAX_SIZE
+    users_ttl_seconds: int = USERS_CACHE_TTL_SECONDS
+    users_max_size: int = USERS_CACHE_MAX_SIZE
+    renders_ttl_seconds: int = RENDERS_CACHE_TTL_SECONDS
+    renders_max_size: int = RENDERS_CACHE_MAX_SIZE
+
+    @field_validator('content_ttl_seconds', 'content_max_size', 'users_ttl_seconds', 'users_max_size',
+                     'renders_ttl_seconds', 'renders_max_size')
+    def validate_positive_int(cls, v):
+        if v <= 0:
+            raise ValueError("Must be a positive integer")
+        return v
 
 
 class BotAdminTexts(BaseModel):
@@ -147,6 +303,14 @@ class BotAdminTexts(BaseModel):
     no_admin_rules: str = "У вас нет прав для выполнения этой команды."
     error_message: str = "Something went wrong. Please try again later or contact the developer."
     confirming_words: list[str] = ["да", "yes", "конечно", "отправить", "send", "accept", "absolutely", "lf"]
+    broadcast_started: str = "Рассылка запущена, получателей:"
+    broadcast_already_running: str = "Рассылка уже выполняется, дождитесь ее завершения."
+    broadcast_queued: str = "Рассылка поставлена в очередь, прогресс будет обновляться в этом сообщении."
+    broadcast_progress: str = "Отправка сообщений..."
+    broadcast_progress_sent: str = "✅ Отправлено:"
+    broadcast_progress_failed: str = "❌ Ошибки:"
+    broadcast_progress_blocked: str = "🚫 Заблокировали бота:"
+    broadcast_progress_speed: str = "Скорость, пользователей/сек:"
 
 
 class BotMainPageTexts(BaseModel):
@@ -161,8 +325,57 @@ class UniversalPageTexts(BaseModel):
     universal_page_try_again: str = "An error occurred. Please try starting over."
 
 
+class BotAPILimitsConfig(BaseModel):
+    global_rate: float = BOT_API_GLOBAL_RATE
+    chat_rate: float = BOT_API_CHAT_RATE
+    chat_burst: int = BOT_API_CHAT_BURST
+    max_retries: int = BOT_API_MAX_RETRIES
+    retry_jitter_seconds: float = BOT_API_RETRY_JITTER_SECONDS
+
+    @field_validator('global_rate', 'chat_rate', 'chat_burst')
+    def validate_positive(cls, v):
+        if v <= 0:
+            raise ValueError("Must be a positive number")
+        return v
+
+    @field_validator('max_retries', 'retry_jitter_seconds')
+    def validate_non_negative(cls, v):
+        if v < 0:
+            raise ValueError("Must be a non-negative number")
+        return v
+
+
 class WebhookConfig(BaseModel):
     path: str = "/webhook/bot/"
+    max_pending_updates: int = WEBHOOK_MAX_PENDING_UPDATES
+    workers: int = WEBHOOK_WORKERS
+    drain_timeout_seconds: float = WEBHOOK_DRAIN_TIMEOUT_SECONDS
+    drop_pending_updates: bool = WEBHOOK_DROP_PENDING_UPDATES
+    allowed_updates: list[str] = ["message", "callback_query"]
+
+    @field_validator('max_pending_updates', 'workers', 'drain_timeout_seconds')
+    def validate_positive(cls, v):
+        if v <= 0:
+            raise ValueError("Must be a positive number")
+        return v
+
+
+class PollingConfig(BaseModel):
+    limit: int = POLLING_LIMIT
+    timeout_seconds: int = POLLING_TIMEOUT_SECONDS
+    retry_delay_seconds: float = POLLING_RETRY_DELAY_SECONDS
+
+    @field_validator('limit')
+    def validate_limit(cls, v):
+        if not 1 <= v <= 100:
+            raise ValueError("Must be between 1 and 100")
+        return v
+
+    @field_validator('timeout_seconds', 'retry_delay_seconds')
+    def validate_non_negative(cls, v):
+        if v < 0:
+            raise ValueError("Must be a non-negative number")
+        return v
 
 
 class BotReaderTexts(BaseModel):
@@ -196,6 +409,7 @@ class AIChatConfig(BaseSettings):
 #     quiz_continue_button: str = "Continue"
 #     question_comment_header: str = "Comment on the question:"
 #     quiz_result_error_undefined: str = "Unable to determine the result."
+#     quiz_changed_error: str = "The test has been changed, please start it again."
 #     quiz_result: str =  "Test completed!\n\nYour score: "    
 #     quiz_multi_result: str = "Test completed!\n\nYour scores: " 
 
@@ -216,6 +430,7 @@ class QuizTexts(BaseModel):
     quiz_continue_button: str = "Продолжить"
     question_comment_header: str = "Комментарий к вопросу:"
     quiz_result_error_undefined: str = "Произошла ошибка при определении результата. Сообщите об этом @Johnny_Taake."
+    quiz_changed_error: str = "Тест был изменен, пожалуйста, начните его заново."
     quiz_result: str =  "Тест завершен!\n\nВаш результат: "    
     quiz_multi_result: str = "Тест завершен!\n\nВаш результат: " 
 
@@ -507,10 +722,16 @@ class Settings(BaseSettings):
     bot: BotConfig = BotConfig()
     admin_panel: SQLAdminConfig = SQLAdminConfig()
     media: MediaConfig = MediaConfig()
+    media_warmup: MediaWarmupConfig = MediaWarmupConfig()
     bot_admin_text: BotAdminTexts = BotAdminTexts()
     bot_main_page_text: BotMainPageTexts = BotMainPageTexts()
     http_client: HTTPClientConfig = HTTPClientConfig()
+    cache: CacheConfig = CacheConfig()
+    broadcast: BroadcastConfig = BroadcastConfig()
+    fsm: FSMStorageConfig = FSMStorageConfig()
+    bot_api: BotAPILimitsConfig = BotAPILimitsConfig()
     webhook: WebhookConfig = WebhookConfig()
+    polling: PollingConfig = PollingConfig()
     bot_reader_text: BotReaderTexts = BotReaderTexts()
     ai_chat: AIChatConfig = AIChatConfig()
     universal_page_text: UniversalPageTexts = UniversalPageTexts()
@@ -8,6 +8,7 @@ __all__ = [
     "Promocode",
     "PromoRegistration",
     "client_manager",
+    "create_fsm_storage",
     "AIProvider",
     "Test",
     "Question",
@@ -15,6 +16,9 @@ __all__ = [
     "QuizResult",
     "SentTest",
     "PsycoTestsAITranscription",
+    "BroadcastJob",
+    "BroadcastRecipient",
+    "TelegramFile",
 ]
 
 
@@ -29,6 +33,7 @@ from .button import Button
 from .promocode import Promocode, PromoRegistration
 
 from .http_client import client_manager
+from .fsm_storage import create_fsm_storage
 
 from .ai_provider import AIProvider
 
@@ -38,3 +43,7 @@ from .quiz_result import QuizResult
 from .sent_test import SentTest
 
 from .psycho_tests_ai_trascription import PsycoTestsAITranscription
+
+from .broadcast import BroadcastJob, BroadcastRecipient
+
+from .telegram_file import TelegramFile
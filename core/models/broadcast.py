@@ -0,0 +1,77 @@
+# core/models/broadcast.py
+
+import enum
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, Enum, Float, ForeignKey, Integer, JSON, String, Text, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class BroadcastStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+
+class RecipientStatus(enum.Enum):
+    PENDING = "pending"  # Claimed by a runner, the result is not written yet
+    SENT = "sent"
+    FAILED = "failed"
+    BLOCKED = "blocked"  # The user blocked the bot or deleted the account
+    INTERRUPTED = "interrupted"  # The runner died while sending, never retried so nobody gets the message twice
+
+
+class BroadcastJob(Base):
+    """
+    Broadcast to all users persisted in the DB, sent by the background runner in batches.
+    Users are walked by the keyset cursor over users.id, the job is owned by one runner at a time with a lease.
+    """
+    owner_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)  # Admin who started the broadcast
+    status_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)  # Progress message in the admin chat
+
+    payload: Mapped[list] = mapped_column(JSON, nullable=False)
+    status: Mapped[BroadcastStatus] = mapped_column(Enum(BroadcastStatus), default=BroadcastStatus.PENDING, nullable=False)
+
+    cursor_user_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)  # Last processed users.id
+
+    total_recipients: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    sent_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    failed_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    blocked_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    retry_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    throughput: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # Recipients per second
+
+    lease_owner: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    def __str__(self):
+        return f"Broadcast {self.id} ({self.status.value})"
+
+
+class BroadcastRecipient(Base):
+    """
+    Delivery record of the broadcast for one chat.
+    The row is inserted before sending and the unique key makes sure the chat is claimed only once per job.
+    """
+    job_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("broadcast_jobs.id", ondelete="CASCADE"), type_=UUID(as_uuid=True), nullable=False)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status: Mapped[RecipientStatus] = mapped_column(Enum(RecipientStatus), default=RecipientStatus.PENDING, nullable=False)
+    error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("job_id", "chat_id"),
+    )
+
+    def __str__(self):
+        return f"{self.chat_id} ({self.status.value})"
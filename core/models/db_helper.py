@@ -1,14 +1,107 @@
 # core/models/db_helper.py
 
+import asyncio
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 
 from sqlalchemy.ext.asyncio import (
     create_async_engine, AsyncEngine,
-    async_sessionmaker, AsyncSession
+    async_sessionmaker, AsyncSession, AsyncSessionTransaction
 )
 from core import log, settings
 
 
+class SharedSession(AsyncSession):
+    """
+    Session shared by all the handlers and services of one update.
+    The services work in a savepoint, their commit() releases it and starts the next one, their rollback() rolls
+    back to it, so a failing helper only undoes the writes made since the last commit() and not the whole update.
+    They keep closing the session in their finally blocks, so close() is a no-op, only the scope owner really
+    commits and closes it.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._savepoint: AsyncSessionTransaction | None = None
+
+    async def ensure_savepoint(self) -> None:
+        if self._savepoint is None:
+            self._savepoint = await self.begin_nested()
+
+    async def _finish_savepoint(self, commit: bool) -> None:
+        savepoint = self._savepoint
+        if savepoint is None:
+            return
+        # Unless it was closed together with the outer transaction
+        if savepoint.sync_transaction is self.sync_session.get_nested_transaction():
+            if commit and savepoint.is_active:
+                await savepoint.commit()
+            else:
+                # A failed flush deactivates the savepoint, it can only be rolled back
+                await savepoint.rollback()
+        self._savepoint = None
+
+    async def commit(self) -> None:
+        await self._finish_savepoint(commit=True)
+        await self.ensure_savepoint()
+
+    async def rollback(self) -> None:
+        await self._finish_savepoint(commit=False)
+        await self.ensure_savepoint()
+
+    async def close(self) -> None:
+        pass
+
+    async def commit_scope(self) -> None:
+        await self._finish_savepoint(commit=True)
+        await super().commit()
+
+    async def rollback_scope(self) -> None:
+        self._savepoint = None
+        await super().rollback()
+
+    async def close_scope(self) -> None:
+        await super().close()
+
+
+class SessionScope:
+    """
+    One lazily opened session per update, committed or rolled back once at the end.
+    It belongs to the task which opened it, the tasks spawned while the update is handled inherit the context
+    but get sessions of their own, one AsyncSession can't be used concurrently.
+    """
+    def __init__(self, session_factory: async_sessionmaker[SharedSession]):
+        self._session_factory = session_factory
+        self._session: SharedSession | None = None
+        self.owner = asyncio.current_task()
+        self.finished = False
+
+    def is_available(self) -> bool:
+        return not self.finished and asyncio.current_task() is self.owner
+
+    def get_session(self) -> SharedSession:
+        if self._session is None:
+            self._session = self._session_factory()
+        return self._session
+
+    async def finish(self, commit: bool) -> None:
+        self.finished = True
+        if self._session is None:
+            return
+        try:
+            if commit and self._session.in_transaction():
+                await self._session.commit_scope()
+            else:
+                await self._session.rollback_scope()
+        except Exception as e:
+            log.exception(f"Error finishing the update session: {e}")
+            await self._session.rollback_scope()
+        finally:
+            await self._session.close_scope()
+
+
+_session_scope: ContextVar[SessionScope | None] = ContextVar("session_scope", default=None)
+
+
 class DataBaseHelper:
     def __init__(self, url: str, echo: bool, pool_size: int, max_overflow: int):
         self.engine: AsyncEngine = create_async_engine(
@@ -23,32 +116,75 @@ class DataBaseHelper:
             autocommit=False,
             expire_on_commit=False
         )
+        self.shared_session_factory: async_sessionmaker[SharedSession] = async_sessionmaker(
+            bind=self.engine,
+            class_=SharedSession,
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False
+        )
 
     async def dispose(self) -> None:
         log.info("Closing database connection")
         await self.engine.dispose()
 
-    async def session_getter(self) -> AsyncSession:  # type: ignore 
+    @asynccontextmanager
+    async def session_scope(self):
+        """
+        Share one session between everything running inside the block, used per update by DBSessionMiddleware.
+        The session is opened on the first session_getter() / db_session() call only.
+        """
+        scope = SessionScope(self.shared_session_factory)
+        token = _session_scope.set(scope)
+        try:
+            yield scope
+        except BaseException:
+            await scope.finish(commit=False)
+            raise
+        else:
+            await scope.finish(commit=True)
+        finally:
+            _session_scope.reset(token)
+
+    @staticmethod
+    def _scoped_session() -> SharedSession | None:
+        scope = _session_scope.get()
+        if scope is None or not scope.is_available():
+            return None
+        return scope.get_session()
+
+    async def session_getter(self) -> AsyncSession:  # type: ignore
+        shared_session = self._scoped_session()
+        if shared_session is not None:
+            await shared_session.ensure_savepoint()
+            yield shared_session
+            return
+
         async with self.session_factory() as session:
             yield session
 
     @asynccontextmanager
     async def db_session(self) -> AsyncSession: # type: ignore
-        async with self.session_factory() as session:
-            try:
-                yield session
+        shared_session = self._scoped_session()
+        if shared_session is not None:
+            await shared_session.ensure_savepoint()
+        session = shared_session if shared_session is not None else self.session_factory()
+        try:
+            yield session
+
+        except Exception as e:
+            log.exception(e)
+            await session.rollback()
 
-            except Exception as e:
-                log.exception(e)
-                await session.rollback()
+        finally:
+            await session.close()
 
-            finally:
-                await session.close()
 
+pool_size, max_overflow = settings.db.get_worker_pool(settings.run.workers)
 
 db_helper = DataBaseHelper(
     url=settings.db.url,
     echo=settings.db.echo,
-    pool_size=settings.db.pool_size,
-    max_overflow=settings.db.max_overflow,
+    pool_size=pool_size,
+    max_overflow=max_overflow,
 )
@@ -0,0 +1,83 @@
+# core/models/fsm_storage.py
+
+from datetime import datetime
+from typing import Any, Callable, Dict
+from uuid import UUID
+
+import orjson
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+from redis.asyncio import Redis
+
+from core import log, settings
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, (UUID, datetime)):
+        return str(obj)
+    raise TypeError(f"Type is not FSM serializable: {type(obj)}")
+
+
+def _get_codec(name: str) -> tuple[Callable[[Dict[str, Any]], bytes], Callable[[bytes], Dict[str, Any]]]:
+    if name == "msgpack":
+        import msgpack
+
+        return (
+            lambda data: msgpack.packb(data, use_bin_type=True, default=_msgpack_default),
+            lambda raw: msgpack.unpackb(raw, raw=False, strict_map_key=False),
+        )
+    return (
+        lambda data: orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS),
+        orjson.loads,
+    )
+
+
+class CompactRedisStorage(RedisStorage):
+    """
+    RedisStorage with binary serialization of the state data (orjson or msgpack) and TTL on every key.
+    """
+    def __init__(self, *args, codec: str = "orjson", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dumps, self._loads = _get_codec(codec)
+
+    @classmethod
+    def from_url(cls, url: str, codec: str = "orjson", key_prefix: str = "fsm", **kwargs) -> "CompactRedisStorage":
+        redis = Redis.from_url(url)
+        return cls(redis=redis, codec=codec, key_builder=DefaultKeyBuilder(prefix=key_prefix), **kwargs)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        redis_key = self.key_builder.build(key, "data")
+        if not data:
+            await self.redis.delete(redis_key)
+            return
+        await self.redis.set(redis_key, self._dumps(data), ex=self.data_ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        redis_key = self.key_builder.build(key, "data")
+        value = await self.redis.get(redis_key)
+        if value is None:
+            return {}
+        return self._loads(value)
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Create FSM storage configured by settings.fsm.
+
+    Memory storage keeps states inside of the worker process, so it only works with a single worker.
+    Redis storage is shared between workers and survives restarts, any Redis protocol
+    compatible server works (fakeredis is enough for local runs).
+    """
+    if settings.fsm.storage == "memory":
+        if settings.run.workers > 1:
+            log.warning("Memory FSM storage is used with %s workers, states will be split between processes", settings.run.workers)
+        return MemoryStorage()
+
+    return CompactRedisStorage.from_url(
+        settings.fsm.redis_url,
+        codec=settings.fsm.codec,
+        key_prefix=settings.fsm.key_prefix,
+        state_ttl=settings.fsm.state_ttl_seconds,
+        data_ttl=settings.fsm.data_ttl_seconds,
+    )
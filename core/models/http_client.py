@@ -1,48 +1,103 @@
 # core/models/http_client.py
 
 import asyncio
+import importlib.util
 import time
-from typing import List
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict
+
 import httpx
-from asyncio import Lock
 
 from core import log, settings
 
 
-class UberClient:
-    def __init__(self, client: httpx.AsyncClient):
+@dataclass
+class HostClientStats:
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0  # High watermark since the start
+    waiting: int = 0  # Requests queued for a free slot right now
+    wait_seconds_total: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    @property
+    def avg_wait_ms(self) -> float:
+        return self.wait_seconds_total / self.requests * 1000 if self.requests else 0.0
+
+
+class HostClient:
+    """
+    Shared client of one host. The connections are pooled (and multiplexed with HTTP/2) by httpx,
+    the semaphore caps the in-flight requests and queues the rest in FIFO order.
+    """
+    def __init__(self, host: str, client: httpx.AsyncClient, max_concurrency: int):
+        self.host = host
         self.client = client
-        self.is_busy = False
-        self.last_used = time.time()
+        self.stats = HostClientStats()
+        self.last_used = time.monotonic()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[httpx.AsyncClient]:
+        """Wait for a free slot and hold it for one or several requests"""
+        queued_at = time.monotonic()
+        self.stats.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.stats.waiting -= 1
+
+        waited = time.monotonic() - queued_at
+        self.stats.requests += 1
+        self.stats.wait_seconds_total += waited
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+        self.stats.in_flight += 1
+        self.stats.max_in_flight = max(self.stats.max_in_flight, self.stats.in_flight)
+        try:
+            yield self.client
+        except httpx.RequestError:
+            self.stats.errors += 1
+            raise
+        finally:
+            self.stats.in_flight -= 1
+            self.last_used = time.monotonic()
+            self._semaphore.release()
 
-    async def request(self, *args, **kwargs) -> httpx.Response:
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
         """
-        Make an HTTP request using the client.
+        Make an HTTP request using the shared client of the host.
 
-        :param args: Positional arguments for the request
-        :param kwargs: Keyword arguments for the request
+        :param method: HTTP method
+        :param url: Request URL, must belong to the host of the client
+        :param kwargs: Keyword arguments for httpx.AsyncClient.request
         :return: HTTP response
         """
-        try:
-            response = await self.client.request(*args, **kwargs)
-            return response
-        except httpx.RequestError as e:
-            log.error(f"Request error: %s", e)
-            raise
-        # Time client will be marked as used for httpx async client
-        finally:
-            self.last_used = time.time()
+        async with self.slot() as client:
+            try:
+                return await client.request(method, url, **kwargs)
+            except httpx.RequestError as e:
+                log.error("Request error (%s): %s", self.host, e)
+                raise
 
 
 class ClientManager:
+    """One HostClient per scheme://host:port, created on the first request and closed after being idle"""
     def __init__(self, client_timeout=settings.http_client.timeout,
-                 max_keepalive_connections=settings.http_client.max_keepalive_connections):
-        self.clients: List[UberClient] = []
-        self.max_clients = max_keepalive_connections
+                 max_keepalive_connections=settings.http_client.max_keepalive_connections,
+                 max_connections_per_host=settings.http_client.max_connections_per_host,
+                 max_concurrency_per_host=settings.http_client.max_concurrency_per_host,
+                 http2=settings.http_client.http2):
+        self.clients: Dict[str, HostClient] = {}
         self.client_timeout = client_timeout
-        self.limits = httpx.Limits(max_keepalive_connections=max_keepalive_connections,
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.limits = httpx.Limits(max_connections=max_connections_per_host,
+                                   max_keepalive_connections=max_keepalive_connections,
                                    keepalive_expiry=client_timeout)
-        self.lock = Lock()  # For thread-safety
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            log.warning("HTTP/2 is enabled but the h2 package is not installed, using HTTP/1.1")
         self.cleanup_task = None
         self.is_shutting_down = False
 
@@ -52,60 +107,49 @@ class ClientManager:
             self.cleanup_task = asyncio.create_task(self.periodic_cleanup())
 
     async def periodic_cleanup(self) -> None:
-        """Periodically clean up inactive clients."""
+        """Periodically close idle clients and log the stats."""
         while not self.is_shutting_down:
             await asyncio.sleep(60)
+            for host, client in self.clients.items():
+                log.info("HTTP client %s: %s, avg wait %.2f ms", host, client.stats, client.stats.avg_wait_ms)
             await self.cleanup_inactive_clients()
 
     async def cleanup_inactive_clients(self) -> None:
-        """Remove inactive clients from the pool."""
-        async with self.lock:
-            current_time = time.time()
-            self.clients = [client for client in self.clients
-                            if client.is_busy or (current_time - client.last_used < self.client_timeout)]
-            log.info(f"Cleanup completed. %s clients remaining.", len(self.clients))
-
-    async def get_client(self) -> UberClient:
+        """Close the clients which have not been used for the client timeout."""
+        current_time = time.monotonic()
+        idle_hosts = [host for host, client in self.clients.items()
+                      if not client.stats.in_flight and not client.stats.waiting
+                      and current_time - client.last_used >= self.client_timeout]
+        for host in idle_hosts:
+            client = self.clients.pop(host)
+            await client.client.aclose()
+        if idle_hosts:
+            log.info("Closed idle HTTP clients: %s, %s clients remaining.", idle_hosts, len(self.clients))
+
+    def get_client(self, url: str) -> HostClient:
         """
-        Get an available client from the pool. If none available and we haven't reached the limit, create a new one.
+        Get the shared client of the URL host, create it on the first call.
 
-        :return: An available client
+        :param url: Any URL of the host
+        :return: Client of the host
         """
-        async with self.lock:
-            current_time = time.time()
-            # Check for available non-busy clients
-            available_clients = [client for client in self.clients if not client.is_busy]
-            log.info(f"Cleanup completed. %s clients remaining.", len(available_clients))
-
-            if available_clients:
-                client = available_clients[0]
-                # Mark the client as busy
-                client.is_busy = True
-                client.last_used = current_time
-                return client
-
-            # If no available clients and we haven't reached the limit, create a new one
-            if len(self.clients) < self.max_clients:
-                new_client = UberClient(httpx.AsyncClient(
-                    timeout=self.client_timeout,
-                    limits=self.limits
-                ))
-                # Mark the new client as busy
-                new_client.is_busy = True
-                new_client.last_used = current_time
-                self.clients.append(new_client)
-                return new_client
-
-            # If we've reached the limit, wait for an available client
-            log.warning("All clients busy. Waiting for an available client.")
-            await asyncio.sleep(1)
-            return await self.get_client()
-
-    async def release_client(self, client: UberClient):
-        """Release a client, make it not busy anymore."""
-        async with self.lock:
-            if client in self.clients:
-                client.is_busy = False
+        parsed = httpx.URL(url)
+        host = f"{parsed.scheme}://{parsed.netloc.decode('ascii')}"
+        client = self.clients.get(host)
+        if client is None:
+            client = HostClient(
+                host,
+                httpx.AsyncClient(timeout=self.client_timeout, limits=self.limits, http2=self.http2),
+                max_concurrency=self.max_concurrency_per_host,
+            )
+            self.clients[host] = client
+        return client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self.get_client(url).request(method, url, **kwargs)
+
+    def get_stats(self) -> Dict[str, HostClientStats]:
+        return {host: client.stats for host, client in self.clients.items()}
 
     async def dispose_all_clients(self) -> None:
         """Dispose all clients."""
@@ -118,10 +162,9 @@ class ClientManager:
             except asyncio.CancelledError:
                 pass
 
-        async with self.lock:
-            for uber_client in self.clients:
-                await uber_client.client.aclose()
-            self.clients.clear()
+        clients, self.clients = list(self.clients.values()), {}
+        for host_client in clients:
+            await host_client.client.aclose()
         log.info("All clients disposed.")
 
 
@@ -1,6 +1,6 @@
 # core/models/quiz_result.py
 
-from sqlalchemy import ForeignKey, Integer, Boolean, String
+from sqlalchemy import ForeignKey, Integer, Boolean, String, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -25,6 +25,11 @@ class QuizResult(Base):
     user: Mapped["User"] = relationship(back_populates="quiz_results")
     test: Mapped["Test"] = relationship(back_populates="quiz_results")
 
+    __table_args__ = (
+        # Latest result of the user per test and category
+        Index("ix_quiz_results_user_id_test_id_category_id_created_at", "user_id", "test_id", "category_id", text("created_at DESC")),
+    )
+
     def __repr__(self):
         return f"QuizResult(id={self.id}, user_id={self.user_id}, test_id={self.test_id}, score={self.score})"
     
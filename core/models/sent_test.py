@@ -1,6 +1,6 @@
 # core/models/sent_test.py
 
-from sqlalchemy import Column, DateTime, String, BigInteger, Enum
+from sqlalchemy import Column, DateTime, String, BigInteger, Enum, Index
 from sqlalchemy.dialects.postgresql import UUID
 import enum
 
@@ -33,3 +33,24 @@ class SentTest(Base):
 
     result_score = Column(String, nullable=True)  # Should be a number, keep it as a string for now to follow the written code
     result_text = Column(String, nullable=True)
+
+    # Built for the lookups of the send / receive test handlers, pending means SENT or DELIVERED
+    __table_args__ = (
+        Index(
+            "ix_sent_tests_receiver_username_pending",
+            "receiver_username", "sender_username", "created_at",
+            postgresql_where=status.in_([TestStatus.SENT, TestStatus.DELIVERED]),
+        ),
+        Index(
+            "ix_sent_tests_receiver_id_pending",
+            "receiver_id", "sender_username",
+            postgresql_where=status.in_([TestStatus.SENT, TestStatus.DELIVERED]),
+        ),
+        Index("ix_sent_tests_sender_id_receiver_username_updated_at", "sender_id", "receiver_username", "updated_at"),
+        Index("ix_sent_tests_sender_id_test_id_created_at", "sender_id", "test_id", "created_at"),
+        Index(
+            "ix_sent_tests_sender_id_receiver_username_completed",
+            "sender_id", "receiver_username", "test_id", "completed_at",
+            postgresql_where=status == TestStatus.COMPLETED,
+        ),
+    )
@@ -0,0 +1,28 @@
+# core/models/telegram_file.py
+
+from typing import Optional
+
+from sqlalchemy import String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class TelegramFile(Base):
+    """
+    file_id Telegram gave to the local media file (Media.file, Test / Question / Result.picture) on the first send.
+    Keyed by the content hash too, so a file replaced under the same path is uploaded again.
+    The file_id of a photo can't be sent as a video, so the media type is a part of the key.
+    """
+    __table_args__ = (
+        UniqueConstraint('file_path', 'content_hash', 'media_type'),
+    )
+
+    file_path: Mapped[str] = mapped_column(String, nullable=False)  # Relative to the app root, as in the media URL
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)  # sha256 hex
+    media_type: Mapped[str] = mapped_column(String, nullable=False)  # photo | video | animation
+    file_id: Mapped[str] = mapped_column(String, nullable=False)
+    file_unique_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+    def __repr__(self):
+        return f"<TelegramFile(file_path={self.file_path}, media_type={self.media_type})>"
@@ -6,7 +6,7 @@ from aiogram import Router, types
 from aiogram.enums import ChatAction
 from aiogram.utils.chat_action import ChatActionSender
 
-from sqlalchemy import select, func
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core import log
@@ -39,37 +39,23 @@ async def get_ai_transcription(callback_query: types.CallbackQuery):
     async with sender:
         async with db_helper.db_session() as session:
             try:
-                # Subquery to get the latest completed_at for each test_id
-                latest_test_subquery = (
-                    select(
-                        SentTest.test_id, 
-                        func.max(SentTest.completed_at).label('latest_completed_at')
-                    )
-                    .where(
-                        SentTest.sender_id == sender_id, 
-                        SentTest.receiver_username == username,
-                        SentTest.status == TestStatus.COMPLETED
-                    )
-                    .group_by(SentTest.test_id)
-                    .subquery()
-                )
-
-                # Main query to get the latest test for each test_id
+                # The latest completed test for each test_id, DISTINCT ON keeps the first row of every test
                 tests = await session.execute(
                     select(SentTest)
-                    .join(
-                        latest_test_subquery, 
-                        (SentTest.test_id == latest_test_subquery.c.test_id) & 
-                        (SentTest.completed_at == latest_test_subquery.c.latest_completed_at)
-                    )
+                    .distinct(SentTest.test_id)
                     .where(
                         SentTest.sender_id == sender_id, 
                         SentTest.receiver_username == username,
                         SentTest.status == TestStatus.COMPLETED
                     )
-                    .order_by(SentTest.completed_at.desc())
+                    .order_by(SentTest.test_id, SentTest.completed_at.desc().nulls_last())
+                )
+                # Newest first, the rows without completed_at go last like in the query
+                tests = sorted(
+                    tests.scalars().all(),
+                    key=lambda test: (test.completed_at is not None, test.completed_at),
+                    reverse=True,
                 )
-                tests = tests.scalars().all()
 
                 if not tests:
                     await callback_query.message.answer("Пользователь еще не прошел писхологические тесты.")  # TODO: Move to config
@@ -1,15 +1,13 @@
 # handlers/broadcast.py
 
-import asyncio
-
 from aiogram import types, Router
-from aiogram.enums import ContentType
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
 from core import settings, log
-from services.user_services import UserService
+from middlewares import UserContext, IsSuperuser
+from services.broadcast_service import BroadcastJobService, broadcast_runner, compile_broadcast, dump_broadcast, preview_broadcast
 
 
 router = Router()
@@ -21,9 +19,9 @@ class AdminBroadcastStates(StatesGroup):
 
 
 @router.message(Command("broadcast"))
-async def start_broadcast(message: types.Message, state: FSMContext):
+async def start_broadcast(message: types.Message, state: FSMContext, user_context: UserContext):
     try:
-        if not await UserService.is_superuser(int(message.from_user.id)):
+        if not await user_context.is_superuser():
             await message.answer(settings.bot_admin_text.no_admin_rules)
             return
 
@@ -37,7 +35,7 @@ async def start_broadcast(message: types.Message, state: FSMContext):
         await message.answer(settings.bot_admin_text.error_message)
 
 
-@router.message(Command("done"))
+@router.message(Command("done"), IsSuperuser())
 async def process_done_command(message: types.Message, state: FSMContext):
     try:
         data = await state.get_data()
@@ -47,69 +45,12 @@ async def process_done_command(message: types.Message, state: FSMContext):
             await message.answer(settings.bot_admin_text.empty_broadcast)
             return
 
-        await message.answer(settings.bot_admin_text.braodcast_preview)
+        # Compiled once here, the preview and every recipient replay the same plan
+        steps = compile_broadcast([types.Message.model_validate(msg_data['message']) for msg_data in messages])
+        await state.update_data(plan=dump_broadcast(steps))
 
-        grouped_media = []
-        grouped_documents = []
-
-        for msg_data in messages:
-            msg = msg_data['message']
-
-            if msg.content_type in [ContentType.PHOTO, ContentType.VIDEO]:
-                media = types.InputMediaPhoto(media=msg.photo[-1].file_id) if msg.content_type == ContentType.PHOTO else types.InputMediaVideo(media=msg.video.file_id)
-                media.caption = msg.caption
-                grouped_media.append(media)
-
-                if len(grouped_media) == 10:
-                    await message.bot.send_media_group(message.chat.id, grouped_media)
-                    grouped_media = []
-
-            elif msg.content_type == ContentType.DOCUMENT:
-                grouped_documents.append((msg.document.file_id, msg.caption))
-
-                if len(grouped_documents) == 10:
-                    for doc in grouped_documents:
-                        await message.answer_document(doc[0], caption=doc[1], parse_mode='HTML')
-                    grouped_documents = []
-
-            else:
-                # Send any remaining grouped media or documents
-                if grouped_media:
-                    await message.bot.send_media_group(message.chat.id, grouped_media)
-                    grouped_media = []
-                if grouped_documents:
-                    for doc in grouped_documents:
-                        await message.answer_document(doc[0], caption=doc[1], parse_mode='HTML')
-                    grouped_documents = []
-
-                # Send other types of content
-                if msg.content_type == ContentType.TEXT:
-                    await message.answer(msg.text, parse_mode='HTML')
-                elif msg.content_type == ContentType.AUDIO:
-                    await message.answer_audio(msg.audio.file_id, caption=msg.caption, parse_mode='HTML')
-                elif msg.content_type == ContentType.ANIMATION:
-                    await message.answer_animation(msg.animation.file_id, caption=msg.caption, parse_mode='HTML')
-                elif msg.content_type == ContentType.VOICE:
-                    await message.answer_voice(msg.voice.file_id, caption=msg.caption, parse_mode='HTML')
-                elif msg.content_type == ContentType.VIDEO_NOTE:
-                    await message.answer_video_note(msg.video_note.file_id)
-                elif msg.content_type == ContentType.STICKER:
-                    await message.answer_sticker(msg.sticker.file_id)
-                elif msg.content_type == ContentType.LOCATION:
-                    await message.answer_location(msg.location.latitude, msg.location.longitude)
-                elif msg.content_type == ContentType.VENUE:
-                    await message.answer_venue(msg.venue.location.latitude, msg.venue.location.longitude, msg.venue.title, msg.venue.address)
-                elif msg.content_type == ContentType.CONTACT:
-                    await message.answer_contact(msg.contact.phone_number, msg.contact.first_name, msg.contact.last_name)
-                else:
-                    await message.answer(settings.bot_admin_text.unsupported_message_type + f"{msg.content_type}")
-
-        # Send any remaining grouped media or documents
-        if grouped_media:
-            await message.bot.send_media_group(message.chat.id, grouped_media)
-        if grouped_documents:
-            for doc in grouped_documents:
-                await message.answer_document(doc[0], caption=doc[1], parse_mode='HTML')
+        await message.answer(settings.bot_admin_text.braodcast_preview)
+        await preview_broadcast(message.bot, message.chat.id, steps)
 
         await state.set_state(AdminBroadcastStates.WAITING_FOR_CONFIRMATION)
         await message.answer(
@@ -127,7 +68,7 @@ async def process_broadcast_message(message: types.Message, state: FSMContext):
         messages = data.get('messages', [])
 
         messages.append({
-            'message': message,
+            'message': message.model_dump(mode="json", exclude_none=True),  # Keep the state serializable for external FSM storages
         })
 
         await state.update_data(messages=messages)
@@ -139,8 +80,6 @@ async def process_broadcast_message(message: types.Message, state: FSMContext):
 
 @router.message(AdminBroadcastStates.WAITING_FOR_CONFIRMATION)
 async def confirm_broadcast(message: types.Message, state: FSMContext):
-    user_service = UserService()
-
     try:
         if message.text.lower() not in settings.bot_admin_text.confirming_words:
             await message.answer(settings.bot_admin_text.broadcast_cancelled)
@@ -148,92 +87,16 @@ async def confirm_broadcast(message: types.Message, state: FSMContext):
             return
 
         data = await state.get_data()
-        broadcast_messages = data['messages']
-
-        all_users = await user_service.get_all_users()
-        failed_users = []
-        users_counter = 0
-
-        for user in all_users:
-            try:
-                grouped_media = []
-                grouped_documents = []
-
-                for msg_data in broadcast_messages:
-                    msg = msg_data['message']
-
-                    if msg.content_type in [ContentType.PHOTO, ContentType.VIDEO]:
-                        media = types.InputMediaPhoto(media=msg.photo[-1].file_id) if msg.content_type == ContentType.PHOTO else types.InputMediaVideo(media=msg.video.file_id)
-                        media.caption = msg.caption
-                        grouped_media.append(media)
-
-                        if len(grouped_media) == 10:
-                            await message.bot.send_media_group(int(user.chat_id), grouped_media)
-                            grouped_media = []
-
-                    elif msg.content_type == ContentType.DOCUMENT:
-                        grouped_documents.append((msg.document.file_id, msg.caption))
-
-                        if len(grouped_documents) == 10:
-                            for doc in grouped_documents:
-                                await message.bot.send_document(int(user.chat_id), doc[0], caption=doc[1], parse_mode='HTML')
-                            grouped_documents = []
-
-                    else:
-                        # Send any remaining grouped media or documents
-                        if grouped_media:
-                            await message.bot.send_media_group(int(user.chat_id), grouped_media)
-                            grouped_media = []
-                        if grouped_documents:
-                            for doc in grouped_documents:
-                                await message.bot.send_document(int(user.chat_id), doc[0], caption=doc[1], parse_mode='HTML')
-                            grouped_documents = []
-
-                        # Send other types of content
-                        if msg.content_type == ContentType.TEXT:
-                            await message.bot.send_message(int(user.chat_id), msg.text, parse_mode='HTML')
-                        elif msg.content_type == ContentType.AUDIO:
-                            await message.bot.send_audio(int(user.chat_id), msg.audio.file_id, caption=msg.caption, parse_mode='HTML')
-                        elif msg.content_type == ContentType.ANIMATION:
-                            await message.bot.send_animation(int(user.chat_id), msg.animation.file_id, caption=msg.caption, parse_mode='HTML')
-                        elif msg.content_type == ContentType.VOICE:
-                            await message.bot.send_voice(int(user.chat_id), msg.voice.file_id, caption=msg.caption, parse_mode='HTML')
-                        elif msg.content_type == ContentType.VIDEO_NOTE:
-                            await message.bot.send_video_note(int(user.chat_id), msg.video_note.file_id)
-                        elif msg.content_type == ContentType.STICKER:
-                            await message.bot.send_sticker(int(user.chat_id), msg.sticker.file_id)
-                        elif msg.content_type == ContentType.LOCATION:
-                            await message.bot.send_location(int(user.chat_id), msg.location.latitude, msg.location.longitude)
-                        elif msg.content_type == ContentType.VENUE:
-                            await message.bot.send_venue(int(user.chat_id), msg.venue.location.latitude, msg.venue.location.longitude, msg.venue.title, msg.venue.address)
-                        elif msg.content_type == ContentType.CONTACT:
-                            await message.bot.send_contact(int(user.chat_id), msg.contact.phone_number, msg.contact.first_name, msg.contact.last_name)
-                        else:
-                            await message.bot.send_message(int(user.chat_id), settings.bot_admin_text.unsupported_file_type + f" {msg.content_type}.")
-
-                # Send any remaining grouped media or documents
-                if grouped_media:
-                    await message.bot.send_media_group(int(user.chat_id), grouped_media)
-                if grouped_documents:
-                    for doc in grouped_documents:
-                        await message.bot.send_document(int(user.chat_id), doc[0], caption=doc[1], parse_mode='HTML')
-
-                users_counter += 1
-
-                # Sleep to avoid API-flooding/spam block from Telegram
-                await asyncio.sleep(0.05)
-
-            except Exception as e:
-                log.info(f"Failed to send broadcast to user {user.chat_id}: {str(e)}")
-                failed_users.append(user.chat_id)
-                continue
-
-        if failed_users:
-            await message.answer(
-                settings.bot_admin_text.not_all_broadcast_1 + f" {users_counter} " + settings.bot_admin_text.not_all_broadcast_2 + f" {len(failed_users)} " + settings.bot_text.admin_not_all_broadcast_3)
-        else:
-            await message.answer(settings.bot_admin_text.full_success_broadcast + f"{users_counter}")
+        payload = data['plan']
+
+        # The job is persisted and sent by the broadcast runner, so it survives restarts and deploys
+        status_message = await message.answer(settings.bot_admin_text.broadcast_queued)
+        job = await BroadcastJobService.create_job(message.chat.id, payload, status_message_id=status_message.message_id)
+        if not job:
+            await message.answer(settings.bot_admin_text.error_message)
+            return
 
+        broadcast_runner.wake()
         await state.clear()
     except Exception as e:
         log.error(f"Error in confirm_broadcast: {e}")
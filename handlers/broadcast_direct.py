@@ -1,15 +1,15 @@
 # handlers/broadcast_direct.py
 
-import asyncio
-
 from aiogram import types, Router, F
-from aiogram.enums import ContentType
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from core import settings, logger as log
-from services.user_services import UserService
+from core import settings, log
+from middlewares import UserContext
+from services.broadcast_service import (
+    BroadcastEngine, BroadcastService, BroadcastStats, compile_broadcast, dump_broadcast, load_broadcast, preview_broadcast
+)
 
 
 router = Router()
@@ -38,14 +38,18 @@ def get_cancel_keyboard():
 @router.callback_query(F.data == "cancel_broadcast")
 async def cancel_broadcast(callback: types.CallbackQuery, state: FSMContext):
     await state.clear()
+    if BroadcastService.cancel(callback.from_user.id):
+        # The running broadcast reports the final counters itself
+        await callback.answer()
+        return
     await callback.message.edit_text("Рассылка отменена.")
     await callback.answer()
 
 
 @router.message(Command("direct_broadcast"))
-async def start_direct_broadcast(message: types.Message, state: FSMContext):
+async def start_direct_broadcast(message: types.Message, state: FSMContext, user_context: UserContext):
     try:
-        if not await UserService.is_superuser(int(message.from_user.id)):
+        if not await user_context.is_superuser():
             await message.answer(settings.bot_admin_text.no_admin_rules)
             return
 
@@ -71,66 +75,12 @@ async def process_direct_messages_done(message: types.Message, state: FSMContext
             await message.answer("Вы не отправили ни одного сообщения для рассылки.")
             return
 
-        await message.answer("Предпросмотр сообщений для рассылки:")
-
-        grouped_media = []
-        grouped_documents = []
-
-        for msg_data in messages:
-            msg = msg_data['message']
-
-            if msg.content_type in [ContentType.PHOTO, ContentType.VIDEO]:
-                media = types.InputMediaPhoto(media=msg.photo[-1].file_id) if msg.content_type == ContentType.PHOTO else types.InputMediaVideo(media=msg.video.file_id)
-                media.caption = msg.caption
-                grouped_media.append(media)
-
-                if len(grouped_media) == 10:
-                    await message.bot.send_media_group(message.chat.id, grouped_media)
-                    grouped_media = []
+        # Compiled once here, the preview and every recipient replay the same plan
+        steps = compile_broadcast([types.Message.model_validate(msg_data['message']) for msg_data in messages])
+        await state.update_data(plan=dump_broadcast(steps))
 
-            elif msg.content_type == ContentType.DOCUMENT:
-                grouped_documents.append((msg.document.file_id, msg.caption))
-
-                if len(grouped_documents) == 10:
-                    for doc in grouped_documents:
-                        await message.answer_document(doc[0], caption=doc[1], parse_mode='HTML')
-                    grouped_documents = []
-
-            else:
-                if grouped_media:
-                    await message.bot.send_media_group(message.chat.id, grouped_media)
-                    grouped_media = []
-                if grouped_documents:
-                    for doc in grouped_documents:
-                        await message.answer_document(doc[0], caption=doc[1], parse_mode='HTML')
-                    grouped_documents = []
-
-                if msg.content_type == ContentType.TEXT:
-                    await message.answer(msg.text, parse_mode='HTML')
-                elif msg.content_type == ContentType.AUDIO:
-                    await message.answer_audio(msg.audio.file_id, caption=msg.caption, parse_mode='HTML')
-                elif msg.content_type == ContentType.ANIMATION:
-                    await message.answer_animation(msg.animation.file_id, caption=msg.caption, parse_mode='HTML')
-                elif msg.content_type == ContentType.VOICE:
-                    await message.answer_voice(msg.voice.file_id, caption=msg.caption, parse_mode='HTML')
-                elif msg.content_type == ContentType.VIDEO_NOTE:
-                    await message.answer_video_note(msg.video_note.file_id)
-                elif msg.content_type == ContentType.STICKER:
-                    await message.answer_sticker(msg.sticker.file_id)
-                elif msg.content_type == ContentType.LOCATION:
-                    await message.answer_location(msg.location.latitude, msg.location.longitude)
-                elif msg.content_type == ContentType.VENUE:
-                    await message.answer_venue(msg.venue.location.latitude, msg.venue.location.longitude, msg.venue.title, msg.venue.address)
-                elif msg.content_type == ContentType.CONTACT:
-                    await message.answer_contact(msg.contact.phone_number, msg.contact.first_name, msg.contact.last_name)
-                else:
-                    await message.answer(settings.bot_admin_text.unsupported_file_type + f" {msg.content_type}.")
-
-        if grouped_media:
-            await message.bot.send_media_group(message.chat.id, grouped_media)
-        if grouped_documents:
-            for doc in grouped_documents:
-                await message.answer_document(doc[0], caption=doc[1], parse_mode='HTML')
+        await message.answer("Предпросмотр сообщений для рассылки:")
+        await preview_broadcast(message.bot, message.chat.id, steps)
 
         await state.set_state(AdminBroadcastStates.DIRECT_WAITING_FOR_PREVIEW)
         await message.answer(
@@ -168,7 +118,7 @@ async def process_direct_broadcast_message(message: types.Message, state: FSMCon
         messages = data.get('messages', [])
 
         messages.append({
-            'message': message,
+            'message': message.model_dump(mode="json", exclude_none=True),  # Keep the state serializable for external FSM storages
         })
 
         await state.update_data(messages=messages)
@@ -234,116 +184,52 @@ async def confirm_direct_broadcast(message: types.Message, state: FSMContext):
             await state.clear()
             return
 
+        if BroadcastService.is_running(message.chat.id):
+            await message.answer(settings.bot_admin_text.broadcast_already_running)
+            return
+
         data = await state.get_data()
-        broadcast_messages = data['messages']
+        steps = load_broadcast(data['plan'])
         chat_ids = data['chat_ids']
 
-        failed_chats = []
-        success_counter = 0
-
         status_message = await message.answer(
             f"Начинаем рассылку в {len(chat_ids)} чатов...",
             reply_markup=get_cancel_keyboard()
         )
 
-        for chat_id in chat_ids:
-            current_state = await state.get_state()
-            if current_state is None:
+        async def report_progress(stats: BroadcastStats):
+            if not stats.finished:
+                await status_message.edit_text(
+                    f"Отправка сообщений...\n"
+                    f"✅ Отправлено: {stats.sent} из {stats.total}\n"
+                    f"❌ Ошибки: {stats.failed}",
+                    reply_markup=get_cancel_keyboard()
+                )
+            elif stats.cancelled:
                 await status_message.edit_text(
                     f"Рассылка отменена.\n"
-                    f"✅ Успешно отправлено: {success_counter} чатов\n"
-                    f"❌ Не отправлено: {len(chat_ids) - success_counter} чатов"
+                    f"✅ Успешно отправлено: {stats.sent} чатов\n"
+                    f"❌ Не отправлено: {stats.total - stats.sent} чатов"
+                )
+            elif stats.failed:
+                failed_chats = ', '.join(map(str, stats.failed_chat_ids[:100]))
+                if len(stats.failed_chat_ids) > 100:
+                    failed_chats += ", ..."
+                await status_message.edit_text(
+                    f"Рассылка завершена частично.\n"
+                    f"✅ Успешно отправлено: {stats.sent} чатов\n"
+                    f"❌ Ошибки отправки: {stats.failed} чатов\n"
+                    f"ID чатов с ошибками: {failed_chats}"
+                )
+            else:
+                await status_message.edit_text(
+                    f"✅ Рассылка успешно завершена!\n"
+                    f"Отправлено в {stats.sent} чатов"
                 )
-                return
 
-            try:
-                grouped_media = []
-                grouped_documents = []
-
-                for msg_data in broadcast_messages:
-                    msg = msg_data['message']
-
-                    if msg.content_type in [ContentType.PHOTO, ContentType.VIDEO]:
-                        media = types.InputMediaPhoto(media=msg.photo[-1].file_id) if msg.content_type == ContentType.PHOTO else types.InputMediaVideo(media=msg.video.file_id)
-                        media.caption = msg.caption
-                        grouped_media.append(media)
-
-                        if len(grouped_media) == 10:
-                            await message.bot.send_media_group(chat_id, grouped_media)
-                            grouped_media = []
-
-                    elif msg.content_type == ContentType.DOCUMENT:
-                        grouped_documents.append((msg.document.file_id, msg.caption))
-
-                        if len(grouped_documents) == 10:
-                            for doc in grouped_documents:
-                                await message.bot.send_document(chat_id, doc[0], caption=doc[1], parse_mode='HTML')
-                            grouped_documents = []
-
-                    else:
-                        if grouped_media:
-                            await message.bot.send_media_group(chat_id, grouped_media)
-                            grouped_media = []
-                        if grouped_documents:
-                            for doc in grouped_documents:
-                                await message.bot.send_document(chat_id, doc[0], caption=doc[1], parse_mode='HTML')
-                            grouped_documents = []
-
-                        if msg.content_type == ContentType.TEXT:
-                            await message.bot.send_message(chat_id, msg.text, parse_mode='HTML')
-                        elif msg.content_type == ContentType.AUDIO:
-                            await message.bot.send_audio(chat_id, msg.audio.file_id, caption=msg.caption, parse_mode='HTML')
-                        elif msg.content_type == ContentType.ANIMATION:
-                            await message.bot.send_animation(chat_id, msg.animation.file_id, caption=msg.caption, parse_mode='HTML')
-                        elif msg.content_type == ContentType.VOICE:
-                            await message.bot.send_voice(chat_id, msg.voice.file_id, caption=msg.caption, parse_mode='HTML')
-                        elif msg.content_type == ContentType.VIDEO_NOTE:
-                            await message.bot.send_video_note(chat_id, msg.video_note.file_id)
-                        elif msg.content_type == ContentType.STICKER:
-                            await message.bot.send_sticker(chat_id, msg.sticker.file_id)
-                        elif msg.content_type == ContentType.LOCATION:
-                            await message.bot.send_location(chat_id, msg.location.latitude, msg.location.longitude)
-                        elif msg.content_type == ContentType.VENUE:
-                            await message.bot.send_venue(chat_id, msg.venue.location.latitude, msg.venue.location.longitude, msg.venue.title, msg.venue.address)
-                        elif msg.content_type == ContentType.CONTACT:
-                            await message.bot.send_contact(chat_id, msg.contact.phone_number, msg.contact.first_name, msg.contact.last_name)
-                        else:
-                            await message.bot.send_message(chat_id, settings.bot_admin_text.unsupported_file_type + f" {msg.content_type}.")
-
-                if grouped_media:
-                    await message.bot.send_media_group(chat_id, grouped_media)
-                if grouped_documents:
-                    for doc in grouped_documents:
-                        await message.bot.send_document(chat_id, doc[0], caption=doc[1], parse_mode='HTML')
-
-                success_counter += 1
-                if success_counter % 10 == 0:
-                    await status_message.edit_text(
-                        f"Отправка сообщений...\n"
-                        f"✅ Отправлено: {success_counter} из {len(chat_ids)}",
-                        reply_markup=get_cancel_keyboard()
-                    )
-                
-                await asyncio.sleep(0.05)  # Anti-flood delay
-
-            except Exception as e:
-                log.error(f"Failed to send broadcast to chat {chat_id}: {str(e)}")
-                failed_chats.append(chat_id)
-                continue
-
-        # Отправляем итоговый отчет
-        if failed_chats:
-            await status_message.edit_text(
-                f"Рассылка завершена частично.\n"
-                f"✅ Успешно отправлено: {success_counter} чатов\n"
-                f"❌ Ошибки отправки: {len(failed_chats)} чатов\n"
-                f"ID чатов с ошибками: {', '.join(map(str, failed_chats))}"
-            )
-        else:
-            await status_message.edit_text(
-                f"✅ Рассылка успешно завершена!\n"
-                f"Отправлено в {success_counter} чатов"
-            )
+        # The broadcast runs in the background, it can be stopped with the cancel button
+        engine = BroadcastEngine(message.bot, steps, chat_ids, on_progress=report_progress)
+        BroadcastService.start(message.chat.id, engine)
 
         await state.clear()
 
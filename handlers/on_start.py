@@ -33,18 +33,10 @@ async def get_start_content(chat_id: int, username: str | None):
     button_service = ButtonService()
     async for session in db_helper.session_getter():
         try:
-            user = await user_service.get_user(chat_id)
-            is_new_user = False
+            # Served from the cache, or a single upsert which also keeps the username up to date
+            user, is_new_user = await user_service.get_or_create_user(chat_id, username)
             if not user:
-                user = await user_service.create_user(chat_id, username)
-                log.info("Created new user: %s, username: %s", user.chat_id, user.username)
-                is_new_user = True
-            elif user.username != username:
-                updated = await user_service.update_username(chat_id, username)
-                if updated:
-                    log.info("Updated username for user %s to %s", chat_id, username)
-                else:
-                    log.warning("Failed to update username for user %s", chat_id)
+                return settings.bot_main_page_text.user_error_message, None, None, False
 
             context_marker = "first_greeting" if is_new_user or user.is_new_user else "welcome_message"
             content = await text_service.get_text_with_media(context_marker, session)
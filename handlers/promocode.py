@@ -108,7 +108,8 @@ async def get_promo_command(callback_query: types.CallbackQuery):
                 )
                 
                 if keyboard:
-                    keyboard.inline_keyboard.append([btn])
+                    # Keyboards from the ButtonService are shared, build a new one
+                    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard.inline_keyboard + [[btn]])
                 else:
                     keyboard = InlineKeyboardMarkup(inline_keyboard=[[btn]])
                     
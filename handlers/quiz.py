@@ -4,14 +4,13 @@ from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy import func, select
-import random
-from collections import defaultdict
 
-from core.models import Test, Question, QuizResult, User, Result
+from core.models import Test, QuizResult, User
 from core.models import db_helper
 from core import log, settings
 from services.text_service import TextService
 from services.button_service import ButtonService
+from services.quiz_service import QuizService, QuestionInfo
 from .utils import send_or_edit_message
 
 
@@ -126,8 +125,7 @@ async def start_quiz(callback_query: types.CallbackQuery, state: FSMContext):
     
     async for session in db_helper.session_getter():
         try:
-            test = await session.execute(select(Test).where(Test.id == quiz_id))
-            test = test.scalar_one_or_none()
+            test = await QuizService.get_test_snapshot(quiz_id, session)
             
             if not test:
                 await callback_query.answer(settings.quiz_text.quiz_not_found)
@@ -167,8 +165,6 @@ async def start_quiz(callback_query: types.CallbackQuery, state: FSMContext):
 
             text_service = TextService()
             media_url = test.picture if test.picture else await text_service.get_default_media(session)
-            if media_url and not media_url.startswith(('http://', 'https://')):
-                media_url = f"{settings.media.base_url}/app/{media_url}"
 
             log.info("Generated media URL: %s", media_url)
 
@@ -199,40 +195,6 @@ async def start_quiz(callback_query: types.CallbackQuery, state: FSMContext):
             await session.close()
 
 
-async def get_sorted_questions(session, test_id):
-    """Get questions sorted by order and category."""
-    questions = await session.execute(
-        Question.active()
-        .where(Question.test_id == test_id)
-        .order_by(Question.order)
-    )
-    questions = questions.scalars().all()
-    
-    # Group questions by order
-    questions_by_order = defaultdict(list)
-    for question in questions:
-        # Create a copy of the question with its data
-        question_data = {
-            'question': question,
-            'intro_text': question.intro_text,
-            'comment': question.comment,
-            'picture': question.picture,
-            'order': question.order
-        }
-        questions_by_order[question.order].append(question_data)
-    
-    # Create final sorted list with randomization for same order
-    sorted_questions = []
-    for order in sorted(questions_by_order.keys()):
-        order_questions = questions_by_order[order]
-        if len(order_questions) > 1:
-            # Randomly shuffle questions with the same order
-            random.shuffle(order_questions)
-        sorted_questions.extend(order_questions)
-    
-    return sorted_questions
-
-
 # @router.callback_query(QuizStates.VIEWING_INTRO)
 async def process_intro(callback_query: types.CallbackQuery, state: FSMContext, state_group: StatesGroup):
     if callback_query.data == "show_question":
@@ -248,15 +210,19 @@ async def confirm_start_quiz(callback_query: types.CallbackQuery, state: FSMCont
         quiz_id = callback_query.data.split("_")[-1]
     async for session in db_helper.session_getter():
         try:
-            # Get and save the order of questions at start
-            sorted_questions = await get_sorted_questions(session, quiz_id)
+            # Get and save the order of questions at start, questions themselves are taken from the test snapshot
+            snapshot = await QuizService.get_test_snapshot(quiz_id, session)
+            if not snapshot:
+                await callback_query.answer(settings.quiz_text.quiz_not_found)
+                return
+            question_ids = QuizService.get_shuffled_question_ids(snapshot)
             await state.update_data(
                 quiz_id=quiz_id, 
                 current_question=0, 
                 answers=[], 
                 category_scores={}, 
                 intro_shown=False,
-                sorted_questions=sorted_questions  # Save the order
+                question_ids=question_ids  # Save the order
             )
             await send_question(callback_query.message, state, state_group)
         except Exception as e:
@@ -276,39 +242,39 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
     data = await state.get_data()
     quiz_id = data['quiz_id']
     current_question = data['current_question']
-    sorted_questions = data['sorted_questions']
+    question_ids = data['question_ids']
 
     async for session in db_helper.session_getter():
         try:
-            test = await session.execute(select(Test).where(Test.id == quiz_id))
-            test = test.scalar_one_or_none()
+            test = await QuizService.get_test_snapshot(quiz_id, session)
 
-            if current_question >= len(sorted_questions):
+            if current_question >= len(question_ids):
                 await finish_quiz(message, state)
                 return
 
-            question_data = sorted_questions[current_question]
-            question = question_data['question']  # Get the question object
+            question = test.questions_by_id.get(question_ids[current_question]) if test else None
+            if not question:
+                log.warning("Question %s of test %s is not available anymore", question_ids[current_question], quiz_id)
+                await message.answer(settings.quiz_text.quiz_changed_error)
+                await state.clear()
+                return
 
             # Check if there is an intro text for the current question
-            if question_data['intro_text'] and not data.get('intro_shown'):
+            if question.intro_text and not data.get('intro_shown'):
                 keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
                     [types.InlineKeyboardButton(text=settings.quiz_text.quiz_continue_button, callback_data="show_question")]
                 ])
                 
                 text_service = TextService()
                 # Media priority
-                if question_data['picture']:
-                    media_url = question_data['picture']
+                if question.picture:
+                    media_url = question.picture
                 elif test.picture:
                     media_url = test.picture
                 else:
                     media_url = await text_service.get_default_media(session)
                 
-                if media_url and not media_url.startswith(('http://', 'https://')):
-                    media_url = f"{settings.media.base_url}/app/{media_url}"
-                
-                intro_text = question_data['intro_text'].replace('\\n', '\n')
+                intro_text = question.intro_text.replace('\\n', '\n')
                 
                 await send_or_edit_message(
                     message,
@@ -324,8 +290,7 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
 
             # If there is no intro or it has already been shown, show the question
             keyboard = []
-            for i in range(1, 7):
-                answer_text = getattr(question, f'answer{i}_text')  # Use the question object to get the answers
+            for i, (answer_text, _) in enumerate(question.answers, start=1):
                 if answer_text:
                     keyboard.append([types.InlineKeyboardButton(
                         text=answer_text,
@@ -339,19 +304,16 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
 
             text_service = TextService()
             
-            if question_data['picture']:
-                media_url = question_data['picture']
+            if question.picture:
+                media_url = question.picture
             elif test.picture:
                 media_url = test.picture
             else:
                 media_url = await text_service.get_default_media(session)
-                
-            if media_url and not media_url.startswith(('http://', 'https://')):
-                media_url = f"{settings.media.base_url}/app/{media_url}"
 
             log.info("Generated media URL for question: %s", media_url) 
 
-            question_text = settings.quiz_text.question_text_begging_1 + f"{current_question + 1}" + settings.quiz_text.question_text_begging_2 + f"{len(sorted_questions)}:\n\n{question.question_text.replace('\\n', '\n')}"
+            question_text = settings.quiz_text.question_text_begging_1 + f"{current_question + 1}" + settings.quiz_text.question_text_begging_2 + f"{len(question_ids)}:\n\n{question.question_text.replace('\\n', '\n')}"
 
             await send_or_edit_message(
                 message,
@@ -373,7 +335,6 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
 # @router.callback_query(QuizStates.ANSWERING)
 async def process_answer(callback_query: types.CallbackQuery, state: FSMContext, state_group: StatesGroup):
     data = await state.get_data()
-    sorted_questions = data['sorted_questions']
     
     if callback_query.data == "quiz_back":
         if data['current_question'] > 0:
@@ -382,9 +343,10 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
                 last_answer = data['answers'].pop()
                 # Remove from category scores if needed
                 if data.get('category_scores'):  # Check if there is a dictionary
-                    data['category_scores'][last_answer] = data['category_scores'].get(last_answer, 1) - 1
-                    if data['category_scores'][last_answer] <= 0:
-                        del data['category_scores'][last_answer]
+                    category_key = str(last_answer)  # Keys are strings to survive the FSM storage serialization
+                    data['category_scores'][category_key] = data['category_scores'].get(category_key, 1) - 1
+                    if data['category_scores'][category_key] <= 0:
+                        del data['category_scores'][category_key]
             await state.update_data(data)
             await send_question(callback_query.message, state, state_group)
         return
@@ -393,13 +355,15 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
     
     async for session in db_helper.session_getter():
         try:
-            question_data = sorted_questions[question_num]
-            question = question_data['question']  # Get the question object
-            
-            test = await session.execute(select(Test).where(Test.id == data['quiz_id']))
-            test = test.scalar_one()
+            test = await QuizService.get_test_snapshot(data['quiz_id'], session)
+            question = test.questions_by_id.get(data['question_ids'][question_num]) if test else None
+            if not question:
+                log.warning("Question %s of test %s is not available anymore", data['question_ids'][question_num], data['quiz_id'])
+                await callback_query.message.answer(settings.quiz_text.quiz_changed_error)
+                await state.clear()
+                return
             
-            score = getattr(question, f'answer{answer_num}_score')
+            score = question.answer_score(answer_num)
             data['answers'].append(score)
             
             # Update category scores if this is a multi-graph test
@@ -407,12 +371,12 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
                 if 'category_scores' not in data:
                     data['category_scores'] = {}
                 # Use score as an identifier of the category and count the number of answers
-                data['category_scores'][score] = data['category_scores'].get(score, 0) + 1
+                data['category_scores'][str(score)] = data['category_scores'].get(str(score), 0) + 1
             
             await state.update_data(data)
             
-            if question_data['comment']:
-                await show_comment(callback_query.message, question_data['comment'], state, state_group)
+            if question.comment:
+                await show_comment(callback_query.message, question, state, state_group)
             else:
                 data['current_question'] += 1
                 await state.update_data(data)
@@ -424,7 +388,7 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
             await session.close()
 
 
-async def show_comment(message: types.Message, comment: str, state: FSMContext, state_group: StatesGroup):
+async def show_comment(message: types.Message, question: QuestionInfo, state: FSMContext, state_group: StatesGroup):
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
         [types.InlineKeyboardButton(text=settings.quiz_text.quiz_continue_button, callback_data="continue_quiz")]
     ])
@@ -432,28 +396,19 @@ async def show_comment(message: types.Message, comment: str, state: FSMContext,
     data = await state.get_data()
     async for session in db_helper.session_getter():
         try:
-            questions = await get_sorted_questions(session, data['quiz_id'])
-            question = questions[data['current_question']]['question']  # Get the question
-            comment = questions[data['current_question']]['comment']  # Get the comment
-
-                        
-            test = await session.execute(select(Test).where(Test.id == data['quiz_id']))
-            test = test.scalar_one()
+            test = await QuizService.get_test_snapshot(data['quiz_id'], session)
             
             text_service = TextService()
             
             # Priority: question -> test -> default media
             if question.picture:
                 media_url = question.picture
-            elif test.picture:
+            elif test and test.picture:
                 media_url = test.picture
             else:
                 media_url = await text_service.get_default_media(session)
             
-            if media_url and not media_url.startswith(('http://', 'https://')):
-                media_url = f"{settings.media.base_url}/app/{media_url}"
-            
-            comment_text = settings.quiz_text.question_comment_header + f"\n\n{comment.replace('\\n', '\n')}"
+            comment_text = settings.quiz_text.question_comment_header + f"\n\n{question.comment.replace('\\n', '\n')}"
             
             await send_or_edit_message(
                 message,
@@ -477,61 +432,6 @@ async def process_comment(callback_query: types.CallbackQuery, state: FSMContext
     await send_question(callback_query.message, state, state_group)
 
 
-async def calculate_results(session, test, total_scores, category_scores):
-    """Calculate results based on test type and scoring method."""
-    if test.multi_graph_results:
-        final_results = []
-        # Get all distinct category IDs
-        all_categories = await session.execute(
-            select(Result.category_id).distinct()
-            .where(Result.test_id == test.id)
-            .where(Result.category_id.isnot(None))
-        )
-        all_categories = [cat[0] for cat in all_categories.fetchall()]
-        
-        # Process each category including 0 score 
-        for category_id in all_categories:
-            count = category_scores.get(category_id, 0)  # If category not found, set score to 0
-            results = await session.execute(
-                select(Result).where(
-                    Result.test_id == test.id,
-                    Result.category_id == category_id,
-                    Result.min_score <= count,
-                    Result.max_score >= count
-                )
-            )
-            category_result = results.scalar_one_or_none()
-            if category_result:
-                final_results.append({
-                    'category_id': category_id,
-                    'category_name': test.get_category_name(category_id),
-                    'score': count,
-                    'text': category_result.text,
-                    'picture': category_result.picture
-                })
-        
-        # Sort results by score in descending order
-        final_results.sort(key=lambda x: x['score'], reverse=True)
-        return final_results
-    
-    else:
-        # For traditional single-result tests
-        results = await session.execute(
-            select(Result).where(
-                Result.test_id == test.id,
-                Result.category_id.is_(None),  # Regular results without categories for regular non multi-graph tests
-                Result.min_score <= total_scores,
-                Result.max_score >= total_scores
-            )
-        )
-        result = results.scalar_one_or_none()
-        return [{
-            'score': total_scores,
-            'text': result.text if result else settings.quiz_text.quiz_result_error_undefined,
-            'picture': result.picture if result else None
-        }]
-
-
 async def finish_quiz(message: types.Message, state: FSMContext):
     data = await state.get_data()
     quiz_id = data['quiz_id']
@@ -540,14 +440,13 @@ async def finish_quiz(message: types.Message, state: FSMContext):
 
     async for session in db_helper.session_getter():
         try:
-            test = await session.execute(select(Test).where(Test.id == quiz_id))
-            test = test.scalar_one()
+            test = await QuizService.get_test_snapshot(quiz_id, session)
 
             user = await session.execute(select(User).where(User.chat_id == message.chat.id))
             user = user.scalar_one()
 
             # Calculate results
-            results = await calculate_results(session, test, total_score, category_scores)
+            results = QuizService.calculate_results(test, total_score, category_scores)
 
             # Save results
             for result in results:
@@ -585,9 +484,6 @@ async def finish_quiz(message: types.Message, state: FSMContext):
             # Get appropriate media URL
             text_service = TextService()
             media_url = (results[0].get('picture') if results else None) or test.picture or await text_service.get_default_media(session)
-            
-            if media_url and not media_url.startswith(('http://', 'https://')):
-                media_url = f"{settings.media.base_url}/app/{media_url}"
 
             await send_or_edit_message(
                 message,
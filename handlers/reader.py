@@ -10,11 +10,15 @@ from core.models import db_helper
 from core import log, settings
 from services.text_service import TextService
 from services.button_service import ButtonService
+from utils import TTLCache
 from .utils import send_or_edit_message
 
 
 router = Router()
 
+# (context_marker, content version) -> chunks, old versions are never requested again and just expire
+_chunks_cache = TTLCache(maxsize=settings.cache.content_max_size, ttl=settings.cache.content_ttl_seconds)
+
 
 class LargeTextStates(StatesGroup):
     READING = State()
@@ -55,6 +59,17 @@ def split_text_into_chunks(text: str, max_chunk_size: int) -> list[str]:
     return chunks
 
 
+def get_text_chunks(context_marker: str, content: dict) -> tuple[str, ...]:
+    """Split the text content from TextService into pages, pages are cached by the content version"""
+    cache_key = (context_marker, content["version"])
+    chunks = _chunks_cache.get(cache_key)
+    if chunks is None:
+        chunk_size = content["chunk_size"] or settings.bot_reader_text.reader_chunks
+        chunks = tuple(split_text_into_chunks(content["text"], chunk_size))
+        _chunks_cache.set(cache_key, chunks)
+    return chunks
+
+
 # @router.message(Command("read"))
 @router.callback_query(lambda c: c.data and c.data.startswith("read_"))
 async def start_reading(callback_query: types.CallbackQuery, state: FSMContext):
@@ -83,21 +98,19 @@ async def start_reading(callback_query: types.CallbackQuery, state: FSMContext):
                 )
                 return
             
-            text = content["text"]
+            chunks = get_text_chunks(context_marker, content)
             media_url = content["media_urls"][0] if content["media_urls"] else await text_service.get_default_media(session)
-            chunk_size = content["chunk_size"] or settings.bot_reader_text.reader_chunks
             
-            chunks = split_text_into_chunks(text, chunk_size)
             custom_buttons = await button_service.get_buttons_by_marker(context_marker, session)
             keyboard = create_navigation_keyboard(0, len(chunks), custom_buttons)
             
+            # Only the cursor is kept in the state, pages and buttons are taken from the shared caches
             await state.update_data(
-                chunks=chunks,
+                context_marker=context_marker,
                 current_chunk=0,
                 total_chunks=len(chunks),
+                version=content["version"],
                 media_url=media_url,
-                context_marker=context_marker,
-                custom_buttons=custom_buttons
             )
             await state.set_state(LargeTextStates.READING)
             
@@ -108,16 +121,57 @@ async def start_reading(callback_query: types.CallbackQuery, state: FSMContext):
             await session.close()
 
 
+async def show_page(
+    message: types.Message | types.CallbackQuery,
+    state: FSMContext,
+    current_chunk: int
+):
+    """Send the page by the reader cursor stored in the state"""
+    data = await state.get_data()
+    context_marker = data.get("context_marker")
+    media_url = data.get("media_url")
+
+    async for session in db_helper.session_getter():
+        try:
+            content = await TextService.get_text_with_media(context_marker, session)
+            if not content or not content["text"]:
+                await state.clear()
+                await send_or_edit_message(
+                    message,
+                    settings.bot_reader_text.reader_text_not_found + f"'{context_marker}'",
+                    None
+                )
+                return
+
+            chunks = get_text_chunks(context_marker, content)
+            version = content["version"]
+            if version != data.get("version"):
+                # The text was changed in the admin panel while reading, keep the page if it still exists
+                current_chunk = min(current_chunk, len(chunks) - 1)
+
+            await state.update_data(current_chunk=current_chunk, total_chunks=len(chunks), version=version)
+
+            custom_buttons = await ButtonService.get_buttons_by_marker(context_marker, session)
+            keyboard = create_navigation_keyboard(current_chunk, len(chunks), custom_buttons)
+            await send_chunk(
+                message,
+                chunks[current_chunk],
+                keyboard,
+                media_url
+            )
+        except Exception as e:
+            log.error(f"Error in show_page: {e}")
+        finally:
+            await session.close()
+
+
 @router.callback_query(LargeTextStates.READING)
 async def process_reading(callback_query: types.CallbackQuery, state: FSMContext):
     await callback_query.answer()
     
     data = await state.get_data()
-    chunks = data.get("chunks", [])
     current_chunk = data.get("current_chunk", 0)
     total_chunks = data.get("total_chunks", 0)
-    media_url = data.get("media_url")
-    custom_buttons = data.get("custom_buttons", [])
     context_marker = data.get("context_marker")
     
     action = callback_query.data
@@ -128,15 +182,7 @@ async def process_reading(callback_query: types.CallbackQuery, state: FSMContext
         elif action == "prev_page" and current_chunk > 0:
             current_chunk -= 1
 
-
-        await state.update_data(current_chunk=current_chunk)
-        keyboard = create_navigation_keyboard(current_chunk, total_chunks, custom_buttons)
-        await send_chunk(
-            callback_query,
-            chunks[current_chunk],
-            keyboard,
-            media_url
-        )
+        await show_page(callback_query, state, current_chunk)
     else:
         await process_custom_action(callback_query, action, context_marker, state)
 
@@ -146,23 +192,10 @@ async def process_page_input(message: types.Message, state: FSMContext):
     try:
         page_number = int(message.text)
         data = await state.get_data()
-        chunks = data.get("chunks", [])
         total_chunks = data.get("total_chunks", 0)
         
         if 1 <= page_number <= total_chunks:
-            current_chunk = page_number - 1
-            await state.update_data(current_chunk=current_chunk)
-            
-            media_url = data.get("media_url")
-            custom_buttons = data.get("custom_buttons", [])
-            
-            keyboard = create_navigation_keyboard(current_chunk, total_chunks, custom_buttons)
-            await send_chunk(
-                message,
-                chunks[current_chunk],
-                keyboard,
-                media_url
-            )
+            await show_page(message, state, page_number - 1)
         else:
             await message.answer("Page number is out of range.")  # TODO: Move to config
     except ValueError:
@@ -211,7 +244,7 @@ async def send_chunk(
 def create_navigation_keyboard(
     current_chunk: int,
     total_chunks: int,
-    custom_buttons: list
+    custom_buttons: tuple
 ) -> types.InlineKeyboardMarkup:
     keyboard = []
     
@@ -7,17 +7,18 @@ from aiogram.types import CallbackQuery
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 
-from sqlalchemy import select, func, or_
+from sqlalchemy import select
 
 from core import log, settings
 from core.models import db_helper
-from core.models import Test, QuizResult, User, SentTest, Result
+from core.models import Test, QuizResult, User, SentTest
 from core.models.sent_test import TestStatus
 from services.text_service import TextService
 from services.user_services import UserService
+from services.quiz_service import QuizService, QuestionInfo
+from services.sent_test_service import SentTestService
 
 from .utils import send_or_edit_message
-from .quiz import get_sorted_questions
 
 
 router = Router()
@@ -49,10 +50,9 @@ async def notify_sender(bot: Bot, sender_id: int, receiver_username: str, action
 @router.callback_query(lambda c: c.data == "view_received_tests")
 async def view_received_tests(callback_query: types.CallbackQuery, state: FSMContext):
     await callback_query.answer()
-    receiver_id = callback_query.from_user.id
     page = 1
     await state.update_data(current_page=page)
-    await show_received_tests_page(callback_query, callback_query.message, receiver_id, page, state)
+    await show_received_tests_page(callback_query, callback_query.message, page, state)
 
 
 @router.callback_query(lambda c: c.data == "current_page")  # TODO: Double check (( ! ))
@@ -60,35 +60,13 @@ async def current_page(callback_query: types.CallbackQuery):
     await callback_query.answer(settings.received_tests.page_number)
 
 
-async def show_received_tests_page(callback_query, message: types.Message, receiver_id: int, page: int, state: FSMContext):
+async def show_received_tests_page(callback_query, message: types.Message, page: int, state: FSMContext):
     async for session in db_helper.session_getter():
         try:
-            subquery = (
-                select(SentTest.sender_username, func.max(SentTest.created_at).label("last_sent"))
-                .where(SentTest.receiver_username == callback_query.from_user.username, SentTest.status.in_([TestStatus.DELIVERED, TestStatus.SENT]))
-                .group_by(SentTest.sender_username)
-                .subquery()
-            )
-
-            query = (
-                select(subquery.c.sender_username)
-                .select_from(subquery)
-                .order_by(subquery.c.last_sent.desc())
-                .offset((page - 1) * 20)
-                .limit(20)
-            )
-
-            result = await session.execute(query)
-            senders = result.scalars().all()
-
-            total_senders_query = (
-                select(func.count(func.distinct(SentTest.sender_username)))
-                .where(SentTest.receiver_id == receiver_id, SentTest.status.in_([TestStatus.DELIVERED, TestStatus.SENT]))
-            )
-            total_senders_result = await session.execute(total_senders_query)
-            total_senders = total_senders_result.scalar()
-
-            total_pages = (total_senders - 1) // 20 + 1
+            inbox = await SentTestService.get_inbox_page(session, callback_query.from_user.username, page)
+            senders = inbox.usernames
+            total_senders = inbox.total
+            total_pages = inbox.total_pages
 
             keyboard = []
             for i in range(0, len(senders), 2):
@@ -141,19 +119,7 @@ async def view_sender_tests(callback_query: types.CallbackQuery, state: FSMConte
         try:
             log.info("Fetching tests for receiver %s from sender %s", receiver_username, sender_username)
             
-            tests = await session.execute(
-                select(SentTest)
-                .where(
-                    SentTest.receiver_username == receiver_username,
-                    SentTest.sender_username == sender_username,
-                    or_(
-                        SentTest.status == TestStatus.DELIVERED,
-                        SentTest.status == TestStatus.SENT
-                    )
-                )
-                .order_by(SentTest.created_at.desc())
-            )
-            tests = tests.scalars().all()
+            tests = await SentTestService.get_pending_tests(session, receiver_username, sender_username)
             log.info("Found %s tests", len(tests))
 
             user_id_to_get_him_from_db = int(callback_query.from_user.id)
@@ -165,9 +131,6 @@ async def view_sender_tests(callback_query: types.CallbackQuery, state: FSMConte
             
             keyboard = []
             for test in tests:
-                test_info = await session.execute(select(Test).where(Test.id == test.test_id))
-                test_info = test_info.scalar_one()
-
                 keyboard.append([types.InlineKeyboardButton(text=(settings.received_tests.choose_sent_test_button + f" {test.test_name}"), callback_data=f"start_received_test_{test.id}")])
 
             if tests:
@@ -352,34 +315,18 @@ async def get_latest_category_results(session, user_id: str, test_id: str):
     Get the latest results for each category of a test for a specific user.
     Returns a list of QuizResult objects, one per category.
     """
-    # First get all distinct categories for this test/user combination
-    distinct_categories = await session.execute(
-        select(QuizResult.category_id)
-        .distinct()
+    # One index scan: the newest row of every category comes first and DISTINCT ON keeps only it
+    latest_results = await session.execute(
+        select(QuizResult)
+        .distinct(QuizResult.category_id)
         .where(
             QuizResult.user_id == user_id,
             QuizResult.test_id == test_id,
             QuizResult.category_id.isnot(None)
         )
+        .order_by(QuizResult.category_id, QuizResult.created_at.desc())
     )
-    categories = [cat[0] for cat in distinct_categories.fetchall()]
-    
-    # For each category, get the latest result
-    latest_results = []
-    for category_id in categories:
-        latest_result = await session.execute(
-            select(QuizResult)
-            .where(
-                QuizResult.user_id == user_id,
-                QuizResult.test_id == test_id,
-                QuizResult.category_id == category_id
-            )
-            .order_by(QuizResult.created_at.desc())
-            .limit(1)
-        )
-        result = latest_result.scalar_one_or_none()
-        if result:
-            latest_results.append(result)
+    latest_results = list(latest_results.scalars().all())
     
     # Sort results by score in descending order # TODO: Doublecheck
     latest_results.sort(key=lambda x: x.score, reverse=True)
@@ -604,7 +551,6 @@ async def process_comment(callback_query: types.CallbackQuery, state: FSMContext
 
 async def process_answer(callback_query: types.CallbackQuery, state: FSMContext, state_group: StatesGroup):
     data = await state.get_data()
-    sorted_questions = data['sorted_questions']
     
     if callback_query.data == "quiz_back":
         if data['current_question'] > 0:
@@ -613,9 +559,10 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
                 last_answer = data['answers'].pop()
                 # Remove from category scores if needed
                 if data.get('category_scores'):  # Check if there is a dictionary
-                    data['category_scores'][last_answer] = data['category_scores'].get(last_answer, 1) - 1
-                    if data['category_scores'][last_answer] <= 0:
-                        del data['category_scores'][last_answer]
+                    category_key = str(last_answer)  # Keys are strings to survive the FSM storage serialization
+                    data['category_scores'][category_key] = data['category_scores'].get(category_key, 1) - 1
+                    if data['category_scores'][category_key] <= 0:
+                        del data['category_scores'][category_key]
             await state.update_data(data)
             await send_question(callback_query.message, state, state_group)
         return
@@ -624,13 +571,15 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
     
     async for session in db_helper.session_getter():
         try:
-            question_data = sorted_questions[question_num]
-            question = question_data['question']  # Get the question object
-            
-            test = await session.execute(select(Test).where(Test.id == data['quiz_id']))
-            test = test.scalar_one()
+            test = await QuizService.get_test_snapshot(data['quiz_id'], session)
+            question = test.questions_by_id.get(data['question_ids'][question_num]) if test else None
+            if not question:
+                log.warning("Question %s of test %s is not available anymore", data['question_ids'][question_num], data['quiz_id'])
+                await callback_query.message.answer(settings.quiz_text.quiz_changed_error)
+                await state.clear()
+                return
             
-            score = getattr(question, f'answer{answer_num}_score')
+            score = question.answer_score(answer_num)
             data['answers'].append(score)
             
             # Update category scores if this is a multi-graph test
@@ -638,12 +587,12 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
                 if 'category_scores' not in data:
                     data['category_scores'] = {}
                 # Use score as an identifier of the category and count the number of answers
-                data['category_scores'][score] = data['category_scores'].get(score, 0) + 1
+                data['category_scores'][str(score)] = data['category_scores'].get(str(score), 0) + 1
             
             await state.update_data(data)
             
-            if question_data['comment']:
-                await show_comment(callback_query.message, question_data['comment'], state, state_group)
+            if question.comment:
+                await show_comment(callback_query.message, question, state, state_group)
             else:
                 data['current_question'] += 1
                 await state.update_data(data)
@@ -655,7 +604,7 @@ async def process_answer(callback_query: types.CallbackQuery, state: FSMContext,
             await session.close()
 
 
-async def show_comment(message: types.Message, comment: str, state: FSMContext, state_group: StatesGroup):
+async def show_comment(message: types.Message, question: QuestionInfo, state: FSMContext, state_group: StatesGroup):
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
         [types.InlineKeyboardButton(text=settings.quiz_text.quiz_continue_button, callback_data="continue_quiz")]
     ])
@@ -663,28 +612,19 @@ async def show_comment(message: types.Message, comment: str, state: FSMContext,
     data = await state.get_data()
     async for session in db_helper.session_getter():
         try:
-            questions = await get_sorted_questions(session, data['quiz_id'])
-            question = questions[data['current_question']]['question']  # Get the question
-            comment = questions[data['current_question']]['comment']  # Get the comment
-
-                        
-            test = await session.execute(select(Test).where(Test.id == data['quiz_id']))
-            test = test.scalar_one()
+            test = await QuizService.get_test_snapshot(data['quiz_id'], session)
             
             text_service = TextService()
             
             # Priority: question -> test -> default media
             if question.picture:
                 media_url = question.picture
-            elif test.picture:
+            elif test and test.picture:
                 media_url = test.picture
             else:
                 media_url = await text_service.get_default_media(session)
             
-            if media_url and not media_url.startswith(('http://', 'https://')):
-                media_url = f"{settings.media.base_url}/app/{media_url}"
-            
-            comment_text = settings.quiz_text.question_comment_header + f"\n\n{comment.replace('\\n', '\n')}"
+            comment_text = settings.quiz_text.question_comment_header + f"\n\n{question.comment.replace('\\n', '\n')}"
             
             await send_or_edit_message(
                 message,
@@ -712,15 +652,19 @@ async def confirm_start_received_test(callback_query: CallbackQuery, state: FSMC
         quiz_id = callback_query.data.split("_")[-1]
     async for session in db_helper.session_getter():
         try:
-            # Get and save the order of questions at start
-            sorted_questions = await get_sorted_questions(session, quiz_id)
+            # Get and save the order of questions at start, questions themselves are taken from the test snapshot
+            snapshot = await QuizService.get_test_snapshot(quiz_id, session)
+            if not snapshot:
+                await callback_query.answer(settings.quiz_text.quiz_not_found)
+                return
+            question_ids = QuizService.get_shuffled_question_ids(snapshot)
             await state.update_data(
                 quiz_id=quiz_id, 
                 current_question=0, 
                 answers=[], 
                 category_scores={}, 
                 intro_shown=False,
-                sorted_questions=sorted_questions  # Save the order
+                question_ids=question_ids  # Save the order
             )
             await send_question(callback_query.message, state, state_group)
         except Exception as e:
@@ -733,39 +677,39 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
     data = await state.get_data()
     quiz_id = data['quiz_id']
     current_question = data['current_question']
-    sorted_questions = data['sorted_questions']
+    question_ids = data['question_ids']
 
     async for session in db_helper.session_getter():
         try:
-            test = await session.execute(select(Test).where(Test.id == quiz_id))
-            test = test.scalar_one_or_none()
+            test = await QuizService.get_test_snapshot(quiz_id, session)
 
-            if current_question >= len(sorted_questions):
+            if current_question >= len(question_ids):
                 await finish_received_test(message, state)
                 return
 
-            question_data = sorted_questions[current_question]
-            question = question_data['question']  # Get the question object
+            question = test.questions_by_id.get(question_ids[current_question]) if test else None
+            if not question:
+                log.warning("Question %s of test %s is not available anymore", question_ids[current_question], quiz_id)
+                await message.answer(settings.quiz_text.quiz_changed_error)
+                await state.clear()
+                return
 
             # Check if there is an intro text for the current question
-            if question_data['intro_text'] and not data.get('intro_shown'):
+            if question.intro_text and not data.get('intro_shown'):
                 keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
                     [types.InlineKeyboardButton(text=settings.quiz_text.quiz_continue_button, callback_data="show_received_question")]
                 ])
                 
                 text_service = TextService()
                 # Media priority
-                if question_data['picture']:
-                    media_url = question_data['picture']
+                if question.picture:
+                    media_url = question.picture
                 elif test.picture:
                     media_url = test.picture
                 else:
                     media_url = await text_service.get_default_media(session)
                 
-                if media_url and not media_url.startswith(('http://', 'https://')):
-                    media_url = f"{settings.media.base_url}/app/{media_url}"
-                
-                intro_text = question_data['intro_text'].replace('\\n', '\n')
+                intro_text = question.intro_text.replace('\\n', '\n')
                 
                 await send_or_edit_message(
                     message,
@@ -781,8 +725,7 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
 
             # If there is no intro or it has already been shown, show the question
             keyboard = []
-            for i in range(1, 7):
-                answer_text = getattr(question, f'answer{i}_text')  # Use the question object to get the answers
+            for i, (answer_text, _) in enumerate(question.answers, start=1):
                 if answer_text:
                     keyboard.append([types.InlineKeyboardButton(
                         text=answer_text,
@@ -796,19 +739,16 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
 
             text_service = TextService()
             
-            if question_data['picture']:
-                media_url = question_data['picture']
+            if question.picture:
+                media_url = question.picture
             elif test.picture:
                 media_url = test.picture
             else:
                 media_url = await text_service.get_default_media(session)
-                
-            if media_url and not media_url.startswith(('http://', 'https://')):
-                media_url = f"{settings.media.base_url}/app/{media_url}"
 
             log.info("Generated media URL for question: %s", media_url) 
 
-            question_text = settings.quiz_text.question_text_begging_1 + f"{current_question + 1}" + settings.quiz_text.question_text_begging_2 + f"{len(sorted_questions)}:\n\n{question.question_text.replace('\\n', '\n')}"
+            question_text = settings.quiz_text.question_text_begging_1 + f"{current_question + 1}" + settings.quiz_text.question_text_begging_2 + f"{len(question_ids)}:\n\n{question.question_text.replace('\\n', '\n')}"
 
             await send_or_edit_message(
                 message,
@@ -827,61 +767,6 @@ async def send_question(message: types.Message, state: FSMContext, state_group:
             await session.close()
 
 
-async def calculate_results(session, test, total_scores, category_scores):
-    """Calculate results based on test type and scoring method."""
-    if test.multi_graph_results:
-        final_results = []
-        # Get all distinct category IDs
-        all_categories = await session.execute(
-            select(Result.category_id).distinct()
-            .where(Result.test_id == test.id)
-            .where(Result.category_id.isnot(None))
-        )
-        all_categories = [cat[0] for cat in all_categories.fetchall()]
-        
-        # Process each category including 0 score 
-        for category_id in all_categories:
-            count = category_scores.get(category_id, 0)  # If category not found, set score to 0
-            results = await session.execute(
-                select(Result).where(
-                    Result.test_id == test.id,
-                    Result.category_id == category_id,
-                    Result.min_score <= count,
-                    Result.max_score >= count
-                )
-            )
-            category_result = results.scalar_one_or_none()
-            if category_result:
-                final_results.append({
-                    'category_id': category_id,
-                    'category_name': test.get_category_name(category_id),
-                    'score': count,
-                    'text': category_result.text,
-                    'picture': category_result.picture
-                })
-        
-        # Sort results by score in descending order
-        final_results.sort(key=lambda x: x['score'], reverse=True)
-        return final_results
-    
-    else:
-        # For traditional single-result tests
-        results = await session.execute(
-            select(Result).where(
-                Result.test_id == test.id,
-                Result.category_id.is_(None),  # Regular results without categories for regular non multi-graph tests
-                Result.min_score <= total_scores,
-                Result.max_score >= total_scores
-            )
-        )
-        result = results.scalar_one_or_none()
-        return [{
-            'score': total_scores,
-            'text': result.text if result else settings.quiz_text.quiz_result_error_undefined,
-            'picture': result.picture if result else None
-        }]
-
-
 async def finish_received_test(message: types.Message, state: FSMContext):
     data = await state.get_data()
     quiz_id = data['quiz_id']
@@ -892,8 +777,7 @@ async def finish_received_test(message: types.Message, state: FSMContext):
     async for session in db_helper.session_getter():
         try:
             # Get test, sent test, and user information
-            test = await session.execute(select(Test).where(Test.id == quiz_id))
-            test = test.scalar_one()
+            test = await QuizService.get_test_snapshot(quiz_id, session)
 
             sent_test = await session.execute(select(SentTest).where(SentTest.id == sent_test_id))
             sent_test = sent_test.scalar_one()
@@ -902,7 +786,7 @@ async def finish_received_test(message: types.Message, state: FSMContext):
             user = user.scalar_one()
 
             # Calculate and save results
-            results = await calculate_results(session, test, total_score, category_scores)
+            results = QuizService.calculate_results(test, total_score, category_scores)
             result_text = ""
             
             # Save results for each category/overall
@@ -981,9 +865,6 @@ async def finish_received_test(message: types.Message, state: FSMContext):
             else:
                 media_url = await text_service.get_default_media(session)
 
-            if media_url and not media_url.startswith(('http://', 'https://')):
-                media_url = f"{settings.media.base_url}/app/{media_url}"
-
             # Send final message with results
             await send_or_edit_message(
                 message,
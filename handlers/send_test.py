@@ -20,6 +20,7 @@ from core.models.user import User
 from core.models.sent_test import SentTest, TestStatus
 from handlers.utils import send_or_edit_message
 from services.text_service import TextService
+from services.sent_test_service import SentTestService
 
 
 router = Router()
@@ -405,35 +406,9 @@ async def view_sent_tests(callback_query: types.CallbackQuery, state: FSMContext
 async def show_sent_tests_page(message: types.Message, sender_id: int, page: int, state: FSMContext):
     async for session in db_helper.session_getter():
         try:
-            # Subquery to get the last date of each user
-            subquery = (
-                select(SentTest.receiver_username, func.max(SentTest.created_at).label("last_sent"))
-                .where(SentTest.sender_id == sender_id)
-                .group_by(SentTest.receiver_username)
-                .subquery()
-            )
-
-            # Main query
-            query = (
-                select(subquery.c.receiver_username)
-                .select_from(subquery)
-                .order_by(subquery.c.last_sent.desc())
-                .offset((page - 1) * 20)
-                .limit(20)
-            )
-
-            result = await session.execute(query)
-            users = result.scalars().all()
-
-            # Get total number of unique receivers
-            total_users_query = (
-                select(func.count(func.distinct(SentTest.receiver_username)))
-                .where(SentTest.sender_id == sender_id)
-            )
-            total_users_result = await session.execute(total_users_query)
-            total_users = total_users_result.scalar()
-
-            total_pages = (total_users - 1) // 20 + 1
+            outbox = await SentTestService.get_outbox_page(session, sender_id, page)
+            users = outbox.usernames
+            total_pages = outbox.total_pages
 
             keyboard = []
             for i in range(0, len(users), 2):
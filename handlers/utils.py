@@ -1,5 +1,7 @@
 # handlers/utils.py
 
+from hashlib import blake2b
+
 from aiogram import types
 from aiogram.exceptions import TelegramBadRequest
 
@@ -9,7 +11,33 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from core import log, settings
 
 from services.button_service import ButtonService
+from services.telegram_file_service import TelegramFileService, get_media_type
 from services.text_service import TextService
+from utils import TTLCache
+
+
+# (chat_id, message_id) -> (render fingerprint, edit date) of the bot messages rendered by send_or_edit_message,
+# repeated renders of the same content skip the Telegram call
+_renders_cache = TTLCache(maxsize=settings.cache.renders_max_size, ttl=settings.cache.renders_ttl_seconds)
+
+
+def get_render_fingerprint(text: str, keyboard, media_url: str | None) -> bytes:
+    digest = blake2b(digest_size=16)
+    digest.update(text.encode())
+    digest.update(b"\0")
+    if keyboard:
+        digest.update(keyboard.model_dump_json(exclude_none=True).encode())
+    digest.update(b"\0")
+    digest.update((media_url or "").encode())
+    return digest.digest()
+
+
+def _remember_render(message: types.Message, sent: types.Message | bool | None, fingerprint: bytes) -> None:
+    _renders_cache.pop((message.chat.id, message.message_id))
+    # True is returned for the inline messages, None on the fallbacks which didn't render what was asked
+    if isinstance(sent, types.Message):
+        # The edit date tells if the message was changed since, by another worker or outside of this function
+        _renders_cache.set((sent.chat.id, sent.message_id), (fingerprint, sent.edit_date))
 
 
 async def send_or_edit_message(message: types.Message | types.CallbackQuery, text: str, keyboard=None, media_url: str = None):
@@ -18,16 +46,19 @@ async def send_or_edit_message(message: types.Message | types.CallbackQuery, tex
         if isinstance(message, types.CallbackQuery):
             message = message.message
 
+        fingerprint = get_render_fingerprint(text, keyboard, media_url)
+        if _renders_cache.get((message.chat.id, message.message_id)) == (fingerprint, message.edit_date):
+            log.debug("Message was not modified as the content didn't change, edit skipped")
+            return
+
+        sent = None
         if media_url:
             try:
-                if message.photo or message.video or message.animation:
-                    media = get_input_media(media_url, text)
-                    await message.edit_media(media=media, reply_markup=keyboard)
-                else:
-                    await message.answer_photo(photo=media_url, caption=text, reply_markup=keyboard)
+                sent = await send_media(message, text, keyboard, media_url)
             except TelegramBadRequest as e:
                 if "message is not modified" in str(e).lower():
                     log.debug("Message was not modified as the content didn't change")
+                    sent = message
                 else:
                     log.error(f"Error editing message with media: {e}")
                     await message.answer(text=text, reply_markup=keyboard)
@@ -36,16 +67,18 @@ async def send_or_edit_message(message: types.Message | types.CallbackQuery, tex
                 await message.answer(text=text, reply_markup=keyboard)
         else:
             try:
-                await message.edit_text(text=text, reply_markup=keyboard)
+                sent = await message.edit_text(text=text, reply_markup=keyboard)
             except TelegramBadRequest as e:
                 if "message is not modified" in str(e).lower():
                     log.debug("Message was not modified as the content didn't change")
+                    sent = message
                 else:
                     log.error(f"Error editing message: {e}")
                     await message.answer(text=text, reply_markup=keyboard)
             except Exception as e:
                 log.error(f"Error in send_or_edit_message: {e}")
                 await message.answer(text=text, reply_markup=keyboard)
+        _remember_render(message, sent, fingerprint)
     except Exception as e:
         log.error(f"Unexpected error in send_or_edit_message: {e}")
         try:
@@ -54,14 +87,46 @@ async def send_or_edit_message(message: types.Message | types.CallbackQuery, tex
             log.critical(f"Failed to send error message: {final_error}")
 
 
-def get_input_media(media_url: str, caption: str):
-    file_ext = media_url.split('.')[-1].lower()
-    if file_ext in ['jpg', 'jpeg', 'png']:
-        return InputMediaPhoto(media=media_url, caption=caption)
-    elif file_ext == 'gif':
-        return InputMediaAnimation(media=media_url, caption=caption)
+async def send_media(message: types.Message, text: str, keyboard, media_url: str) -> types.Message | bool:
+    """
+    Replace the media of the message or answer with a photo.
+    The file_id of the file sent before is used instead of the URL, the first send stores it.
+    """
+    is_edit = bool(message.photo or message.video or message.animation)
+    media_type = get_media_type(media_url) if is_edit else "photo"
+    file_id = await TelegramFileService.get_file_id(media_url, media_type)
+
+    async def deliver(media: str):
+        if is_edit:
+            return await message.edit_media(media=get_input_media(media_url, text, media), reply_markup=keyboard)
+        return await message.answer_photo(photo=media, caption=text, reply_markup=keyboard)
+
+    try:
+        sent = await deliver(file_id or media_url)
+    except TelegramBadRequest as e:
+        # "wrong file identifier", "wrong remote file identifier specified" and alike
+        if not file_id or "file" not in str(e).lower():
+            raise
+        log.warning(f"Stored file_id of {media_url} was rejected, sending by URL: {e}")
+        await TelegramFileService.forget(media_url, media_type)
+        file_id = None
+        sent = await deliver(media_url)
+
+    if file_id is None:
+        await TelegramFileService.remember(media_url, media_type, sent)
+    return sent
+
+
+def get_input_media(media_url: str, caption: str, media: str | None = None):
+    """Input media of the type by the URL extension, media is the file_id to send instead of the URL"""
+    media = media or media_url
+    media_type = get_media_type(media_url)
+    if media_type == "photo":
+        return InputMediaPhoto(media=media, caption=caption)
+    elif media_type == "animation":
+        return InputMediaAnimation(media=media, caption=caption)
     else:
-        return InputMediaVideo(media=media_url, caption=caption)
+        return InputMediaVideo(media=media, caption=caption)
 
 
 async def get_content(context_marker: str, session: AsyncSession):
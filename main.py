@@ -1,20 +1,20 @@
 # main.py
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
 
-from aiogram import Bot, Dispatcher
 from aiogram.types import WebhookInfo, Update
-from aiogram.client.bot import DefaultBotProperties
-from aiogram.client.session.aiohttp import AiohttpSession
 
 from fastapi.responses import ORJSONResponse, JSONResponse
 from fastapi import FastAPI, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from fastapi.staticfiles import StaticFiles
+import orjson
+from pydantic import ValidationError
 import uvicorn
 
 from sqladmin import Admin
@@ -25,67 +25,94 @@ from core.models import db_helper
 from core.admin import async_sqladmin_db_helper, sqladmin_authentication_backend
 from core.admin.models import setup_admin
 from core.models import client_manager
+from services.broadcast_service import broadcast_runner
+from services.cluster_service import cluster
+from services.media_warmup import warm_up_media
 
+from bot_factory import create_bot, create_dispatcher
 from handlers import router as main_router
+from services.update_dispatcher import UpdateDispatcher
 
 
-# TODO: Make possible to start up with multiple workers
-
 class BotWebhookManager:
     def __init__(self):
         self.bot = None
         self.dp = None
         self.webhook_url = None
         self.webhook_handler = None
+        self.update_dispatcher = None
         
     async def setup(self, token: str, webhook_host: str, webhook_path: str, router):
         """Initialize bot and webhook configuration"""
-        session = AiohttpSession(timeout=60)
-        self.bot = Bot(token=token, session=session, default=DefaultBotProperties(parse_mode='HTML'))
-        self.dp = Dispatcher()
-        self.dp.include_router(router)
+        self.bot = create_bot(token)
+        self.dp = create_dispatcher(router)
+        self.update_dispatcher = UpdateDispatcher(
+            self.dp, self.bot,
+            max_pending=settings.webhook.max_pending_updates,
+            workers=settings.webhook.workers,
+        )
         
         # URL for webhook
         self.webhook_url = f"{webhook_host}{webhook_path}"
         
     async def start_webhook(self):
-        """Set webhook for the bot"""
-        await self.bot.delete_webhook(drop_pending_updates=True)
+        """
+        Set webhook for the bot.
+        With several workers only the leader registers it, and only if Telegram has a different one,
+        so the restart of a worker doesn't touch the webhook the others are serving.
+        """
+        self.update_dispatcher.start()  # Ready before Telegram starts delivering
+        if not await cluster.try_acquire_leadership():
+            log.info("Webhook is registered by another worker")
+            return
+
+        allowed_updates = settings.webhook.allowed_updates
+        webhook_info: WebhookInfo = await self.bot.get_webhook_info()
+        if webhook_info.url == self.webhook_url and set(webhook_info.allowed_updates or []) == set(allowed_updates):
+            log.info(f"Webhook is already set to URL: {webhook_info.url}, {webhook_info.pending_update_count} updates pending")
+            return
+
         await self.bot.set_webhook(
             url=self.webhook_url,
-            allowed_updates=["message", "callback_query"],
-            drop_pending_updates=True
+            allowed_updates=allowed_updates,
+            drop_pending_updates=settings.webhook.drop_pending_updates
         )
         
-        webhook_info: WebhookInfo = await self.bot.get_webhook_info()
+        webhook_info = await self.bot.get_webhook_info()
         if not webhook_info.url:
             raise RuntimeError("Webhook setup failed!")
         
         logging.info(f"Webhook was set to URL: {webhook_info.url}")
         
     async def stop_webhook(self):
-        """Remove webhook and cleanup"""
+        """
+        Stop handling updates and cleanup.
+        The webhook stays registered: other workers may still serve it, and while no one does Telegram keeps the updates.
+        """
         log.info("Stopping webhook...")
+        if self.update_dispatcher:
+            # New updates get 503 and are redelivered by Telegram, the accepted ones are finished first
+            await self.update_dispatcher.stop(timeout=settings.webhook.drain_timeout_seconds)
         if self.bot:
-            await self.bot.delete_webhook()
             await self.bot.session.close()
+        if self.dp:
+            await self.dp.storage.close()
 
     async def handle_webhook_request(self, request: Request):
-        """Handle incoming webhook request from FastAPI"""
+        """
+        Handle incoming webhook request from FastAPI.
+        The update is only validated and queued, Telegram gets the answer before the handlers run.
+        """
         try:
-            # Get data from request
-            data = await request.json()
-            
-            # Create Update object from received data
-            update = Update(**data)
-            
-            # Process update
-            await self.dp.feed_webhook_update(self.bot, update)
-            
+            update = Update.model_validate(orjson.loads(await request.body()), context={"bot": self.bot})
+        except (orjson.JSONDecodeError, ValidationError) as e:
+            # Telegram would deliver the broken update again and again
+            log.warning(f"Invalid webhook update dropped: {e}")
             return Response(status_code=200)
-        except Exception as e:
-            log.error(f"Error processing webhook update: {e}", exc_info=True)
-            return Response(status_code=500)
+
+        if not self.update_dispatcher.submit(update):
+            return Response(status_code=503)
+        return Response(status_code=200)
 
 # Global bot manager instance
 bot_manager = BotWebhookManager()
@@ -94,6 +121,7 @@ bot_manager = BotWebhookManager()
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     log.info("Starting up the FastAPI application...")
     
+    await cluster.start()
     await bot_manager.setup(
         token=settings.bot.token,
         webhook_host=settings.media.base_url,
@@ -103,11 +131,24 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     await bot_manager.start_webhook()
     
     await client_manager.start()
+
+    broadcast_runner.start(bot_manager.bot)
+
+    warmup_task = None
+    # Only on the leader, the other workers would upload the same files
+    if settings.media_warmup.on_startup and settings.media_warmup.chat_id and cluster.is_leader:
+        warmup_task = asyncio.create_task(
+            warm_up_media(bot_manager.bot, settings.media_warmup.chat_id, settings.media_warmup.concurrency)
+        )
     
     yield
     
     log.info("Shutting down the FastAPI application...")
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    await broadcast_runner.stop()
     await bot_manager.stop_webhook()
+    await cluster.stop()
     
     await db_helper.dispose()
     await async_sqladmin_db_helper.dispose()
@@ -0,0 +1,14 @@
+__all__ = [
+    "DBSessionMiddleware",
+    "UserContext",
+    "UserContextMiddleware",
+    "IsSuperuser",
+    "RequestRateLimitMiddleware",
+    "request_rate_limiter",
+    "self_rate_limited",
+]
+
+
+from .db_session import DBSessionMiddleware
+from .user_context import UserContext, UserContextMiddleware, IsSuperuser
+from .request_rate_limit import RequestRateLimitMiddleware, request_rate_limiter, self_rate_limited
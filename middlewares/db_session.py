@@ -0,0 +1,24 @@
+# middlewares/db_session.py
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from core.models import db_helper
+
+
+class DBSessionMiddleware(BaseMiddleware):
+    """
+    Outer update middleware, all the db_helper.session_getter() / db_session() calls made while the update
+    is handled share one session. It is opened on the first query only, so updates which don't touch the DB
+    don't check out a connection, and it is committed (or rolled back on errors) once when the update is done.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with db_helper.session_scope():
+            return await handler(event, data)
@@ -0,0 +1,133 @@
+# middlewares/request_rate_limit.py
+
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from core import log, settings
+from utils import TokenBucket
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+
+# Methods which put a message into a chat, the rest (answerCallbackQuery, getters, webhook calls) are not limited
+_LIMITED_METHOD_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+_MAX_CHAT_BUCKETS = 10000
+
+_self_limited: ContextVar[bool] = ContextVar("self_limited", default=False)
+
+
+@contextmanager
+def self_rate_limited():
+    """
+    The requests made inside the block are limited and retried by the caller (the broadcast engine).
+    They only take the global token, the per-chat bucket and the RetryAfter retries are skipped,
+    so the caller sees RetryAfter right away and its own buckets are the only ones paused.
+    """
+    token = _self_limited.set(True)
+    try:
+        yield
+    finally:
+        _self_limited.reset(token)
+
+
+@dataclass
+class RequestRateLimitStats:
+    requests: int = 0  # Limited requests made
+    queued: int = 0  # Waiting for the buckets right now
+    max_queued: int = 0  # High watermark since the start
+    retries: int = 0  # RetryAfter retries
+    failed: int = 0  # RetryAfter after the last retry
+
+
+class RequestRateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Bot session middleware, every outgoing message of the bot (handlers, broadcasts, warm-up) goes through it.
+    A global token bucket keeps the bot under the Telegram limit, a bucket per chat keeps every chat under
+    the per-chat one. On RetryAfter the chat (or the whole bot for the requests without a chat) is paused
+    for the given time and the request is retried with a random jitter, so the waiting requests don't come back at once.
+    The requests made inside self_rate_limited() only take the global token.
+    """
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, max_retries: int, retry_jitter: float):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_jitter = retry_jitter
+        self.stats = RequestRateLimitStats()
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+
+    def _get_chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= _MAX_CHAT_BUCKETS:
+                # A full bucket is the same as a new one, only the chats which sent recently are kept
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if value.tokens < value.capacity
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _acquire(self, chat_bucket: TokenBucket | None) -> None:
+        self.stats.queued += 1
+        self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+        try:
+            if chat_bucket:
+                await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+        finally:
+            self.stats.queued -= 1
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not type(method).__name__.startswith(_LIMITED_METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        if _self_limited.get():
+            await self._acquire(None)
+            self.stats.requests += 1
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self._get_chat_bucket(chat_id) if chat_id is not None else None
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_bucket)
+            self.stats.requests += 1
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                # Paused even if the request is not retried, the next requests of the chat must wait too
+                (chat_bucket or self.global_bucket).penalize(e.retry_after)
+                if attempt == self.max_retries:
+                    self.stats.failed += 1
+                    raise
+                self.stats.retries += 1
+                log.warning(
+                    "Flood control on %s (chat %s), retry after %s seconds, %s requests queued",
+                    type(method).__name__, chat_id, e.retry_after, self.stats.queued,
+                )
+                await asyncio.sleep(random.uniform(0, self.retry_jitter))
+
+
+# Shared by all the Bot instances of the process, they all use the same token
+request_rate_limiter = RequestRateLimitMiddleware(
+    global_rate=settings.bot_api.global_rate,
+    chat_rate=settings.bot_api.chat_rate,
+    chat_burst=settings.bot_api.chat_burst,
+    max_retries=settings.bot_api.max_retries,
+    retry_jitter=settings.bot_api.retry_jitter_seconds,
+)
@@ -0,0 +1,60 @@
+# middlewares/user_context.py
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.filters import Filter
+from aiogram.types import TelegramObject, User as TelegramUser
+
+from services.user_services import UserInfo, UserService
+
+
+class UserContext:
+    """
+    The user of the current update, shared by all the handlers and filters of the update.
+    The DB user is looked up on the first access only and through the users cache.
+    """
+    __slots__ = ("chat_id", "username", "_user", "_loaded")
+
+    def __init__(self, chat_id: int, username: str | None):
+        self.chat_id = chat_id
+        self.username = username
+        self._user: UserInfo | None = None
+        self._loaded = False
+
+    async def get_user(self) -> UserInfo | None:
+        if not self._loaded:
+            self._user = await UserService.get_user(self.chat_id)
+            self._loaded = True
+        return self._user
+
+    async def is_superuser(self) -> bool:
+        user = await self.get_user()
+        return user is not None and user.is_superuser
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Outer update middleware, puts the UserContext into the handler data as `user_context`.
+    Registered after the aiogram context middleware, which resolves `event_from_user`.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user: TelegramUser | None = data.get("event_from_user")
+        if from_user:
+            data["user_context"] = UserContext(from_user.id, from_user.username)
+        return await handler(event, data)
+
+
+class IsSuperuser(Filter):
+    """Pass the update to the handler only if it comes from a superuser"""
+    async def __call__(self, event: TelegramObject, user_context: UserContext | None = None, event_from_user: TelegramUser | None = None) -> bool:
+        if user_context is not None:
+            return await user_context.is_superuser()
+        if event_from_user is not None:
+            return await UserService.is_superuser(event_from_user.id)
+        return False
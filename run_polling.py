@@ -0,0 +1,116 @@
+# run_polling.py
+
+"""
+Long polling entry point, the alternative to the webhook app (main.py / run_main.py) for staging and load tests:
+no public BASE_SERVER_URL needed, and with BOT_API_SERVER_URL set it polls a local or fake Bot API server.
+Handlers, middlewares and the per-chat update scheduling are the same as in the webhook app.
+
+Polling removes the webhook of the bot, never run it with the production bot token.
+"""
+
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from bot_factory import create_bot, create_dispatcher
+from core import log, settings
+from core.models import client_manager, db_helper
+from handlers import router as main_router
+from services.broadcast_service import broadcast_runner
+from services.cluster_service import cluster
+from services.update_dispatcher import UpdateDispatcher
+
+
+class PollingRunner:
+    """
+    Fetches updates with getUpdates and queues them to the UpdateDispatcher.
+
+    Telegram allows only one getUpdates call of a bot at a time (a concurrent one gets 409 Conflict),
+    so the concurrency is in the pipelining: the next batch is fetched while the workers handle the previous one.
+    The offset moves past an update only when the dispatcher accepted it, a full queue holds the next call.
+    """
+    def __init__(self, bot: Bot, update_dispatcher: UpdateDispatcher, limit: int, timeout: int,
+                 allowed_updates: list[str], retry_delay: float):
+        self.bot = bot
+        self.update_dispatcher = update_dispatcher
+        self.limit = limit
+        self.timeout = timeout
+        self.allowed_updates = allowed_updates
+        self.retry_delay = retry_delay
+        self.offset: int | None = None
+
+    async def run(self) -> None:
+        log.info("Polling started, limit %s, timeout %s seconds", self.limit, self.timeout)
+        failures = 0
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self.offset,
+                    limit=self.limit,
+                    timeout=self.timeout,
+                    allowed_updates=self.allowed_updates,
+                    request_timeout=self.timeout + 10,
+                )
+                failures = 0
+            except TelegramRetryAfter as e:
+                log.warning(f"getUpdates flood control, retry in {e.retry_after} seconds")
+                await asyncio.sleep(e.retry_after)
+                continue
+            except Exception as e:
+                failures += 1
+                delay = min(self.retry_delay * 2 ** (failures - 1), 30)
+                log.error(f"getUpdates failed ({failures} in a row), retry in {delay:.1f} seconds: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            for update in updates:
+                if not await self.update_dispatcher.put(update):
+                    return
+                # Confirmed to Telegram with the next getUpdates call
+                self.offset = update.update_id + 1
+
+
+async def main() -> None:
+    # Cache invalidations of the admin panel (served by the webhook app) reach this process too
+    await cluster.start()
+    bot = create_bot(settings.bot.token)
+    dp = create_dispatcher(main_router)
+    update_dispatcher = UpdateDispatcher(
+        dp, bot,
+        max_pending=settings.webhook.max_pending_updates,
+        workers=settings.webhook.workers,
+    )
+    runner = PollingRunner(
+        bot, update_dispatcher,
+        limit=settings.polling.limit,
+        timeout=settings.polling.timeout_seconds,
+        allowed_updates=settings.webhook.allowed_updates,
+        retry_delay=settings.polling.retry_delay_seconds,
+    )
+
+    # getUpdates doesn't work while the webhook is set
+    await bot.delete_webhook(drop_pending_updates=settings.webhook.drop_pending_updates)
+    update_dispatcher.start()
+    await client_manager.start()
+    broadcast_runner.start(bot)
+
+    try:
+        await runner.run()
+    finally:
+        log.info("Shutting down the polling runner...")
+        await broadcast_runner.stop()
+        await update_dispatcher.stop(timeout=settings.webhook.drain_timeout_seconds)
+        await bot.session.close()
+        await dp.storage.close()
+        await cluster.stop()
+        await db_helper.dispose()
+        await client_manager.dispose_all_clients()
+        log.info("Polling runner shutdown complete")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
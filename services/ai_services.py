@@ -22,18 +22,12 @@ class Response:
 async def query_ai_provider(model: AIProvider, message: str) -> Optional[str]:
     retries = 2
     try:
-        uber_client = await client_manager.get_client()
+        # Shared by all the requests to the provider host, waits in the host queue if all the slots are busy
+        host_client = client_manager.get_client(model.api_url)
     except Exception as e:
         log.error(f"Error getting client for %s: %s", model.name, e)
         return None
     
-    if not uber_client:
-        log.warning(f"No client available for %s, retrying", model.name)
-        uber_client = await client_manager.get_client()
-        if not uber_client:
-            log.error(f"No client available for %s, cannot get http client. Something went wrong.", model.name)
-            raise Exception(f"No client available, cannot get http client. Something went wrong.")
-    
     # Debug logging
     log.debug(f"Querying AI provider: {model.name}")
     log.debug(f"API URL: {model.api_url}")
@@ -43,7 +37,8 @@ async def query_ai_provider(model: AIProvider, message: str) -> Optional[str]:
 
     for attempt in range(retries):
         try:
-            response = await uber_client.client.post(
+            response = await host_client.request(
+                "POST",
                 model.api_url,
                 json=model.get_request_payload(message),
                 headers=model.get_headers(),
@@ -65,9 +60,6 @@ async def query_ai_provider(model: AIProvider, message: str) -> Optional[str]:
             log.error(f"Failed to query %s: %s, attempt %s", model.name, e, attempt + 1)
         except (httpx.RequestError, KeyError) as e:
             log.error(f"Error querying %s: %s", model.name, e)
-        finally:
-            if uber_client:
-                await client_manager.release_client(uber_client)
 
     return None
 
@@ -0,0 +1,772 @@
+# services/broadcast_service.py
+
+import asyncio
+import contextvars
+import os
+import socket
+import time
+import uuid
+from collections.abc import AsyncIterable, Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from aiogram import Bot, types
+from aiogram.client.default import Default
+from aiogram.enums import ContentType
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import bindparam, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from core import log, settings
+from core.models import db_helper, BroadcastJob, BroadcastRecipient, User
+from core.models.broadcast import BroadcastStatus, RecipientStatus
+from middlewares import self_rate_limited
+from services.user_services import UserService
+from utils import TokenBucket
+
+
+@dataclass(frozen=True, slots=True)
+class BroadcastStep:
+    """One Bot API call of the compiled broadcast, the same for every recipient"""
+    method: str  # Bot method name, called as bot.<method>(chat_id, **kwargs)
+    kwargs: dict
+    cost: int = 1  # Messages produced by the call, a media group costs one per item
+
+
+# Method and its media parameter of a single photo or video, Telegram doesn't accept media groups of a single item
+_SINGLE_MEDIA_METHODS = {
+    "photo": ("send_photo", "photo"),
+    "video": ("send_video", "video"),
+}
+
+
+def compile_broadcast(messages: list[types.Message]) -> list[BroadcastStep]:
+    """
+    Turn the messages collected from the admin into the ordered list of Bot API calls.
+    Done once per broadcast instead of walking the content types for every recipient.
+    Photos and videos are grouped into media groups of up to 10 items, documents are sent one by one.
+    """
+    steps = []
+    grouped_media = []
+    grouped_documents = []
+
+    def flush_media():
+        if len(grouped_media) == 1:
+            media = grouped_media[0]
+            method, field = _SINGLE_MEDIA_METHODS[media.type]
+            steps.append(BroadcastStep(method, {field: media.media, "caption": media.caption}))
+        elif grouped_media:
+            steps.append(BroadcastStep("send_media_group", {"media": list(grouped_media)}, cost=len(grouped_media)))
+        grouped_media.clear()
+
+    def flush_documents():
+        for file_id, caption in grouped_documents:
+            steps.append(BroadcastStep("send_document", {"document": file_id, "caption": caption, "parse_mode": "HTML"}))
+        grouped_documents.clear()
+
+    for msg in messages:
+        if msg.content_type in [ContentType.PHOTO, ContentType.VIDEO]:
+            media = types.InputMediaPhoto(media=msg.photo[-1].file_id) if msg.content_type == ContentType.PHOTO else types.InputMediaVideo(media=msg.video.file_id)
+            media.caption = msg.caption
+            grouped_media.append(media)
+
+            if len(grouped_media) == 10:
+                flush_media()
+
+        elif msg.content_type == ContentType.DOCUMENT:
+            grouped_documents.append((msg.document.file_id, msg.caption))
+
+            if len(grouped_documents) == 10:
+                flush_documents()
+
+        else:
+            # Send any remaining grouped media or documents
+            flush_media()
+            flush_documents()
+
+            # Send other types of content
+            if msg.content_type == ContentType.TEXT:
+                steps.append(BroadcastStep("send_message", {"text": msg.text, "parse_mode": "HTML"}))
+            elif msg.content_type == ContentType.AUDIO:
+                steps.append(BroadcastStep("send_audio", {"audio": msg.audio.file_id, "caption": msg.caption, "parse_mode": "HTML"}))
+            elif msg.content_type == ContentType.ANIMATION:
+                steps.append(BroadcastStep("send_animation", {"animation": msg.animation.file_id, "caption": msg.caption, "parse_mode": "HTML"}))
+            elif msg.content_type == ContentType.VOICE:
+                steps.append(BroadcastStep("send_voice", {"voice": msg.voice.file_id, "caption": msg.caption, "parse_mode": "HTML"}))
+            elif msg.content_type == ContentType.VIDEO_NOTE:
+                steps.append(BroadcastStep("send_video_note", {"video_note": msg.video_note.file_id}))
+            elif msg.content_type == ContentType.STICKER:
+                steps.append(BroadcastStep("send_sticker", {"sticker": msg.sticker.file_id}))
+            elif msg.content_type == ContentType.LOCATION:
+                steps.append(BroadcastStep("send_location", {"latitude": msg.location.latitude, "longitude": msg.location.longitude}))
+            elif msg.content_type == ContentType.VENUE:
+                steps.append(BroadcastStep("send_venue", {
+                    "latitude": msg.venue.location.latitude,
+                    "longitude": msg.venue.location.longitude,
+                    "title": msg.venue.title,
+                    "address": msg.venue.address,
+                }))
+            elif msg.content_type == ContentType.CONTACT:
+                steps.append(BroadcastStep("send_contact", {
+                    "phone_number": msg.contact.phone_number,
+                    "first_name": msg.contact.first_name,
+                    "last_name": msg.contact.last_name,
+                }))
+            else:
+                steps.append(BroadcastStep("send_message", {"text": settings.bot_admin_text.unsupported_file_type + f" {msg.content_type}."}))
+
+    # Send any remaining grouped media or documents
+    flush_media()
+    flush_documents()
+
+    return steps
+
+
+def _dump_media(media: types.InputMedia) -> dict:
+    # Fields left to the bot defaults (parse_mode) are not serializable, they get the default again on load
+    defaults = {name for name, value in media if isinstance(value, Default)}
+    return media.model_dump(mode="json", exclude_none=True, exclude=defaults)
+
+
+def dump_broadcast(steps: list[BroadcastStep]) -> list[dict]:
+    """Serialize the compiled broadcast to JSON friendly dicts, to keep it in the FSM state or the DB"""
+    return [
+        {
+            "method": step.method,
+            "kwargs": {
+                key: [_dump_media(media) for media in value] if key == "media" else value
+                for key, value in step.kwargs.items()
+            },
+            "cost": step.cost,
+        }
+        for step in steps
+    ]
+
+
+def load_broadcast(data: list[dict]) -> list[BroadcastStep]:
+    """Restore the compiled broadcast saved with dump_broadcast"""
+    steps = []
+    for item in data:
+        kwargs = dict(item["kwargs"])
+        if "media" in kwargs:
+            kwargs["media"] = [
+                types.InputMediaPhoto.model_validate(media) if media["type"] == "photo" else types.InputMediaVideo.model_validate(media)
+                for media in kwargs["media"]
+            ]
+        steps.append(BroadcastStep(item["method"], kwargs, item.get("cost", 1)))
+    return steps
+
+
+async def preview_broadcast(bot: Bot, chat_id: int, steps: list[BroadcastStep]) -> None:
+    """Replay the compiled broadcast to one chat exactly as the recipients will get it"""
+    for step in steps:
+        await getattr(bot, step.method)(chat_id, **step.kwargs)
+
+
+@dataclass
+class BroadcastStats:
+    total: int | None = None  # None if recipients are streamed and the count is unknown
+    sent: int = 0
+    failed: int = 0  # Blocked recipients included
+    blocked: int = 0
+    retries: int = 0
+    failed_chat_ids: list[int] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+    cancelled: bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Recipients processed per second"""
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+
+ProgressCallback = Callable[[BroadcastStats], Awaitable[None]]
+ResultCallback = Callable[[int, RecipientStatus, str | None], None]  # (chat_id, status, error)
+
+
+class BroadcastEngine:
+    """
+    Sends the compiled broadcast to many chats with a bounded pool of async workers.
+
+    A global token bucket keeps the whole bot under the Telegram limit of ~30 messages per second,
+    a bucket per recipient keeps every chat under the per-chat limit. On RetryAfter both buckets are paused
+    for the requested time and the call is retried, so the engine slows down instead of losing recipients.
+    The bot session limiter only adds its global token to the calls, the engine is the only retry layer.
+    """
+    def __init__(
+        self,
+        bot: Bot,
+        steps: list[BroadcastStep],
+        chat_ids: Iterable[int] | AsyncIterable[int],
+        on_progress: ProgressCallback | None = None,
+        workers: int | None = None,
+        global_bucket: TokenBucket | None = None,
+        on_result: ResultCallback | None = None,
+    ):
+        """
+        :param global_bucket: Bucket shared with other engines of the same bot, a new one is created if not given
+        :param on_result: Called with the outcome of every recipient as soon as it is known
+        """
+        self.bot = bot
+        self.steps = steps
+        self.recipient_cost = sum(step.cost for step in steps)  # Messages per recipient, known before sending starts
+        self.workers = workers or settings.broadcast.workers
+        self.global_bucket = global_bucket or TokenBucket(settings.broadcast.global_rate, settings.broadcast.global_rate)
+        self.stats = BroadcastStats(total=len(chat_ids) if hasattr(chat_ids, "__len__") else None)
+
+        self._chat_ids = chat_ids
+        self._on_progress = on_progress
+        self._on_result = on_result
+        self._cancelled = asyncio.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    async def run(self) -> BroadcastStats:
+        if self.stats.total is not None:
+            log.info(
+                "Broadcast of %s messages to %s chats, at least %.0fs at the global limit",
+                self.recipient_cost, self.stats.total, self.stats.total * self.recipient_cost / self.global_bucket.rate
+            )
+        queue: asyncio.Queue[int | None] = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report_progress()) if self._on_progress else None
+
+        try:
+            await self._feed(queue)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if reporter:
+                reporter.cancel()
+            self.stats.cancelled = self.is_cancelled
+            self.stats.finished_at = time.monotonic()
+
+        log.info(
+            "Broadcast finished: sent %s, failed %s, retries %s in %.1fs (%.1f chats/s)%s",
+            self.stats.sent, self.stats.failed, self.stats.retries, self.stats.elapsed, self.stats.rate,
+            ", cancelled" if self.stats.cancelled else ""
+        )
+        await self._notify()
+        return self.stats
+
+    async def _feed(self, queue: asyncio.Queue) -> None:
+        if isinstance(self._chat_ids, AsyncIterable):
+            async for chat_id in self._chat_ids:
+                if self.is_cancelled:
+                    return
+                await queue.put(chat_id)
+        else:
+            for chat_id in self._chat_ids:
+                if self.is_cancelled:
+                    return
+                await queue.put(chat_id)
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            chat_id = await queue.get()
+            if chat_id is None:
+                return
+            if self.is_cancelled:
+                continue
+
+            status, error = await self.send_to_chat(chat_id)
+            if status == RecipientStatus.SENT:
+                self.stats.sent += 1
+            else:
+                self.stats.failed += 1
+                self.stats.failed_chat_ids.append(chat_id)
+                if status == RecipientStatus.BLOCKED:
+                    self.stats.blocked += 1
+            if self._on_result:
+                self._on_result(chat_id, status, error)
+
+    async def send_to_chat(self, chat_id: int) -> tuple[RecipientStatus, str | None]:
+        """
+        Send all the steps to one chat.
+
+        :return: SENT if everything was delivered, BLOCKED or FAILED with the error otherwise
+        """
+        # Every recipient is processed by a single worker once, so its bucket lives only while it is processed
+        chat_bucket = TokenBucket(settings.broadcast.chat_rate, settings.broadcast.chat_burst)
+        try:
+            with self_rate_limited():
+                for step in self.steps:
+                    for attempt in range(settings.broadcast.max_retries + 1):
+                        await self.global_bucket.acquire(step.cost)
+                        await chat_bucket.acquire(step.cost)
+                        try:
+                            await getattr(self.bot, step.method)(chat_id, **step.kwargs)
+                            break
+                        except TelegramRetryAfter as e:
+                            self.stats.retries += 1
+                            log.warning("Flood control on chat %s, retry after %s seconds", chat_id, e.retry_after)
+                            self.global_bucket.penalize(e.retry_after)
+                            chat_bucket.penalize(e.retry_after)
+                    else:
+                        log.info("Failed to send broadcast to chat %s: retries exceeded", chat_id)
+                        return RecipientStatus.FAILED, "Retries exceeded"
+            return RecipientStatus.SENT, None
+        except TelegramForbiddenError as e:
+            log.info(f"Broadcast to chat {chat_id} is forbidden: {str(e)}")
+            return RecipientStatus.BLOCKED, str(e)
+        except Exception as e:
+            log.info(f"Failed to send broadcast to chat {chat_id}: {str(e)}")
+            return RecipientStatus.FAILED, str(e)
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(settings.broadcast.progress_interval_seconds)
+            await self._notify()
+
+    async def _notify(self) -> None:
+        if not self._on_progress:
+            return
+        try:
+            await self._on_progress(self.stats)
+        except Exception as e:
+            log.warning(f"Broadcast progress callback failed: {e}")
+
+
+# Running broadcasts by the chat of the admin who started them
+_running: dict[int, BroadcastEngine] = {}
+_tasks: set[asyncio.Task] = set()
+
+
+class BroadcastService:
+    @staticmethod
+    def start(owner_chat_id: int, engine: BroadcastEngine) -> bool:
+        """
+        Run the broadcast in the background, the handler returns right away.
+
+        :return: False if this admin already has a running broadcast
+        """
+        if owner_chat_id in _running:
+            return False
+
+        _running[owner_chat_id] = engine
+        # Fresh context, the broadcast must not inherit the DB session scope of the update that started it
+        task = asyncio.create_task(engine.run(), context=contextvars.Context())
+        _tasks.add(task)
+
+        def on_done(done_task: asyncio.Task) -> None:
+            _tasks.discard(done_task)
+            _running.pop(owner_chat_id, None)
+            if not done_task.cancelled() and done_task.exception():
+                log.error(f"Broadcast of {owner_chat_id} crashed: {done_task.exception()}")
+
+        task.add_done_callback(on_done)
+        return True
+
+    @staticmethod
+    def cancel(owner_chat_id: int) -> bool:
+        engine = _running.get(owner_chat_id)
+        if not engine:
+            return False
+        engine.cancel()
+        return True
+
+    @staticmethod
+    def is_running(owner_chat_id: int) -> bool:
+        return owner_chat_id in _running
+
+
+class BroadcastJobService:
+    @staticmethod
+    async def create_job(owner_chat_id: int, payload: list[dict], status_message_id: int | None = None) -> BroadcastJob | None:
+        """
+        Persist the broadcast, it is sent by the BroadcastRunner of any worker.
+
+        :param payload: Compiled broadcast, dumped with dump_broadcast
+        """
+        async for session in db_helper.session_getter():
+            try:
+                job = BroadcastJob(owner_chat_id=owner_chat_id, payload=payload, status_message_id=status_message_id)
+                session.add(job)
+                await session.commit()
+                return job
+            except Exception as e:
+                log.exception(f"Error in create_job: {e}")
+                await session.rollback()
+            finally:
+                await session.close()
+
+    @staticmethod
+    async def cancel_job(job_id: uuid.UUID | str) -> bool:
+        """Cancel the pending or running job, the runner stops it after the recipients being sent right now"""
+        async for session in db_helper.session_getter():
+            try:
+                result = await session.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.id == job_id)
+                    .where(BroadcastJob.status.in_([BroadcastStatus.PENDING, BroadcastStatus.RUNNING]))
+                    .values(status=BroadcastStatus.CANCELLED, finished_at=func.now(), lease_owner=None, lease_expires_at=None)
+                    .returning(BroadcastJob.id)
+                )
+                cancelled = result.scalar_one_or_none() is not None
+                await session.commit()
+                return cancelled
+            except Exception as e:
+                log.exception(f"Error in cancel_job: {e}")
+                await session.rollback()
+                return False
+            finally:
+                await session.close()
+
+
+class BroadcastRunner:
+    """
+    Sends the persisted broadcast jobs in the background of every app worker.
+
+    A job is owned by one runner at a time with a lease renewed while it runs, so a job of a crashed worker
+    is picked up by another one when the lease expires. Users are walked with the keyset cursor over users.id,
+    every recipient is claimed with a unique row before sending and the cursor is moved only after the results
+    of the batch are written. After a crash the batch is read again, but only never claimed recipients are sent,
+    the ones claimed without a result are marked INTERRUPTED, so nobody gets the broadcast twice.
+    """
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.bot: Bot | None = None
+        # All jobs of this worker share the bot limit, every worker has its own one (see BROADCAST_GLOBAL_RATE)
+        self.global_bucket = TokenBucket(settings.broadcast.global_rate, settings.broadcast.global_rate)
+
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._engine: BroadcastEngine | None = None
+        self._stop_requested = False
+
+    def start(self, bot: Bot) -> None:
+        if self._task:
+            return
+        self.bot = bot
+        self._stop_requested = False
+        self._task = asyncio.create_task(self._run_forever())
+        log.info("Broadcast runner %s started", self.worker_id)
+
+    async def stop(self) -> None:
+        """Stop after the recipients being sent right now, the unsent rest of the job is resumed by the next runner"""
+        if not self._task:
+            return
+        self._stop_requested = True
+        if self._engine:
+            self._engine.cancel()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=settings.broadcast.lease_seconds / 4)
+        except asyncio.TimeoutError:
+            log.warning("Broadcast runner %s didn't stop in time", self.worker_id)
+        self._task = None
+
+    def wake(self) -> None:
+        """Check for new jobs right away instead of waiting for the next poll"""
+        self._wakeup.set()
+
+    async def _run_forever(self) -> None:
+        while not self._stop_requested:
+            try:
+                while not self._stop_requested and (job_id := await self._claim_job()) is not None:
+                    await self._run_job(job_id)
+            except Exception as e:
+                log.exception(f"Error in broadcast runner: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.broadcast.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    @staticmethod
+    def _lease_expires_at():
+        return func.now() + timedelta(seconds=settings.broadcast.lease_seconds)
+
+    async def _claim_job(self) -> uuid.UUID | None:
+        async with db_helper.session_factory() as session:
+            candidate = (
+                select(BroadcastJob.id)
+                .where(BroadcastJob.status.in_([BroadcastStatus.PENDING, BroadcastStatus.RUNNING]))
+                .where(or_(BroadcastJob.lease_expires_at.is_(None), BroadcastJob.lease_expires_at < func.now()))
+                .order_by(BroadcastJob.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == candidate)
+                .values(
+                    status=BroadcastStatus.RUNNING,
+                    lease_owner=self.worker_id,
+                    lease_expires_at=self._lease_expires_at(),
+                    started_at=func.coalesce(BroadcastJob.started_at, func.now()),
+                )
+                .returning(BroadcastJob.id)
+            )
+            job_id = result.scalar_one_or_none()
+            await session.commit()
+            return job_id
+
+    async def _renew_lease(self, job_id: uuid.UUID) -> bool:
+        """:return: False if the job was cancelled or taken over by another runner"""
+        async with db_helper.session_factory() as session:
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .where(BroadcastJob.lease_owner == self.worker_id)
+                .where(BroadcastJob.status == BroadcastStatus.RUNNING)
+                .values(lease_expires_at=self._lease_expires_at())
+                .returning(BroadcastJob.id)
+            )
+            renewed = result.scalar_one_or_none() is not None
+            await session.commit()
+            return renewed
+
+    async def _release_lease(self, job_id: uuid.UUID) -> None:
+        """Let another runner resume the job right away instead of waiting for the lease to expire"""
+        async with db_helper.session_factory() as session:
+            await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .where(BroadcastJob.lease_owner == self.worker_id)
+                .values(lease_owner=None, lease_expires_at=None)
+            )
+            await session.commit()
+
+    async def _keep_lease(self, job_id: uuid.UUID) -> None:
+        """Renew the lease while a batch is being sent, stop sending as soon as the job is cancelled"""
+        while True:
+            await asyncio.sleep(settings.broadcast.lease_seconds / 3)
+            try:
+                renewed = await self._renew_lease(job_id)
+            except Exception as e:
+                log.warning(f"Failed to renew the lease of broadcast {job_id}: {e}")
+                continue
+            if not renewed:
+                if self._engine:
+                    self._engine.cancel()
+                return
+
+    async def _run_job(self, job_id: uuid.UUID) -> None:
+        """Send the job until it is finished, cancelled, taken over or the runner is stopped"""
+        async with db_helper.session_factory() as session:
+            # Recipients claimed by a runner which died before writing the result might have got the message already
+            interrupted = await session.execute(
+                update(BroadcastRecipient)
+                .where(BroadcastRecipient.job_id == job_id)
+                .where(BroadcastRecipient.status == RecipientStatus.PENDING)
+                .values(status=RecipientStatus.INTERRUPTED)
+            )
+            if interrupted.rowcount:
+                await session.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.id == job_id)
+                    .values(failed_count=BroadcastJob.failed_count + interrupted.rowcount)
+                )
+                log.warning("Broadcast %s resumed, %s recipients interrupted", job_id, interrupted.rowcount)
+
+            job = await session.get(BroadcastJob, job_id)
+            if job.total_recipients is None:
+                job.total_recipients = await session.scalar(select(func.count()).select_from(User))
+            await session.commit()
+
+        cursor = job.cursor_user_id
+        log.info("Broadcast %s is running on %s from cursor %s", job_id, self.worker_id, cursor)
+
+        lease_keeper = asyncio.create_task(self._keep_lease(job_id))
+        try:
+            if job.payload and "method" not in job.payload[0]:
+                # Jobs queued before the plan was compiled in the handler keep the raw messages
+                steps = compile_broadcast([types.Message.model_validate(message) for message in job.payload])
+            else:
+                steps = load_broadcast(job.payload)
+
+            while not self._stop_requested and await self._renew_lease(job_id):
+                batch = await self._claim_batch(job_id, cursor)
+                if batch is None:
+                    await self._finish_job(job_id, BroadcastStatus.COMPLETED)
+                    return
+
+                last_user_id, chat_ids = batch
+                outcomes: dict[int, tuple[RecipientStatus, str | None]] = {}
+                self._engine = BroadcastEngine(
+                    self.bot, steps, chat_ids,
+                    global_bucket=self.global_bucket,
+                    on_result=lambda chat_id, status, error: outcomes.__setitem__(chat_id, (status, error)),
+                )
+                stats = await self._engine.run()
+                self._engine = None
+
+                # The cursor stays at the start of the batch if it was interrupted, the released recipients are sent on resume
+                cursor = last_user_id if not stats.cancelled else cursor
+                job = await self._save_batch(job_id, chat_ids, outcomes, stats, cursor)
+                if job.status == BroadcastStatus.RUNNING:
+                    await self._report(job)
+
+            # Cancelled from the admin panel, the lease is lost or the runner is stopping
+            async with db_helper.session_factory() as session:
+                job = await session.get(BroadcastJob, job_id)
+            if job.status == BroadcastStatus.CANCELLED:
+                log.info("Broadcast %s cancelled", job_id)
+                await self._report(job)
+            elif self._stop_requested:
+                await self._release_lease(job_id)
+                log.info("Broadcast %s paused by runner %s stop", job_id, self.worker_id)
+
+        except Exception as e:
+            log.exception(f"Broadcast {job_id} failed: {e}")
+            await self._finish_job(job_id, BroadcastStatus.FAILED, error=str(e))
+        finally:
+            lease_keeper.cancel()
+            self._engine = None
+
+    async def _claim_batch(self, job_id: uuid.UUID, cursor: uuid.UUID | None) -> tuple[uuid.UUID, list[int]] | None:
+        """
+        Read the next users after the cursor and claim the ones this job has never been sent to.
+
+        :return: Last user ID of the batch and the claimed chat IDs, None if there are no more users
+        """
+        users = await UserService.get_chat_ids_page(cursor, settings.broadcast.batch_size)
+        if not users:
+            return None
+
+        async with db_helper.session_factory() as session:
+            claimed = await session.execute(
+                insert(BroadcastRecipient)
+                .values([{"job_id": job_id, "chat_id": chat_id} for _, chat_id in users])
+                .on_conflict_do_nothing(index_elements=["job_id", "chat_id"])
+                .returning(BroadcastRecipient.chat_id)
+            )
+            chat_ids = list(claimed.scalars().all())
+            await session.commit()
+            return users[-1][0], chat_ids
+
+    @staticmethod
+    async def _save_batch(
+        job_id: uuid.UUID,
+        chat_ids: list[int],
+        outcomes: dict[int, tuple[RecipientStatus, str | None]],
+        stats: BroadcastStats,
+        cursor: uuid.UUID | None,
+    ) -> BroadcastJob:
+        """
+        Write the results of the batch, release the claimed recipients that were not sent and move the cursor
+        in one transaction.
+        """
+        recipients = BroadcastRecipient.__table__
+        async with db_helper.session_factory() as session:
+            if outcomes:
+                await session.execute(
+                    update(recipients)
+                    .where(recipients.c.job_id == bindparam("b_job_id"))
+                    .where(recipients.c.chat_id == bindparam("b_chat_id"))
+                    .values(status=bindparam("b_status"), error=bindparam("b_error")),
+                    [
+                        {"b_job_id": job_id, "b_chat_id": chat_id, "b_status": status, "b_error": error}
+                        for chat_id, (status, error) in outcomes.items()
+                    ],
+                )
+
+            unsent = [chat_id for chat_id in chat_ids if chat_id not in outcomes]
+            if unsent:
+                await session.execute(
+                    delete(BroadcastRecipient)
+                    .where(BroadcastRecipient.job_id == job_id)
+                    .where(BroadcastRecipient.chat_id.in_(unsent))
+                )
+
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .values(
+                    cursor_user_id=cursor,
+                    sent_count=BroadcastJob.sent_count + stats.sent,
+                    failed_count=BroadcastJob.failed_count + stats.failed - stats.blocked,
+                    blocked_count=BroadcastJob.blocked_count + stats.blocked,
+                    retry_count=BroadcastJob.retry_count + stats.retries,
+                )
+                .returning(BroadcastJob)
+            )
+            job = result.scalar_one()
+            await session.commit()
+            return job
+
+    async def _finish_job(self, job_id: uuid.UUID, status: BroadcastStatus, error: str | None = None) -> None:
+        async with db_helper.session_factory() as session:
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .where(BroadcastJob.status == BroadcastStatus.RUNNING)
+                .values(
+                    status=status,
+                    finished_at=func.now(),
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    last_error=error,
+                    throughput=(BroadcastJob.sent_count + BroadcastJob.failed_count + BroadcastJob.blocked_count)
+                    / func.greatest(func.extract("epoch", func.now() - BroadcastJob.started_at), 1),
+                )
+                .returning(BroadcastJob)
+            )
+            job = result.scalar_one_or_none()
+            await session.commit()
+
+        if job:
+            log.info(
+                "Broadcast %s %s: sent %s, failed %s, blocked %s, retries %s (%.1f chats/s)",
+                job.id, status.value, job.sent_count, job.failed_count,
+                job.blocked_count, job.retry_count, job.throughput or 0,
+            )
+            await self._report(job)
+
+    async def _report(self, job: BroadcastJob) -> None:
+        """Show the progress in the status message, send the final report to the admin when the job is finished"""
+        try:
+            failed = job.failed_count + job.blocked_count
+            if job.status == BroadcastStatus.RUNNING:
+                if job.status_message_id:
+                    await self.bot.edit_message_text(
+                        settings.bot_admin_text.broadcast_progress + "\n"
+                        + settings.bot_admin_text.broadcast_progress_sent + f" {job.sent_count} / {job.total_recipients}\n"
+                        + settings.bot_admin_text.broadcast_progress_failed + f" {job.failed_count}\n"
+                        + settings.bot_admin_text.broadcast_progress_blocked + f" {job.blocked_count}",
+                        chat_id=job.owner_chat_id,
+                        message_id=job.status_message_id,
+                    )
+            elif job.status == BroadcastStatus.CANCELLED:
+                await self.bot.send_message(
+                    job.owner_chat_id,
+                    settings.bot_admin_text.broadcast_cancelled + "\n"
+                    + settings.bot_admin_text.broadcast_progress_sent + f" {job.sent_count} / {job.total_recipients}"
+                )
+            elif job.status == BroadcastStatus.FAILED:
+                await self.bot.send_message(job.owner_chat_id, settings.bot_admin_text.error_message)
+            elif failed:
+                await self.bot.send_message(
+                    job.owner_chat_id,
+                    settings.bot_admin_text.not_all_broadcast_1 + f" {job.sent_count} " + settings.bot_admin_text.not_all_broadcast_2 + f" {failed} " + settings.bot_admin_text.not_all_broadcast_3)
+            else:
+                await self.bot.send_message(job.owner_chat_id, settings.bot_admin_text.full_success_broadcast + f"{job.sent_count}")
+        except Exception as e:
+            log.warning(f"Failed to report broadcast {job.id} progress: {e}")
+
+
+broadcast_runner = BroadcastRunner()
@@ -1,46 +1,79 @@
 # services/button_service.py
 
+from dataclasses import dataclass
+from typing import Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from core import settings
 from core.logger import log
 from core.models.button import Button
+from services.cluster_service import cluster
+from utils import TTLCache
+
+
+@dataclass(frozen=True, slots=True)
+class ButtonInfo:
+    """Detached, read-only copy of the Button row, safe to share between requests"""
+    text: str
+    callback_data: Optional[str]
+    url: Optional[str]
+    is_half_width: bool
+
+
+BUTTONS_CACHE = "buttons"
+
+# context_marker -> (buttons, compiled keyboard), invalidated from the admin panel on Button changes
+_keyboard_cache = TTLCache(maxsize=settings.cache.content_max_size, ttl=settings.cache.content_ttl_seconds)
 
 
 class ButtonService:
     @staticmethod
-    async def get_buttons_by_marker(context_marker: str, session: AsyncSession) -> list[Button]:
+    def invalidate_cache() -> None:
+        version = _keyboard_cache.invalidate()
+        log.info("Keyboards cache invalidated, new version: %s", version)
+
+    @staticmethod
+    async def _get_compiled(context_marker: str, session: AsyncSession) -> tuple[tuple[ButtonInfo, ...], InlineKeyboardMarkup] | None:
+        compiled = _keyboard_cache.get(context_marker)
+        if compiled is not None:
+            return compiled
+
+        version = _keyboard_cache.version
         try:
             result = await session.execute(
                 Button.active()
                 .where(Button.context_marker == context_marker)
                 .order_by(Button.order)
             )
-            return result.scalars().all()
-        except Exception as e:
-            log.exception(f"Error in get_buttons_by_marker: {e}")
-            return []
-
-    @staticmethod
-    async def get_button_by_id(button_id: str, session: AsyncSession) -> Button | None:
-        try:
-            result = await session.execute(
-                Button.active().where(Button.id == button_id)
+            buttons = tuple(
+                ButtonInfo(
+                    text=button.text,
+                    callback_data=button.callback_data,
+                    url=button.url,
+                    is_half_width=button.is_half_width,
+                )
+                for button in result.scalars().all()
             )
-            return result.scalar_one_or_none()
         except Exception as e:
-            log.exception(f"Error in get_button_by_id: {e}")
+            log.exception(f"Error in get_buttons_by_marker: {e}")
             return None
 
+        compiled = (buttons, ButtonService._compile_keyboard(buttons))
+        log.debug("Compiled keyboard for %s: %s buttons", context_marker, len(buttons))
+
+        # Don't store the result if the admin changed buttons while we were loading
+        if version == _keyboard_cache.version:
+            _keyboard_cache.set(context_marker, compiled)
+        return compiled
+
     @staticmethod
-    async def create_inline_keyboard(context_marker: str, session: AsyncSession) -> InlineKeyboardMarkup:
-        buttons = await ButtonService.get_buttons_by_marker(context_marker, session)
-        
+    def _compile_keyboard(buttons: tuple[ButtonInfo, ...]) -> InlineKeyboardMarkup:
         keyboard = []
         current_row = []
 
         for button in buttons:
-            log.info(f"Processing button: {button.text}, is_half_width: {button.is_half_width}")
             btn = InlineKeyboardButton(
                 text=button.text,
                 url=button.url if button.url else None,
@@ -61,5 +94,34 @@ class ButtonService:
         if current_row:
             keyboard.append(current_row)
 
-        log.info("Final keyboard structure: %s", keyboard)
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    @staticmethod
+    async def get_buttons_by_marker(context_marker: str, session: AsyncSession) -> tuple[ButtonInfo, ...]:
+        compiled = await ButtonService._get_compiled(context_marker, session)
+        return compiled[0] if compiled else ()
+
+    @staticmethod
+    async def get_button_by_id(button_id: str, session: AsyncSession) -> Button | None:
+        try:
+            result = await session.execute(
+                Button.active().where(Button.id == button_id)
+            )
+            return result.scalar_one_or_none()
+        except Exception as e:
+            log.exception(f"Error in get_button_by_id: {e}")
+            return None
+
+    @staticmethod
+    async def create_inline_keyboard(context_marker: str, session: AsyncSession) -> InlineKeyboardMarkup:
+        """
+        Get the ready-to-send keyboard for the context marker.
+        The markup object is shared between requests, never mutate it, build a new one instead.
+        """
+        compiled = await ButtonService._get_compiled(context_marker, session)
+        if not compiled:
+            return InlineKeyboardMarkup(inline_keyboard=[])
+        return compiled[1]
+
+
+cluster.register_cache(BUTTONS_CACHE, ButtonService.invalidate_cache)
@@ -0,0 +1,153 @@
+# services/cluster_service.py
+
+import asyncio
+import uuid
+from typing import Callable
+
+import asyncpg
+import orjson
+
+from core import log
+from core.models import db_helper
+
+
+WEBHOOK_LEADER_LOCK_KEY = 0x5447_4242  # Any app-wide bigint, the same for all the workers
+CACHE_INVALIDATION_CHANNEL = "bot_cache_invalidation"
+_PING_INTERVAL_SECONDS = 30
+_RECONNECT_DELAY_SECONDS = 5
+
+
+class ClusterCoordinator:
+    """
+    Coordination of the app workers (gunicorn processes on one or several nodes) through Postgres.
+
+    - Session advisory lock elects the leader which registers the webhook, Postgres releases it if the worker dies.
+    - LISTEN / NOTIFY drops the in-memory caches of every worker when one of them (the admin panel) changes the data.
+
+    Both live on one dedicated asyncpg connection, opened outside the engine pool so the handlers
+    keep the whole pool of the worker.
+    """
+    def __init__(self):
+        self.instance_id = uuid.uuid4().hex  # Own notifications are skipped, the caches are already dropped locally
+        self.is_leader = False
+
+        self._caches: dict[str, Callable[[], None]] = {}
+        self._connection: asyncpg.Connection | None = None
+        self._lost = asyncio.Event()
+        self._query_lock = asyncio.Lock()  # asyncpg runs one query at a time on a connection
+        self._task: asyncio.Task | None = None
+
+    def register_cache(self, name: str, invalidate: Callable[[], None]) -> None:
+        """Register the local cache which is dropped by the name on every worker"""
+        self._caches[name] = invalidate
+
+    async def start(self) -> None:
+        await self._connect()
+        self._task = asyncio.create_task(self._supervise())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+        self.is_leader = False
+
+    async def try_acquire_leadership(self) -> bool:
+        """Become the leader if no other worker is, the lock is held until the worker stops"""
+        if not self.is_leader and self._connection is not None:
+            async with self._query_lock:
+                self.is_leader = await self._connection.fetchval("SELECT pg_try_advisory_lock($1)", WEBHOOK_LEADER_LOCK_KEY)
+        return self.is_leader
+
+    async def invalidate_cache(self, name: str) -> None:
+        """Drop the cache of this worker and notify the other workers to drop theirs"""
+        self._invalidate_local(name)
+        if self._connection is None:
+            log.warning("Cache %s invalidated only locally, the cluster connection is not ready", name)
+            return
+        payload = orjson.dumps({"origin": self.instance_id, "name": name}).decode()
+        try:
+            async with self._query_lock:
+                await self._connection.execute("SELECT pg_notify($1, $2)", CACHE_INVALIDATION_CHANNEL, payload)
+        except Exception as e:
+            log.error(f"Failed to notify the workers about the {name} cache invalidation: {e}")
+
+    def _invalidate_local(self, name: str) -> None:
+        invalidate = self._caches.get(name)
+        if invalidate is None:
+            log.warning("Unknown cache: %s", name)
+            return
+        invalidate()
+
+    def _invalidate_all(self) -> None:
+        for invalidate in self._caches.values():
+            invalidate()
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            log.warning("Invalid cache invalidation notification: %s", payload)
+            return
+        if message.get("origin") != self.instance_id:
+            self._invalidate_local(message.get("name"))
+
+    def _on_termination(self, connection) -> None:
+        self._lost.set()
+
+    async def _connect(self) -> None:
+        # The same database as the engine, with the plain postgresql:// scheme asyncpg expects
+        dsn = db_helper.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        connection = await asyncpg.connect(dsn)
+        try:
+            await connection.add_listener(CACHE_INVALIDATION_CHANNEL, self._on_notification)
+            connection.add_termination_listener(self._on_termination)
+        except Exception:
+            connection.terminate()
+            raise
+        self._connection = connection
+        self._lost.clear()
+
+    async def _disconnect(self) -> None:
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        try:
+            # Closing the connection releases the advisory lock and the listener
+            await connection.close(timeout=_RECONNECT_DELAY_SECONDS)
+        except Exception as e:
+            log.warning(f"Error closing the cluster connection: {e}")
+            connection.terminate()
+
+    async def _supervise(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=_PING_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                try:
+                    async with self._query_lock:
+                        await self._connection.execute("SELECT 1")
+                    continue
+                except Exception:
+                    pass
+
+            log.warning("Cluster connection lost, reconnecting...")
+            await self._disconnect()
+            # The lock went away with the connection, the webhook is registered already and nobody needs it again
+            self.is_leader = False
+            while True:
+                try:
+                    await self._connect()
+                    break
+                except Exception as e:
+                    log.error(f"Failed to reconnect the cluster connection: {e}")
+                    await asyncio.sleep(_RECONNECT_DELAY_SECONDS)
+            # Notifications sent while the connection was down are lost
+            self._invalidate_all()
+
+
+cluster = ClusterCoordinator()
@@ -0,0 +1,100 @@
+# services/media_warmup.py
+
+import asyncio
+import os
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import FSInputFile
+from sqlalchemy import select
+
+from core import log, settings
+from core.models import Media, Question, Result, Test, db_helper
+from services.telegram_file_service import TelegramFileService, get_local_path, get_media_type
+
+
+_SEND_METHODS = {
+    "photo": ("send_photo", "photo"),
+    "animation": ("send_animation", "animation"),
+    "video": ("send_video", "video"),
+}
+_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class WarmupStats:
+    total: int = 0
+    cached: int = 0  # Had a file_id already
+    uploaded: int = 0
+    missing: int = 0  # Not on the disk or not a local file
+    failed: int = 0
+
+
+async def collect_media_urls() -> list[str]:
+    """URLs of all the active media and test pictures, the same the handlers send"""
+    urls = []
+    async with db_helper.db_session() as session:
+        files = await session.scalars(select(Media.file).where(Media.is_active == True))
+        urls.extend(f"{settings.media.base_url}/app/{file}" for file in files if file)
+
+        for model in (Test, Question, Result):
+            pictures = await session.scalars(
+                select(model.picture).where(model.is_active == True, model.picture.is_not(None))
+            )
+            urls.extend(f"{settings.media.base_url}/app/{picture}" for picture in pictures if picture)
+
+    return list(dict.fromkeys(urls))
+
+
+async def _upload(bot: Bot, chat_id: int, media_url: str, semaphore: asyncio.Semaphore, stats: WarmupStats) -> None:
+    # The whole upload is limited, the file_id lookup hashes the file and opens a DB session too
+    async with semaphore:
+        media_type = get_media_type(media_url)
+        path = get_local_path(media_url)
+        if path is None or not os.path.isfile(path):
+            stats.missing += 1
+            return
+        if await TelegramFileService.get_file_id(media_url, media_type):
+            stats.cached += 1
+            return
+
+        method, field = _SEND_METHODS[media_type]
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            try:
+                # Uploaded from the disk, Telegram doesn't need to reach BASE_SERVER_URL
+                sent = await getattr(bot, method)(chat_id, **{field: FSInputFile(path)}, disable_notification=True)
+                break
+            except TelegramRetryAfter as e:
+                log.warning(f"Media warm-up flood control, retry in {e.retry_after} seconds")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                log.error(f"Failed to upload {path} (attempt {attempt}): {e}")
+        else:
+            stats.failed += 1
+            return
+
+        await TelegramFileService.remember(media_url, media_type, sent)
+    stats.uploaded += 1
+    try:
+        await bot.delete_message(chat_id, sent.message_id)
+    except Exception as e:
+        log.debug(f"Failed to delete the warm-up message: {e}")
+
+
+async def warm_up_media(bot: Bot, chat_id: int, concurrency: int) -> WarmupStats:
+    """
+    Upload every media file without a stored file_id to the service chat and store the file_ids,
+    so even the first render of every screen goes without Telegram fetching the file by URL.
+    The uploaded messages are deleted from the chat.
+    """
+    stats = WarmupStats()
+    media_urls = await collect_media_urls()
+    stats.total = len(media_urls)
+    log.info("Media warm-up started, %s files", stats.total)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*(_upload(bot, chat_id, media_url, semaphore, stats) for media_url in media_urls))
+
+    log.info("Media warm-up finished: %s", stats)
+    return stats
@@ -0,0 +1,351 @@
+# services/quiz_service.py
+
+import json
+import random
+import uuid
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import accumulate
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional, Sequence
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import log, settings
+from core.models import Test, Question, Result, QuizResult
+from services.cluster_service import cluster
+from utils import TTLCache
+
+
+@dataclass(frozen=True, slots=True)
+class QuestionInfo:
+    """Detached, read-only copy of the Question row, safe to share between requests"""
+    id: str
+    order: int
+    question_text: str
+    picture: Optional[str]  # Full media URL
+    intro_text: Optional[str]
+    comment: Optional[str]
+    answers: tuple[tuple[Optional[str], Optional[int]], ...]  # (text, score) for answer1..answer6
+
+    def answer_score(self, answer_num: int) -> Optional[int]:
+        return self.answers[answer_num - 1][1]
+
+
+@dataclass(frozen=True, slots=True)
+class ResultInfo:
+    """Detached, read-only copy of the Result row"""
+    category_id: Optional[int]
+    min_score: int
+    max_score: int
+    text: str
+    picture: Optional[str]  # Full media URL
+
+
+class ResultIndex:
+    """
+    Interval index over the [min_score, max_score] ranges of one result category.
+    Results are sorted by min_score once, so a score is mapped to its Result with a binary search.
+    """
+    __slots__ = ("_starts", "_max_ends", "_results")
+
+    def __init__(self, results: Iterable[ResultInfo]):
+        self._results = tuple(sorted(results, key=lambda result: (result.min_score, result.max_score)))
+        self._starts = tuple(result.min_score for result in self._results)
+        # Running maximum of the range ends, lets the lookup stop early if ranges overlap
+        self._max_ends = tuple(accumulate((result.max_score for result in self._results), max))
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def lookup(self, score: int) -> Optional[ResultInfo]:
+        i = bisect_right(self._starts, score) - 1
+        while i >= 0 and self._max_ends[i] >= score:
+            if self._results[i].max_score >= score:
+                return self._results[i]
+            i -= 1
+        return None
+
+    def lookup_many(self, scores: Sequence[int]) -> list[Optional[ResultInfo]]:
+        return [self.lookup(score) for score in scores]
+
+
+@dataclass(frozen=True, slots=True)
+class TestSnapshot:
+    """
+    Everything the quiz engine needs to run the test, built once per test and cache version.
+    Shared between all users passing the test, never mutate it.
+    """
+    id: uuid.UUID
+    version: int
+    name: str
+    description: str
+    picture: Optional[str]  # Full media URL
+    is_psychological: bool
+    multi_graph_results: bool
+    allow_back: bool
+    allow_play_again: bool
+    category_names: Mapping[str, str]
+    questions: tuple[QuestionInfo, ...]  # Active questions sorted by order
+    questions_by_id: Mapping[str, QuestionInfo]
+    results: tuple[ResultInfo, ...]
+    category_ids: tuple[int, ...]  # Sorted IDs of the result categories, for multi-graph tests
+    result_indexes: Mapping[Optional[int], ResultIndex]  # category_id (None for regular results) -> index
+
+    def get_category_name(self, category_id: int) -> str:
+        """Get category name by ID, return default if not found"""
+        return self.category_names.get(str(category_id), f"Category {category_id}")
+
+
+TESTS_CACHE = "tests"
+
+# test_id -> TestSnapshot, invalidated from the admin panel on Test / Question / Result changes
+_snapshots_cache = TTLCache(maxsize=settings.cache.content_max_size, ttl=settings.cache.content_ttl_seconds)
+_NOT_CACHED = object()
+
+
+def _media_url(picture) -> Optional[str]:
+    if not picture:
+        return None
+    picture = str(picture)
+    if picture.startswith(('http://', 'https://')):
+        return picture
+    return f"{settings.media.base_url}/app/{picture}"
+
+
+def _category_names(test: Test) -> dict[str, str]:
+    try:
+        names = test.category_names or {}
+        if isinstance(names, str):
+            names = json.loads(names)
+        return {str(key): value for key, value in names.items()}
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+
+
+class QuizService:
+    @staticmethod
+    def invalidate_cache() -> None:
+        version = _snapshots_cache.invalidate()
+        log.info("Test snapshots cache invalidated, new version: %s", version)
+
+    @staticmethod
+    async def _load_snapshot(test_id: str, version: int, session: AsyncSession) -> Optional[TestSnapshot]:
+        test = await session.execute(select(Test).where(Test.id == test_id))
+        test = test.scalar_one_or_none()
+        if not test:
+            return None
+
+        questions = await session.execute(
+            Question.active()
+            .where(Question.test_id == test_id)
+            .order_by(Question.order)
+        )
+        questions = tuple(
+            QuestionInfo(
+                id=str(question.id),
+                order=question.order,
+                question_text=question.question_text,
+                picture=_media_url(question.picture),
+                intro_text=question.intro_text,
+                comment=question.comment,
+                answers=tuple(
+                    (getattr(question, f'answer{i}_text'), getattr(question, f'answer{i}_score'))
+                    for i in range(1, 7)
+                ),
+            )
+            for question in questions.scalars().all()
+        )
+
+        results = await session.execute(select(Result).where(Result.test_id == test_id))
+        results = tuple(
+            ResultInfo(
+                category_id=result.category_id,
+                min_score=result.min_score,
+                max_score=result.max_score,
+                text=result.text,
+                picture=_media_url(result.picture),
+            )
+            for result in results.scalars().all()
+        )
+
+        results_by_category = defaultdict(list)
+        for result in results:
+            results_by_category[result.category_id].append(result)
+
+        return TestSnapshot(
+            id=test.id,
+            version=version,
+            name=test.name,
+            description=test.description,
+            picture=_media_url(test.picture),
+            is_psychological=test.is_psychological,
+            multi_graph_results=test.multi_graph_results,
+            allow_back=test.allow_back,
+            allow_play_again=test.allow_play_again,
+            category_names=MappingProxyType(_category_names(test)),
+            questions=questions,
+            questions_by_id=MappingProxyType({question.id: question for question in questions}),
+            results=results,
+            category_ids=tuple(sorted(category_id for category_id in results_by_category if category_id is not None)),
+            result_indexes=MappingProxyType({
+                category_id: ResultIndex(category_results)
+                for category_id, category_results in results_by_category.items()
+            }),
+        )
+
+    @staticmethod
+    async def get_test_snapshot(test_id: str, session: AsyncSession) -> Optional[TestSnapshot]:
+        """
+        Get the snapshot of the test, the DB is only queried on the first call after invalidation.
+
+        :param test_id: Test ID
+        :param session: Session used if the snapshot is not cached yet
+        :return: TestSnapshot or None if there is no such test
+        """
+        test_id = str(test_id)
+        version = _snapshots_cache.version
+        snapshot = _snapshots_cache.get(test_id, _NOT_CACHED)
+        if snapshot is not _NOT_CACHED:
+            return snapshot
+
+        snapshot = await QuizService._load_snapshot(test_id, version, session)
+        if snapshot:
+            log.debug("Built snapshot for test %s: %s questions, %s results", test_id, len(snapshot.questions), len(snapshot.results))
+
+        # Don't store the snapshot if the admin changed the test while we were loading
+        if version == _snapshots_cache.version:
+            _snapshots_cache.set(test_id, snapshot)
+        return snapshot
+
+    @staticmethod
+    def get_shuffled_question_ids(snapshot: TestSnapshot) -> list[str]:
+        """
+        Get the order of questions for a new quiz session:
+        sorted by order, questions with the same order are shuffled.
+        """
+        questions_by_order = defaultdict(list)
+        for question in snapshot.questions:
+            questions_by_order[question.order].append(question.id)
+
+        question_ids = []
+        for order in sorted(questions_by_order.keys()):
+            order_questions = questions_by_order[order]
+            if len(order_questions) > 1:
+                random.shuffle(order_questions)
+            question_ids.extend(order_questions)
+
+        return question_ids
+
+    @staticmethod
+    def calculate_results(snapshot: TestSnapshot, total_scores: int, category_scores: dict) -> list[dict]:
+        """Calculate results based on test type and scoring method."""
+        return QuizService.calculate_results_batch(snapshot, [(total_scores, category_scores)])[0]
+
+    @staticmethod
+    def calculate_results_batch(snapshot: TestSnapshot, answer_vectors: Sequence[tuple[int, dict]]) -> list[list[dict]]:
+        """
+        Calculate results for many finished quizzes of the same test at once, without touching the DB.
+
+        :param snapshot: Test snapshot
+        :param answer_vectors: (total score, category scores) pairs, category scores are keyed by str(category_id)
+        :return: Results for every answer vector in the same order
+        """
+        if snapshot.multi_graph_results:
+            final_results = [[] for _ in answer_vectors]
+            # Process each category including 0 score
+            for category_id in snapshot.category_ids:
+                counts = [category_scores.get(str(category_id), 0) for _, category_scores in answer_vectors]  # If category not found, set score to 0
+                category_name = snapshot.get_category_name(category_id)
+                for vector_results, count, category_result in zip(
+                    final_results, counts, snapshot.result_indexes[category_id].lookup_many(counts)
+                ):
+                    if category_result:
+                        vector_results.append({
+                            'category_id': category_id,
+                            'category_name': category_name,
+                            'score': count,
+                            'text': category_result.text,
+                            'picture': category_result.picture
+                        })
+
+            # Sort results by score in descending order
+            for vector_results in final_results:
+                vector_results.sort(key=lambda x: x['score'], reverse=True)
+            return final_results
+
+        # For traditional single-result tests, regular results without categories
+        totals = [total_scores for total_scores, _ in answer_vectors]
+        index = snapshot.result_indexes.get(None)
+        matched = index.lookup_many(totals) if index else [None] * len(totals)
+        return [
+            [{
+                'score': total_scores,
+                'text': result.text if result else settings.quiz_text.quiz_result_error_undefined,
+                'picture': result.picture if result else None
+            }]
+            for total_scores, result in zip(totals, matched)
+        ]
+
+    @staticmethod
+    async def rescore_quiz_results(test_id: str, session: AsyncSession, batch_size: int = 1000) -> int:
+        """
+        Recalculate result texts of the saved QuizResult rows of the test with the current Result thresholds.
+        Rows are walked by primary key in batches, only changed rows are updated.
+
+        :param test_id: Test ID
+        :param session: Session to use, committed at the end
+        :param batch_size: Number of rows loaded and updated at once
+        :return: Number of updated rows
+        """
+        # Always build a fresh snapshot, the cached one might be older than the thresholds just edited
+        snapshot = await QuizService._load_snapshot(str(test_id), _snapshots_cache.version, session)
+        if not snapshot:
+            return 0
+
+        updated = 0
+        last_id = None
+        while True:
+            query = (
+                select(QuizResult.id, QuizResult.category_id, QuizResult.score, QuizResult.result_text)
+                .where(QuizResult.test_id == snapshot.id)
+                .order_by(QuizResult.id)
+                .limit(batch_size)
+            )
+            if last_id is not None:
+                query = query.where(QuizResult.id > last_id)
+            rows = (await session.execute(query)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            rows_by_category = defaultdict(list)
+            for row in rows:
+                rows_by_category[row.category_id].append(row)
+
+            changes = []
+            for category_id, category_rows in rows_by_category.items():
+                index = snapshot.result_indexes.get(category_id)
+                matched = index.lookup_many([row.score for row in category_rows]) if index else [None] * len(category_rows)
+                for row, result in zip(category_rows, matched):
+                    if result:
+                        result_text = result.text
+                    elif category_id is None:
+                        result_text = settings.quiz_text.quiz_result_error_undefined
+                    else:
+                        continue  # Category results without a match are never saved, keep the history as is
+                    if result_text != row.result_text:
+                        changes.append({"id": row.id, "result_text": result_text})
+
+            if changes:
+                await session.execute(update(QuizResult), changes)
+                updated += len(changes)
+
+        await session.commit()
+        log.info("Rescored %s quiz results of test %s", updated, snapshot.id)
+        return updated
+
+
+cluster.register_cache(TESTS_CACHE, QuizService.invalidate_cache)
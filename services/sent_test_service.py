@@ -0,0 +1,90 @@
+# services/sent_test_service.py
+
+from dataclasses import dataclass
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import SentTest, Test
+from core.models.sent_test import TestStatus
+
+
+# Tests waiting for the receiver to pass or reject them
+PENDING_STATUSES = (TestStatus.SENT, TestStatus.DELIVERED)
+
+
+@dataclass(frozen=True, slots=True)
+class ContactsPage:
+    """Page of senders (inbox) or receivers (outbox), ordered by the last sent test"""
+    usernames: list[str]
+    total: int  # Contacts on all pages
+    page: int
+    page_size: int
+
+    @property
+    def total_pages(self) -> int:
+        return (self.total - 1) // self.page_size + 1
+
+
+class SentTestService:
+    @staticmethod
+    async def _get_contacts_page(session: AsyncSession, username_column, conditions: list, page: int, page_size: int) -> ContactsPage:
+        """
+        One query for the page and the total: the window count is calculated over the grouped rows
+        before LIMIT, so every row of the page carries the number of contacts on all pages.
+        """
+        last_sent = func.max(SentTest.created_at)
+        result = await session.execute(
+            select(username_column, func.count().over().label("total"))
+            .where(*conditions)
+            .group_by(username_column)
+            .order_by(last_sent.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+        )
+        rows = result.all()
+        if rows:
+            return ContactsPage([row[0] for row in rows], rows[0].total, page, page_size)
+
+        if page == 1:
+            return ContactsPage([], 0, page, page_size)
+        # The page is past the end, only the total is still needed for the navigation
+        total = await session.scalar(select(func.count(func.distinct(username_column))).where(*conditions))
+        return ContactsPage([], total or 0, page, page_size)
+
+    @staticmethod
+    async def get_inbox_page(session: AsyncSession, receiver_username: str, page: int, page_size: int = 20) -> ContactsPage:
+        """Senders of the pending tests received by the user"""
+        return await SentTestService._get_contacts_page(
+            session,
+            SentTest.sender_username,
+            [SentTest.receiver_username == receiver_username, SentTest.status.in_(PENDING_STATUSES)],
+            page,
+            page_size,
+        )
+
+    @staticmethod
+    async def get_outbox_page(session: AsyncSession, sender_id: int, page: int, page_size: int = 20) -> ContactsPage:
+        """Receivers of all the tests sent by the user"""
+        return await SentTestService._get_contacts_page(
+            session,
+            SentTest.receiver_username,
+            [SentTest.sender_id == sender_id],
+            page,
+            page_size,
+        )
+
+    @staticmethod
+    async def get_pending_tests(session: AsyncSession, receiver_username: str, sender_username: str) -> list[SentTest]:
+        """Pending tests from the sender, tests deleted in the admin panel are skipped"""
+        result = await session.execute(
+            select(SentTest)
+            .join(Test, Test.id == SentTest.test_id)
+            .where(
+                SentTest.receiver_username == receiver_username,
+                SentTest.sender_username == sender_username,
+                SentTest.status.in_(PENDING_STATUSES),
+            )
+            .order_by(SentTest.created_at.desc())
+        )
+        return list(result.scalars().all())
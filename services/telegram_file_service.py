@@ -0,0 +1,172 @@
+# services/telegram_file_service.py
+
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram import types
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from core import log, settings
+from core.models import TelegramFile, db_helper
+
+
+_MEDIA_URL_PREFIX = f"{settings.media.base_url}/app/"
+_MEDIA_ROOT = settings.media.directory  # The quiz pictures are stored under it too
+
+
+@dataclass(frozen=True, slots=True)
+class LocalFile:
+    path: str
+    stat_key: tuple[int, int]  # (mtime_ns, size), the file is hashed again when it changes
+    content_hash: str
+
+
+# Both are bounded by the number of the media files uploaded from the admin panel
+# path -> LocalFile
+_local_files: dict[str, LocalFile] = {}
+# (path, content_hash, media_type) -> file_id, None if the file has no file_id yet
+_file_ids: dict[tuple[str, str, str], Optional[str]] = {}
+_NOT_CACHED = object()
+
+
+def get_media_type(media_url: str) -> str:
+    """Type the media is sent as, by the file extension"""
+    file_ext = media_url.split('.')[-1].lower()
+    if file_ext in ['jpg', 'jpeg', 'png']:
+        return "photo"
+    elif file_ext == 'gif':
+        return "animation"
+    return "video"
+
+
+def get_local_path(media_url: str) -> Optional[str]:
+    """Path of the file served by our media mount, None for the external URLs"""
+    if not media_url.startswith(_MEDIA_URL_PREFIX):
+        return None
+    path = os.path.normpath(media_url[len(_MEDIA_URL_PREFIX):])
+    if not path.startswith(_MEDIA_ROOT + os.sep):
+        return None
+    return path
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def _get_local_file(path: str) -> Optional[LocalFile]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    local_file = _local_files.get(path)
+    if local_file is None or local_file.stat_key != stat_key:
+        content_hash = await asyncio.to_thread(_hash_file, path)
+        local_file = _local_files[path] = LocalFile(path=path, stat_key=stat_key, content_hash=content_hash)
+    return local_file
+
+
+def _get_sent_file(message: types.Message, media_type: str):
+    if media_type == "photo":
+        return message.photo[-1] if message.photo else None
+    if media_type == "animation":
+        return message.animation or message.document
+    return message.video
+
+
+class TelegramFileService:
+    """
+    Reuses the file_id Telegram gives on the first send of our media instead of the URL,
+    so Telegram doesn't download the file from the media mount on every render.
+    """
+
+    @staticmethod
+    async def get_file_id(media_url: str, media_type: str) -> Optional[str]:
+        """
+        :return: file_id of the media file, None if it was never sent as the media_type or is not a local file
+        """
+        path = get_local_path(media_url)
+        if path is None:
+            return None
+        local_file = await _get_local_file(path)
+        if local_file is None:
+            return None
+
+        key = (local_file.path, local_file.content_hash, media_type)
+        file_id = _file_ids.get(key, _NOT_CACHED)
+        if file_id is not _NOT_CACHED:
+            return file_id
+
+        async with db_helper.db_session() as session:
+            file_id = await session.scalar(
+                select(TelegramFile.file_id).where(
+                    TelegramFile.file_path == local_file.path,
+                    TelegramFile.content_hash == local_file.content_hash,
+                    TelegramFile.media_type == media_type,
+                    TelegramFile.is_active == True,
+                )
+            )
+        # The miss is cached too, until remember() stores the file_id of the first send by URL
+        _file_ids[key] = file_id or None
+        return _file_ids[key]
+
+    @staticmethod
+    async def remember(media_url: str, media_type: str, sent: types.Message | bool | None) -> None:
+        """Store the file_id of the media sent by URL, sent is the result of the send / edit call"""
+        if not isinstance(sent, types.Message):
+            return
+        sent_file = _get_sent_file(sent, media_type)
+        path = get_local_path(media_url)
+        local_file = _local_files.get(path) if path else None
+        if sent_file is None or local_file is None:
+            return
+
+        _file_ids[(local_file.path, local_file.content_hash, media_type)] = sent_file.file_id
+        stmt = insert(TelegramFile).values(
+            file_path=local_file.path,
+            content_hash=local_file.content_hash,
+            media_type=media_type,
+            file_id=sent_file.file_id,
+            file_unique_id=sent_file.file_unique_id,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TelegramFile.file_path, TelegramFile.content_hash, TelegramFile.media_type],
+            set_={
+                "file_id": stmt.excluded.file_id,
+                "file_unique_id": stmt.excluded.file_unique_id,
+                "is_active": True,
+                "updated_at": func.now(),
+            },
+        )
+        async with db_helper.db_session() as session:
+            await session.execute(stmt)
+            await session.commit()
+        log.debug("Stored file_id of %s as %s", local_file.path, media_type)
+
+    @staticmethod
+    async def forget(media_url: str, media_type: str) -> None:
+        """Drop the file_id Telegram doesn't accept anymore, the next send goes by URL"""
+        path = get_local_path(media_url)
+        local_file = _local_files.get(path) if path else None
+        if local_file is None:
+            return
+
+        _file_ids[(local_file.path, local_file.content_hash, media_type)] = None
+        async with db_helper.db_session() as session:
+            await session.execute(
+                delete(TelegramFile).where(
+                    TelegramFile.file_path == local_file.path,
+                    TelegramFile.content_hash == local_file.content_hash,
+                    TelegramFile.media_type == media_type,
+                )
+            )
+            await session.commit()
@@ -1,72 +1,117 @@
 # services/text_service.py
 
-from random import shuffle
+from random import choice, shuffle
 
-from sqlalchemy import func, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional, List
+from sqlalchemy.orm import selectinload
+from typing import Optional
 
 from core import log
 from core.models.text import Text
 from core.models.media import Media
 from core.config import settings
+from services.cluster_service import cluster
+from utils import TTLCache
+
+
+TEXTS_CACHE = "texts"  # Name of the cache for cluster.invalidate_cache()
+
+# Content by context_marker, invalidated from the admin panel on Text / Media changes
+_content_cache = TTLCache(maxsize=settings.cache.content_max_size, ttl=settings.cache.content_ttl_seconds)
+_NOT_CACHED = object()
+_DEFAULT_MEDIA_KEY = ("__default_media__",)  # Not a str, can't clash with a context_marker
 
 
 class TextService:
     @staticmethod
-    async def get_text_by_marker(context_marker: str, session: AsyncSession) -> Optional[Text]:
-        try:
-            result = await session.execute(
-                select(Text).where(Text.context_marker == context_marker, Text.is_active == True)
-            )
-            return result.scalar_one_or_none()
-        except Exception as e:
-            log.exception(f"Error in get_text_by_marker: {e}")
-            return None
+    def content_version() -> int:
+        """Current version of the cached content, changes on every invalidation"""
+        return _content_cache.version
 
     @staticmethod
-    async def get_media_urls(text: Text, session: AsyncSession) -> List[str]:
-        media_urls = []
-        await session.refresh(text, ['media_files'])
-        for media in text.media_files:
-            if media.is_active:
-                full_url = f"{settings.media.base_url}/app/{media.file}"
-                media_urls.append(full_url)
-        return media_urls
+    def invalidate_cache() -> None:
+        version = _content_cache.invalidate()
+        log.info("Text content cache invalidated, new version: %s", version)
 
     @staticmethod
-    async def get_text_with_media(context_marker: str, session: AsyncSession) -> Optional[dict]:
-        text = await TextService.get_text_by_marker(context_marker, session)
+    async def _load_content(context_marker: str, session: AsyncSession) -> Optional[tuple]:
+        result = await session.execute(
+            select(Text)
+            .options(selectinload(Text.media_files))
+            .where(Text.context_marker == context_marker, Text.is_active == True)
+        )
+        text = result.scalar_one_or_none()
         if not text:
             return None
 
-        media_urls = await TextService.get_media_urls(text, session)
-        
+        media_urls = tuple(
+            f"{settings.media.base_url}/app/{media.file}"
+            for media in text.media_files
+            if media.is_active
+        )
+        return text.body, media_urls, text.reading_pagination if text.reading_pagination else None
+
+    @staticmethod
+    async def get_text_with_media(context_marker: str, session: AsyncSession) -> Optional[dict]:
+        version = _content_cache.version
+        content = _content_cache.get(context_marker, _NOT_CACHED)
+
+        if content is _NOT_CACHED:
+            try:
+                content = await TextService._load_content(context_marker, session)
+            except Exception as e:
+                log.exception(f"Error in get_text_with_media: {e}")
+                return None
+
+            # Missing markers are cached too, unless the admin changed something while we were loading
+            if version == _content_cache.version:
+                _content_cache.set(context_marker, content)
+
+        if content is None:
+            return None
+
+        body, media_urls, chunk_size = content
+        media_urls = list(media_urls)
+
         if len(media_urls) > 1:
             shuffle(media_urls)
 
-        log.debug("Text content: %s", text.body)
+        log.debug("Text content: %s", body)
 
         return {
-            "text": text.body,
+            "text": body,
             "media_urls": media_urls,
-            "chunk_size": text.reading_pagination if text.reading_pagination else None
+            "chunk_size": chunk_size,
+            "version": version,
         }
 
+    @staticmethod
+    async def _load_default_media(session: AsyncSession) -> tuple[str, ...]:
+        result = await session.execute(
+            select(Media.file)
+            .join(Text.media_files)
+            .where(Text.is_default_media == True, Media.is_active == True)
+            .distinct()
+        )
+        return tuple(f"{settings.media.base_url}/app/{file}" for file in result.scalars())
+
     @staticmethod
     async def get_default_media(session: AsyncSession) -> Optional[str]:
-        try:
-            result = await session.execute(
-                select(Media)
-                .join(Text.media_files)
-                .where(Text.is_default_media == True, Media.is_active == True)
-                .order_by(func.random())
-                .limit(1)
-            )
-            default_media = result.scalar_one_or_none()
-            if default_media:
-                return f"{settings.media.base_url}/app/{default_media.file}"
-            return None
-        except Exception as e:
-            log.exception(f"Error in get_default_media: {e}")
-            return None
+        """Random default media, the candidates are loaded once and dropped with the rest of the content cache"""
+        version = _content_cache.version
+        media_urls = _content_cache.get(_DEFAULT_MEDIA_KEY)
+
+        if media_urls is None:
+            try:
+                media_urls = await TextService._load_default_media(session)
+            except Exception as e:
+                log.exception(f"Error in get_default_media: {e}")
+                return None
+
+            if version == _content_cache.version:
+                _content_cache.set(_DEFAULT_MEDIA_KEY, media_urls)
+
+        return choice(media_urls) if media_urls else None
+
+cluster.register_cache(TEXTS_CACHE, TextService.invalidate_cache)
@@ -0,0 +1,185 @@
+# services/update_dispatcher.py
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from core import log
+
+
+@dataclass
+class UpdateDispatcherStats:
+    received: int = 0
+    processed: int = 0
+    failed: int = 0
+    rejected: int = 0  # Not accepted because the queue was full or the dispatcher is stopping
+    duplicates: int = 0  # Repeated taps of the same button dropped before they reached the handlers
+    pending: int = 0  # Accepted and not processed yet
+    max_pending: int = 0  # High watermark of pending since the start
+    wait_seconds_total: float = 0.0  # Time between acceptance and processing start, summed
+
+    @property
+    def avg_wait_ms(self) -> float:
+        handled = self.processed + self.failed
+        return self.wait_seconds_total / handled * 1000 if handled else 0.0
+
+
+def get_lane_key(update: Update) -> int:
+    """Updates of the same chat are handled one by one in the order they came, updates without a chat in parallel"""
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query:
+        if update.callback_query.message:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    return -update.update_id
+
+
+def get_tap_signature(update: Update) -> tuple[int, str] | None:
+    """Button tap identity: the same button of the same message"""
+    callback_query = update.callback_query
+    if callback_query and callback_query.message and callback_query.data is not None:
+        return callback_query.message.message_id, callback_query.data
+    return None
+
+
+class _Lane:
+    __slots__ = ("updates", "in_flight")
+
+    def __init__(self):
+        self.updates: deque[tuple[float, Update]] = deque()
+        self.in_flight: tuple[int, str] | None = None  # Tap signature of the update being handled
+
+    def has_tap(self, signature: tuple[int, str]) -> bool:
+        return self.in_flight == signature or any(get_tap_signature(update) == signature for _, update in self.updates)
+
+
+class UpdateDispatcher:
+    """
+    Bounded in-process queue between the webhook endpoint and the aiogram Dispatcher.
+
+    The webhook answers Telegram as soon as the update is accepted, handlers run on a pool of workers.
+    Every chat has a lane (FIFO of the pending updates), a lane is taken by one worker at a time, so two quick
+    taps in the same chat never race on the FSM state while different chats are handled in parallel.
+    The number of workers caps the number of updates handled at once.
+    A tap on the button which is already queued or being handled in the chat is answered and dropped.
+    """
+    def __init__(self, dp: Dispatcher, bot: Bot, max_pending: int, workers: int):
+        self.dp = dp
+        self.bot = bot
+        self.max_pending = max_pending
+        self.workers = workers
+        self.stats = UpdateDispatcherStats()
+
+        self._lanes: dict[int, _Lane] = {}
+        self._ready: asyncio.Queue[int] = asyncio.Queue()  # Keys of the lanes waiting for a worker
+        self._tasks: list[asyncio.Task] = []
+        self._answer_tasks: set[asyncio.Task] = set()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._accepting = False
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._accepting = True
+        log.info("Update dispatcher started with %s workers, max %s pending updates", self.workers, self.max_pending)
+
+    def submit(self, update: Update) -> bool:
+        """
+        Queue the update, never waits.
+
+        :return: False if the update was not accepted and Telegram should deliver it again later
+        """
+        self.stats.received += 1
+        if not self._accepting or self.stats.pending >= self.max_pending:
+            self.stats.rejected += 1
+            log.warning("Update %s rejected, %s updates pending", update.update_id, self.stats.pending)
+            return False
+
+        key = get_lane_key(update)
+        lane = self._lanes.get(key)
+
+        signature = get_tap_signature(update)
+        if lane is not None and signature is not None and lane.has_tap(signature):
+            self.stats.duplicates += 1
+            self._answer_duplicate(update)
+            return True
+
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+            self._ready.put_nowait(key)
+        lane.updates.append((time.monotonic(), update))
+
+        self.stats.pending += 1
+        self.stats.max_pending = max(self.stats.max_pending, self.stats.pending)
+        self._drained.clear()
+        return True
+
+    async def put(self, update: Update) -> bool:
+        """
+        Queue the update, wait for room if the queue is full.
+        Used by the polling runner, which can hold the next getUpdates call instead of dropping updates.
+
+        :return: False if the dispatcher is stopping
+        """
+        while self._accepting and self.stats.pending >= self.max_pending:
+            self._has_room.clear()
+            await self._has_room.wait()
+        return self.submit(update)
+
+    async def stop(self, timeout: float) -> None:
+        """Stop accepting updates and let the workers finish the pending ones"""
+        self._accepting = False
+        self._has_room.set()  # Release the waiting put() calls
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("Update dispatcher stopped with %s updates pending", self.stats.pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        log.info("Update dispatcher stopped: %s", self.stats)
+
+    def _answer_duplicate(self, update: Update) -> None:
+        """Stop the loading spinner of the dropped tap, the first tap is still handled as usual"""
+        task = asyncio.create_task(self.bot.answer_callback_query(update.callback_query.id))
+        self._answer_tasks.add(task)
+        task.add_done_callback(self._on_answer_done)
+
+    def _on_answer_done(self, task: asyncio.Task) -> None:
+        self._answer_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            log.debug(f"Failed to answer the duplicate callback: {task.exception()}")
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            accepted_at, update = lane.updates.popleft()
+            lane.in_flight = get_tap_signature(update)
+            self.stats.wait_seconds_total += time.monotonic() - accepted_at
+
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.stats.processed += 1
+            except Exception as e:
+                self.stats.failed += 1
+                log.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                # The lane goes to the end of the ready queue, a busy chat can't hold a worker forever
+                lane.in_flight = None
+                if lane.updates:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+                self.stats.pending -= 1
+                self._has_room.set()
+                if not self.stats.pending:
+                    self._drained.set()
@@ -1,46 +1,121 @@
 # services/user_service.py
 
-from sqlalchemy import select, update
-from async_lru import alru_cache
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+from sqlalchemy import func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
 
 from core import log, settings
 from core.models import User, db_helper
+from services.cluster_service import cluster
+from utils import TTLCache
+
+
+@dataclass(frozen=True, slots=True)
+class UserInfo:
+    """Read-only copy of the User row, cached between updates instead of detached ORM objects"""
+    id: uuid.UUID
+    chat_id: int
+    username: str | None
+    is_superuser: bool
+    is_new_user: bool
+
+
+USERS_CACHE = "users"
+
+# chat_id -> UserInfo, every write of the service updates or drops the entry
+_users_cache = TTLCache(maxsize=settings.cache.users_max_size, ttl=settings.cache.users_ttl_seconds)
 
+_USER_INFO_COLUMNS = (User.id, User.chat_id, User.username, User.is_superuser, User.is_new_user)
+
+
+def _to_user_info(row) -> UserInfo:
+    return UserInfo(id=row.id, chat_id=row.chat_id, username=row.username, is_superuser=row.is_superuser, is_new_user=row.is_new_user)
+
+
+def _cache_user(user: UserInfo, version: int) -> None:
+    # Don't store the user if the cache was invalidated while we were loading
+    if version == _users_cache.version:
+        _users_cache.set(user.chat_id, user)
 
-# TODO: Implement caching for user service and others
 
 class UserService:
 
     @staticmethod
-    async def create_user(chat_id: int, username: str | None) -> User:
+    def invalidate_cache(chat_id: int | None = None) -> None:
+        """Drop one user or the whole cache, called on changes made outside of the service like the admin panel"""
+        if chat_id is not None:
+            _users_cache.pop(chat_id)
+            return
+        version = _users_cache.invalidate()
+        log.info("Users cache invalidated, new version: %s", version)
+
+    @staticmethod
+    async def get_or_create_user(chat_id: int, username: str | None) -> tuple[UserInfo | None, bool]:
+        """
+        Get the user and keep the username up to date, create the user on the first visit.
+        No query if the cached user has the same username, otherwise a single upsert.
+
+        :return: User (None on DB errors) and True if the user has just been created
+        """
+        cached = _users_cache.get(chat_id)
+        if cached and cached.username == username:
+            return cached, False
+
+        version = _users_cache.version
         async for session in db_helper.session_getter():
             try:
-                # Check if user exists
-                result = await session.execute(select(User).where(User.chat_id == chat_id))
-                existing_user = result.scalar_one_or_none()
-
-                if existing_user:
-                    log.info("User %s already exists", chat_id)
-                    return existing_user
-
-                user = User(chat_id=chat_id, username=username, is_superuser=False)
-                session.add(user)
+                statement = insert(User).values(chat_id=chat_id, username=username, is_superuser=False, is_new_user=True, is_active=True)
+                result = await session.execute(
+                    statement
+                    .on_conflict_do_update(
+                        index_elements=[User.chat_id],
+                        set_={"username": statement.excluded.username, "updated_at": func.now()},
+                    )
+                    # xmax is 0 only for the rows inserted by this statement
+                    .returning(*_USER_INFO_COLUMNS, literal_column("xmax = 0").label("created"))
+                )
+                row = result.one()
                 await session.commit()
-                await session.refresh(user)
-                return user
+
+                user = _to_user_info(row)
+                _cache_user(user, version)
+                if row.created:
+                    log.info("Created new user: %s, username: %s", chat_id, username)
+                elif cached:
+                    log.info("Updated username for user %s to %s", chat_id, username)
+                return user, row.created
 
             except Exception as e:
-                log.exception(f"Error in create_user: {e}")
+                log.exception(f"Error in get_or_create_user: {e}")
                 await session.rollback()
+                return None, False
             finally:
                 await session.close()
 
-    @staticmethod      # @alru_cache(ttl=settings.bot.max_users_cached_time_seconds, maxsize=settings.bot.max_users_cached)
-    async def get_user(chat_id: int) -> User | None:
+    @staticmethod
+    async def create_user(chat_id: int, username: str | None) -> UserInfo | None:
+        user, _ = await UserService.get_or_create_user(chat_id, username)
+        return user
+
+    @staticmethod
+    async def get_user(chat_id: int) -> UserInfo | None:
+        cached = _users_cache.get(chat_id)
+        if cached:
+            return cached
+
+        version = _users_cache.version
         async for session in db_helper.session_getter():
             try:
-                result = await session.execute(select(User).where(User.chat_id == chat_id))
-                return result.scalar_one_or_none()
+                result = await session.execute(select(*_USER_INFO_COLUMNS).where(User.chat_id == chat_id))
+                row = result.one_or_none()
+                if not row:
+                    return None  # Not cached, the user may be created by another worker
+                user = _to_user_info(row)
+                _cache_user(user, version)
+                return user
             except Exception as e:
                 log.exception(f"Error in get_user: {e}")
             finally:
@@ -58,68 +133,99 @@ class UserService:
                 await session.close()
 
     @staticmethod
-    async def is_superuser(chat_id: int) -> bool:
+    async def get_chat_ids_page(after_id: uuid.UUID | None = None, limit: int = 1000) -> list[tuple[uuid.UUID, int]]:
+        """
+        Get the next page of users ordered by ID, keyset pagination stays fast on any page.
+
+        :param after_id: ID of the last user of the previous page, None for the first page
+        :return: (user ID, chat ID) pairs
+        """
         async for session in db_helper.session_getter():
             try:
-                result = await session.execute(select(User).where(User.chat_id == chat_id))
-                user = result.scalar_one_or_none()
-                return user is not None and user.is_superuser
-            except Exception as e:
-                log.exception(f"Error in is_superuser: {e}")
+                query = select(User.id, User.chat_id).order_by(User.id).limit(limit)
+                if after_id is not None:
+                    query = query.where(User.id > after_id)
+                result = await session.execute(query)
+                return [(user_id, int(chat_id)) for user_id, chat_id in result.all()]
             finally:
                 await session.close()
 
     @staticmethod
-    async def update_username(chat_id: int, new_username: str | None) -> bool:
-        async for session in db_helper.session_getter():
-            try:
-                user = await session.execute(select(User).where(User.chat_id == chat_id))
-                user = user.scalar_one_or_none()
-                if user:
-                    user.username = new_username
-                    await session.commit()
-                    log.info("Updated username for user %s to %s", chat_id, new_username)
-                    
-                    # Clear cache for updated user
-                    # UserService.get_user.cache_clear()
-                    # UserService.create_user.cache_clear()
-
-                    return True
-                
-                else:
-                    log.warning(f"User {chat_id} not found for username update")
-                    return False
-            except Exception as e:
-                log.exception(f"Error in update_username: {e}")
-                await session.rollback()
-                return False
-            finally:
-                await session.close()
+    async def iter_chat_ids(batch_size: int = 1000) -> AsyncIterator[int]:
+        """
+        Stream chat IDs of all users without loading User objects.
+        The connection is held only while a page is read, not while the caller processes it.
+        """
+        after_id = None
+        while True:
+            page = await UserService.get_chat_ids_page(after_id, batch_size)
+            if not page:
+                return
+            for _, chat_id in page:
+                yield chat_id
+            if len(page) < batch_size:
+                return
+            after_id = page[-1][0]
 
     @staticmethod
-    async def mark_user_as_not_new(chat_id: int) -> bool:
+    async def is_superuser(chat_id: int) -> bool:
+        user = await UserService.get_user(chat_id)
+        return user is not None and user.is_superuser
+
+    @staticmethod
+    async def _update_user(chat_id: int, **values) -> UserInfo | None:
+        """Update the user with one statement and put the new state into the cache"""
+        version = _users_cache.version
         async for session in db_helper.session_getter():
             try:
                 result = await session.execute(
                     update(User)
                     .where(User.chat_id == chat_id)
-                    .values(is_new_user=False)
+                    .values(**values)
+                    .returning(*_USER_INFO_COLUMNS)
                 )
+                row = result.one_or_none()
                 await session.commit()
-                if result.rowcount > 0:
-                    log.info(f"Marked user {chat_id} as not new")
-                    
-                    # Clear cache for updated user
-                    # UserService.get_user.cache_clear()
-
-                    return True
-                
-                else:
-                    log.warning(f"User {chat_id} not found for marking as not new")
-                    return False
-            except Exception as e:
-                log.exception(f"Error in mark_user_as_not_new: {e}")
+                if not row:
+                    _users_cache.pop(chat_id)
+                    return None
+                user = _to_user_info(row)
+                _cache_user(user, version)
+                return user
+            except Exception:
                 await session.rollback()
-                return False
+                _users_cache.pop(chat_id)
+                raise
             finally:
                 await session.close()
+
+    @staticmethod
+    async def update_username(chat_id: int, new_username: str | None) -> bool:
+        try:
+            if await UserService._update_user(chat_id, username=new_username):
+                log.info("Updated username for user %s to %s", chat_id, new_username)
+                return True
+            log.warning(f"User {chat_id} not found for username update")
+            return False
+        except Exception as e:
+            log.exception(f"Error in update_username: {e}")
+            return False
+
+    @staticmethod
+    async def mark_user_as_not_new(chat_id: int) -> bool:
+        cached = _users_cache.get(chat_id)
+        if cached and not cached.is_new_user:
+            return True
+
+        try:
+            if await UserService._update_user(chat_id, is_new_user=False):
+                log.info(f"Marked user {chat_id} as not new")
+                return True
+            log.warning(f"User {chat_id} not found for marking as not new")
+            return False
+        except Exception as e:
+            log.exception(f"Error in mark_user_as_not_new: {e}")
+            return False
+
+
+cluster.register_cache(USERS_CACHE, UserService.invalidate_cache)
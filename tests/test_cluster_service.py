@@ -0,0 +1,40 @@
+# tests/test_cluster_service.py
+
+import asyncio
+
+import orjson
+
+from services.cluster_service import CACHE_INVALIDATION_CHANNEL, ClusterCoordinator
+
+
+def make_cluster() -> tuple[ClusterCoordinator, list[str]]:
+    cluster = ClusterCoordinator()
+    dropped = []
+    cluster.register_cache("texts", lambda: dropped.append("texts"))
+    cluster.register_cache("users", lambda: dropped.append("users"))
+    return cluster, dropped
+
+
+def notify(cluster: ClusterCoordinator, payload: str) -> None:
+    cluster._on_notification(None, 1, CACHE_INVALIDATION_CHANNEL, payload)
+
+
+def test_notification_of_another_worker_drops_the_cache():
+    cluster, dropped = make_cluster()
+    notify(cluster, orjson.dumps({"origin": "other", "name": "texts"}).decode())
+    assert dropped == ["texts"]
+
+
+def test_own_and_broken_notifications_are_ignored():
+    cluster, dropped = make_cluster()
+    notify(cluster, orjson.dumps({"origin": cluster.instance_id, "name": "texts"}).decode())
+    notify(cluster, orjson.dumps({"origin": "other", "name": "unknown"}).decode())
+    notify(cluster, "not json")
+    assert dropped == []
+
+
+def test_invalidate_without_connection_drops_the_local_cache():
+    cluster, dropped = make_cluster()
+    asyncio.run(cluster.invalidate_cache("users"))
+    assert dropped == ["users"]
+    assert not asyncio.run(cluster.try_acquire_leadership())
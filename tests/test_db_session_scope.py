@@ -0,0 +1,153 @@
+# tests/test_db_session_scope.py
+
+import asyncio
+import importlib
+
+import pytest
+from sqlalchemy import Column, Integer, String, event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.models.db_helper import DataBaseHelper, SharedSession
+
+# core.models exports the db_helper instance under the module name
+db_helper_module = importlib.import_module("core.models.db_helper")
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Item(Base):
+    __tablename__ = "items"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+@pytest.fixture
+def helper(tmp_path, monkeypatch):
+    # The helper takes the pool settings of Postgres, SQLite gets no pool by default
+    monkeypatch.setattr(
+        db_helper_module, "create_async_engine",
+        lambda **kwargs: create_async_engine(poolclass=AsyncAdaptedQueuePool, **kwargs),
+    )
+    helper = DataBaseHelper(url=f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", echo=False, pool_size=2, max_overflow=0)
+
+    # pysqlite manages the transactions itself and breaks SAVEPOINT, let SQLAlchemy emit BEGIN instead
+    @event.listens_for(helper.engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(helper.engine.sync_engine, "begin")
+    def on_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    async def create_tables():
+        async with helper.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        await helper.dispose()  # Every test runs its own event loop
+
+    asyncio.run(create_tables())
+    yield helper
+    asyncio.run(helper.dispose())
+
+
+async def get_names(helper: DataBaseHelper) -> list[str]:
+    async with helper.session_factory() as session:
+        return sorted(await session.scalars(select(Item.name)))
+
+
+def test_failing_helper_keeps_the_earlier_writes(helper):
+    async def run():
+        async with helper.session_scope():
+            async with helper.db_session() as session:
+                session.add(Item(name="first"))
+                await session.commit()
+
+            # Fails on the unique name, db_session rolls back and swallows the error
+            async with helper.db_session() as session:
+                session.add(Item(name="first"))
+                await session.commit()
+
+            async with helper.db_session() as session:
+                session.add(Item(name="second"))
+                await session.commit()
+
+        return await get_names(helper)
+
+    assert asyncio.run(run()) == ["first", "second"]
+
+
+def test_rollback_undoes_only_the_writes_since_the_last_commit(helper):
+    async def run():
+        async with helper.session_scope():
+            async with helper.db_session() as session:
+                session.add(Item(name="kept"))
+                await session.commit()
+
+                session.add(Item(name="undone"))
+                await session.flush()
+                await session.rollback()
+
+                session.add(Item(name="left for the scope"))
+
+        return await get_names(helper)
+
+    assert asyncio.run(run()) == ["kept", "left for the scope"]
+
+
+def test_scope_error_rolls_back_everything(helper):
+    async def run():
+        with pytest.raises(RuntimeError):
+            async with helper.session_scope():
+                async with helper.db_session() as session:
+                    session.add(Item(name="committed by the service"))
+                    await session.commit()
+                raise RuntimeError("handler failed")
+
+        return await get_names(helper)
+
+    assert asyncio.run(run()) == []
+
+
+def test_session_is_shared_by_the_scope_task_only(helper):
+    async def get_session():
+        async with helper.db_session() as session:
+            return session
+
+    async def run():
+        async with helper.session_scope():
+            first = await get_session()
+            second = await get_session()
+            spawned = await asyncio.create_task(get_session())
+
+        after = await get_session()
+        return first, second, spawned, after
+
+    first, second, spawned, after = asyncio.run(run())
+    assert isinstance(first, SharedSession)
+    assert first is second
+    assert not isinstance(spawned, SharedSession)
+    assert not isinstance(after, SharedSession)
+
+
+def test_session_getter_shares_the_session_and_its_savepoint(helper):
+    async def run():
+        async with helper.session_scope():
+            async for session in helper.session_getter():
+                session.add(Item(name="getter"))
+                await session.commit()
+                break  # Handlers leave the loop early, the generator is never finished
+
+            async with helper.db_session() as session:
+                session.add(Item(name="getter"))
+                with pytest.raises(IntegrityError):
+                    await session.commit()
+                await session.rollback()
+
+        return await get_names(helper)
+
+    assert asyncio.run(run()) == ["getter"]
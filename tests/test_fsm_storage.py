@@ -0,0 +1,120 @@
+# tests/test_fsm_storage.py
+
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from aiogram import types
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from fakeredis.aioredis import FakeRedis
+
+from core import settings
+from core.models.fsm_storage import CompactRedisStorage, create_fsm_storage
+from services.broadcast_service import BroadcastStep, dump_broadcast, load_broadcast
+
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+
+def make_storage(codec: str) -> CompactRedisStorage:
+    return CompactRedisStorage(redis=FakeRedis(), codec=codec, state_ttl=600, data_ttl=300)
+
+
+@pytest.mark.parametrize("codec", ["orjson", "msgpack"])
+def test_state_and_data_round_trip(codec):
+    data = {
+        "question_ids": ["a", "b", "c"],
+        "cursor": 2,
+        "scores": {"1": 3, "2": None},
+        "nested": [{"flag": True, "ratio": 0.5}],
+    }
+
+    async def run():
+        storage = make_storage(codec)
+        await storage.set_state(KEY, "QuizStates:question")
+        await storage.set_data(KEY, data)
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+
+    assert asyncio.run(run()) == ("QuizStates:question", data)
+
+
+@pytest.mark.parametrize("codec", ["orjson", "msgpack"])
+def test_uuid_and_datetime_are_stored_as_strings(codec):
+    test_id = uuid.uuid4()
+    started_at = datetime(2024, 12, 1, 12, 30)
+
+    async def run():
+        storage = make_storage(codec)
+        await storage.set_data(KEY, {"test_id": test_id, "started_at": started_at})
+        return await storage.get_data(KEY)
+
+    data = asyncio.run(run())
+    assert uuid.UUID(data["test_id"]) == test_id
+    assert datetime.fromisoformat(data["started_at"]) == started_at
+
+
+@pytest.mark.parametrize("codec", ["orjson", "msgpack"])
+def test_broadcast_draft_survives_the_round_trip(codec):
+    steps = [
+        BroadcastStep("send_message", {"text": "<b>News</b>", "parse_mode": "HTML"}),
+        BroadcastStep("send_media_group", {"media": [
+            types.InputMediaPhoto(media="photo-file-id", caption="first"),
+            types.InputMediaVideo(media="video-file-id"),
+        ]}, cost=2),
+        BroadcastStep("send_location", {"latitude": 55.75, "longitude": 37.61}),
+    ]
+
+    async def run():
+        storage = make_storage(codec)
+        await storage.set_data(KEY, {"broadcast": dump_broadcast(steps)})
+        return load_broadcast((await storage.get_data(KEY))["broadcast"])
+
+    assert asyncio.run(run()) == steps
+
+
+def test_empty_data_deletes_the_key():
+    async def run():
+        storage = make_storage("orjson")
+        await storage.set_data(KEY, {"cursor": 1})
+        await storage.set_data(KEY, {})
+        return await storage.get_data(KEY), await storage.redis.exists(storage.key_builder.build(KEY, "data"))
+
+    assert asyncio.run(run()) == ({}, 0)
+
+
+def test_every_key_gets_its_ttl():
+    async def run():
+        storage = make_storage("msgpack")
+        await storage.set_state(KEY, "QuizStates:question")
+        await storage.set_data(KEY, {"cursor": 1})
+        return (
+            await storage.redis.ttl(storage.key_builder.build(KEY, "state")),
+            await storage.redis.ttl(storage.key_builder.build(KEY, "data")),
+        )
+
+    state_ttl, data_ttl = asyncio.run(run())
+    assert 590 < state_ttl <= 600
+    assert 290 < data_ttl <= 300
+
+
+def test_create_fsm_storage_memory(monkeypatch):
+    monkeypatch.setattr(settings.fsm, "storage", "memory")
+    assert isinstance(create_fsm_storage(), MemoryStorage)
+
+
+def test_create_fsm_storage_redis(monkeypatch):
+    monkeypatch.setattr(settings.fsm, "storage", "redis")
+    monkeypatch.setattr(settings.fsm, "codec", "msgpack")
+    monkeypatch.setattr(settings.fsm, "key_prefix", "test_fsm")
+    monkeypatch.setattr(settings.fsm, "state_ttl_seconds", 123)
+    monkeypatch.setattr(settings.fsm, "data_ttl_seconds", 45)
+
+    storage = create_fsm_storage()
+    assert isinstance(storage, CompactRedisStorage)
+    assert storage.state_ttl == 123
+    assert storage.data_ttl == 45
+    assert storage.key_builder.build(KEY, "data").startswith("test_fsm:")
+    # The codec of the settings, msgpack output is not JSON
+    assert storage._dumps({"cursor": 1}) == b"\x81\xa6cursor\x01"
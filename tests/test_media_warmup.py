@@ -0,0 +1,99 @@
+# tests/test_media_warmup.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendPhoto
+
+from core import settings
+from services import media_warmup
+from services.media_warmup import warm_up_media
+
+
+MEDIA_URL = f"{settings.media.base_url}/app/"
+
+
+class FakeBot:
+    def __init__(self, flood_times: int = 0):
+        self.sent: list[str] = []
+        self.deleted: list[int] = []
+        self.flood_times = flood_times
+
+    async def send_photo(self, chat_id, photo, disable_notification):
+        if self.flood_times:
+            self.flood_times -= 1
+            raise TelegramRetryAfter(method=SendPhoto(chat_id=chat_id, photo="x"), message="Flood", retry_after=0)
+        self.sent.append(photo.path)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    """Two pictures on the disk, one of them already has a file_id"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "media").mkdir()
+    for name in ("new.jpg", "cached.jpg"):
+        (tmp_path / "media" / name).write_bytes(b"picture")
+
+    remembered = []
+
+    async def get_file_id(media_url, media_type):
+        return "file-id" if media_url.endswith("cached.jpg") else None
+
+    async def remember(media_url, media_type, sent):
+        remembered.append(media_url)
+
+    async def collect_media_urls():
+        return [f"{MEDIA_URL}media/{name}" for name in ("new.jpg", "cached.jpg", "missing.jpg")]
+
+    monkeypatch.setattr(media_warmup.TelegramFileService, "get_file_id", staticmethod(get_file_id))
+    monkeypatch.setattr(media_warmup.TelegramFileService, "remember", staticmethod(remember))
+    monkeypatch.setattr(media_warmup, "collect_media_urls", collect_media_urls)
+    return remembered
+
+
+def test_uploads_only_the_files_without_file_id(media):
+    bot = FakeBot()
+    stats = asyncio.run(warm_up_media(bot, chat_id=1, concurrency=2))
+
+    assert (stats.total, stats.uploaded, stats.cached, stats.missing, stats.failed) == (3, 1, 1, 1, 0)
+    assert bot.sent == ["media/new.jpg"]
+    assert bot.deleted == [1]
+    assert media == [f"{MEDIA_URL}media/new.jpg"]
+
+
+def test_retries_on_flood_control(media):
+    bot = FakeBot(flood_times=1)
+    stats = asyncio.run(warm_up_media(bot, chat_id=1, concurrency=1))
+
+    assert stats.uploaded == 1
+    assert bot.sent == ["media/new.jpg"]
+
+
+def test_file_id_lookups_are_limited_by_the_concurrency(media, monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def get_file_id(media_url, media_type):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return "file-id"
+
+    async def collect_media_urls():
+        return [f"{MEDIA_URL}media/picture{i}.jpg" for i in range(10)]
+
+    monkeypatch.setattr(media_warmup.TelegramFileService, "get_file_id", staticmethod(get_file_id))
+    monkeypatch.setattr(media_warmup, "collect_media_urls", collect_media_urls)
+    monkeypatch.setattr(media_warmup.os.path, "isfile", lambda path: True)
+
+    stats = asyncio.run(warm_up_media(FakeBot(), chat_id=1, concurrency=3))
+    assert stats.cached == 10
+    assert max_in_flight == 3
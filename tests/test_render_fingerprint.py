@@ -0,0 +1,106 @@
+# tests/test_render_fingerprint.py
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageMedia, EditMessageText, SendMessage
+from aiogram.types import Chat, InlineKeyboardButton, InlineKeyboardMarkup, Message, PhotoSize
+
+from handlers import utils
+from handlers.utils import send_or_edit_message
+from utils import TTLCache
+
+
+CHAT = Chat(id=100, type="private")
+
+
+def make_keyboard(text: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=text, callback_data="data")]])
+
+
+class FakeBot:
+    """Records the Bot API calls, edits succeed unless fail_edits is set"""
+    def __init__(self):
+        self.calls: list[str] = []
+        self.edits = 0
+        self.fail_edits = False
+
+    async def __call__(self, method, request_timeout=None):
+        self.calls.append(type(method).__name__)
+        if isinstance(method, (EditMessageText, EditMessageMedia)):
+            if self.fail_edits:
+                raise TelegramBadRequest(method=method, message="Bad Request: message to edit not found")
+            self.edits += 1
+            return self.message(method.message_id, edit_date=1000 + self.edits, photo=isinstance(method, EditMessageMedia))
+        if isinstance(method, SendMessage):
+            return self.message(99)
+        raise AssertionError(f"Unexpected call {method}")
+
+    def message(self, message_id: int, edit_date: int | None = None, photo: bool = False) -> Message:
+        photos = [PhotoSize(file_id="photo", file_unique_id="photo-unique", width=1, height=1)] if photo else None
+        return Message(
+            message_id=message_id, date=datetime.now(), chat=CHAT, edit_date=edit_date, text="text", photo=photos,
+        ).as_(self)
+
+
+@pytest.fixture(autouse=True)
+def renders_cache(monkeypatch):
+    monkeypatch.setattr(utils, "_renders_cache", TTLCache(maxsize=100, ttl=60))
+
+
+def render(message: Message, text: str = "text", keyboard=None, media_url: str | None = None) -> None:
+    asyncio.run(send_or_edit_message(message, text, keyboard, media_url))
+
+
+def edited(bot: FakeBot) -> Message:
+    """The message as the next update brings it, with the edit date of the last edit"""
+    return bot.message(1, edit_date=1000 + bot.edits)
+
+
+def test_same_render_is_edited_once():
+    bot = FakeBot()
+    render(bot.message(1), keyboard=make_keyboard("a"))
+    render(edited(bot), keyboard=make_keyboard("a"))
+    assert bot.calls == ["EditMessageText"]
+
+
+def test_changed_text_or_keyboard_is_edited():
+    bot = FakeBot()
+    render(bot.message(1), keyboard=make_keyboard("a"))
+    render(edited(bot), keyboard=make_keyboard("b"))
+    render(edited(bot), text="other", keyboard=make_keyboard("b"))
+    assert bot.calls == ["EditMessageText"] * 3
+
+
+def test_changed_media_is_edited():
+    bot = FakeBot()
+    message = bot.message(1, photo=True)
+    render(message, media_url="https://example.com/first.jpg")
+    render(bot.message(1, edit_date=1000 + bot.edits, photo=True), media_url="https://example.com/first.jpg")
+    render(bot.message(1, edit_date=1000 + bot.edits, photo=True), media_url="https://example.com/second.jpg")
+    assert bot.calls == ["EditMessageMedia"] * 2
+
+
+def test_changed_edit_date_invalidates_the_render():
+    bot = FakeBot()
+    render(bot.message(1))
+    # Edited since by another worker or outside of send_or_edit_message
+    render(bot.message(1, edit_date=5000))
+    assert bot.calls == ["EditMessageText"] * 2
+
+
+def test_render_is_dropped_after_a_fallback_send():
+    bot = FakeBot()
+    render(bot.message(1))
+
+    bot.fail_edits = True
+    render(edited(bot), text="other")
+    assert bot.calls == ["EditMessageText", "EditMessageText", "SendMessage"]
+    assert utils._renders_cache.get((CHAT.id, 1)) is None
+
+    # The same message and edit date as the cached first render, without the entry it is not skipped
+    bot.fail_edits = False
+    render(edited(bot))
+    assert bot.calls[-1] == "EditMessageText"
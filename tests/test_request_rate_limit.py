@@ -0,0 +1,82 @@
+# tests/test_request_rate_limit.py
+
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+
+from middlewares.request_rate_limit import RequestRateLimitMiddleware, self_rate_limited
+
+
+def make_limiter(max_retries: int = 2) -> RequestRateLimitMiddleware:
+    return RequestRateLimitMiddleware(global_rate=1000, chat_rate=1000, chat_burst=100,
+                                      max_retries=max_retries, retry_jitter=0)
+
+
+class FakeRequest:
+    """make_request of the session, fails with RetryAfter the given number of times"""
+    def __init__(self, flood_times: int = 0, retry_after: int = 0):
+        self.calls = 0
+        self.flood_times = flood_times
+        self.retry_after = retry_after
+
+    async def __call__(self, bot, method):
+        self.calls += 1
+        if self.calls <= self.flood_times:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        return "ok"
+
+
+def test_retry_after_is_retried():
+    limiter = make_limiter(max_retries=2)
+    request = FakeRequest(flood_times=2)
+
+    assert asyncio.run(limiter(request, None, SendMessage(chat_id=1, text="hi"))) == "ok"
+    assert request.calls == 3
+    assert limiter.stats.retries == 2
+    assert limiter.stats.failed == 0
+
+
+def test_retry_after_is_raised_after_the_last_retry():
+    limiter = make_limiter(max_retries=2)
+    request = FakeRequest(flood_times=10)
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(limiter(request, None, SendMessage(chat_id=1, text="hi")))
+    assert request.calls == 3
+    assert limiter.stats.failed == 1
+
+
+def test_retry_after_pauses_the_chat():
+    limiter = make_limiter(max_retries=0)
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(limiter(FakeRequest(flood_times=1, retry_after=5), None, SendMessage(chat_id=1, text="hi")))
+    assert limiter._get_chat_bucket(1).tokens < 0
+    assert limiter._get_chat_bucket(2).tokens > 0
+
+
+def test_self_limited_requests_are_not_retried():
+    limiter = make_limiter(max_retries=2)
+    request = FakeRequest(flood_times=1)
+
+    async def send():
+        with self_rate_limited():
+            return await limiter(request, None, SendMessage(chat_id=1, text="hi"))
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(send())
+    assert request.calls == 1
+    assert limiter.stats.retries == 0
+    # Still counted against the global limit, but not against the chat one
+    assert limiter.stats.requests == 1
+    assert 1 not in limiter._chat_buckets
+
+
+def test_other_methods_are_not_limited():
+    limiter = make_limiter()
+    request = FakeRequest()
+
+    assert asyncio.run(limiter(request, None, AnswerCallbackQuery(callback_query_id="1"))) == "ok"
+    assert limiter.stats.requests == 0
@@ -0,0 +1,50 @@
+# tests/test_result_index.py
+
+import pytest
+
+from services.quiz_service import ResultIndex, ResultInfo
+
+
+def make_result(min_score: int, max_score: int) -> ResultInfo:
+    return ResultInfo(category_id=None, min_score=min_score, max_score=max_score,
+                      text=f"{min_score}-{max_score}", picture=None)
+
+
+@pytest.mark.parametrize("score, expected", [
+    (0, "0-10"),
+    (10, "0-10"),
+    (11, None),
+    (20, "20-30"),
+    (30, "20-30"),
+    (31, None),
+    (-1, None),
+])
+def test_lookup_disjoint_ranges(score, expected):
+    index = ResultIndex([make_result(20, 30), make_result(0, 10)])
+    result = index.lookup(score)
+    assert (result.text if result else None) == expected
+
+
+def test_lookup_overlapping_ranges_prefers_the_latest_start():
+    index = ResultIndex([make_result(0, 10), make_result(5, 15)])
+    assert index.lookup(3).text == "0-10"
+    assert index.lookup(7).text == "5-15"
+    assert index.lookup(12).text == "5-15"
+    assert index.lookup(16) is None
+
+
+def test_lookup_walks_back_to_a_wide_range():
+    # 50 is past the end of 10-20 and 30-40, only the wide range started before them contains it
+    index = ResultIndex([make_result(0, 100), make_result(10, 20), make_result(30, 40)])
+    assert index.lookup(50).text == "0-100"
+    assert index.lookup(15).text == "10-20"
+    assert index.lookup(101) is None
+
+
+def test_lookup_many_and_empty_index():
+    index = ResultIndex([make_result(0, 10), make_result(5, 15)])
+    assert [r.text if r else None for r in index.lookup_many([1, 12, 99])] == ["0-10", "5-15", None]
+
+    empty = ResultIndex([])
+    assert len(empty) == 0
+    assert empty.lookup(0) is None
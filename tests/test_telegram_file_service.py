@@ -0,0 +1,121 @@
+# tests/test_telegram_file_service.py
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from aiogram import types
+
+from core import settings
+from services import telegram_file_service
+from services.telegram_file_service import TelegramFileService, get_local_path, get_media_type
+
+
+MEDIA_URL = f"{settings.media.base_url}/app/"
+
+
+@pytest.mark.parametrize("media_url, expected", [
+    ("picture.jpg", "photo"),
+    ("picture.JPEG", "photo"),
+    ("picture.png", "photo"),
+    ("animation.gif", "animation"),
+    ("video.mp4", "video"),
+    ("video.mov", "video"),
+])
+def test_get_media_type(media_url, expected):
+    assert get_media_type(media_url) == expected
+
+
+def test_get_local_path_of_our_media():
+    assert get_local_path(f"{MEDIA_URL}media/picture.jpg") == "media/picture.jpg"
+    assert get_local_path(f"{MEDIA_URL}media/quiz/question.png") == "media/quiz/question.png"
+
+
+@pytest.mark.parametrize("media_url", [
+    "https://example.com/app/media/picture.jpg",  # External URL
+    f"{MEDIA_URL}static/picture.jpg",  # Not under the media root
+    f"{MEDIA_URL}media/../core/config.py",  # Out of the media root
+    f"{MEDIA_URL}media",
+])
+def test_get_local_path_rejects_other_files(media_url):
+    assert get_local_path(media_url) is None
+
+
+@pytest.mark.parametrize("root, expected", [
+    ("app/media", "media"),
+    ("app/files/", "files"),
+    ("media", "media"),
+    ("./app-data/media", "app-data/media"),
+])
+def test_media_directory(root, expected):
+    assert settings.media.model_copy(update={"root": root}).directory == expected
+
+
+class FakeSession:
+    def __init__(self, file_id):
+        self.file_id = file_id
+        self.queries = 0
+
+    async def scalar(self, statement):
+        self.queries += 1
+        return self.file_id
+
+    async def execute(self, statement):
+        self.queries += 1
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A media file on the disk and a DB without its file_id"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "media").mkdir()
+    (tmp_path / "media" / "picture.jpg").write_bytes(b"picture")
+    monkeypatch.setattr(telegram_file_service, "_local_files", {})
+    monkeypatch.setattr(telegram_file_service, "_file_ids", {})
+
+    session = FakeSession(file_id=None)
+
+    @asynccontextmanager
+    async def db_session():
+        yield session
+
+    monkeypatch.setattr(telegram_file_service.db_helper, "db_session", db_session)
+    return session
+
+
+def sent_photo(file_id: str) -> types.Message:
+    return types.Message(
+        message_id=1, date=datetime.now(), chat=types.Chat(id=1, type="private"),
+        photo=[types.PhotoSize(file_id=file_id, file_unique_id=f"{file_id}-unique", width=1, height=1)],
+    )
+
+
+def test_missing_file_id_is_looked_up_once(db):
+    media_url = f"{MEDIA_URL}media/picture.jpg"
+
+    async def run():
+        first = await TelegramFileService.get_file_id(media_url, "photo")
+        second = await TelegramFileService.get_file_id(media_url, "photo")
+        return first, second
+
+    assert asyncio.run(run()) == (None, None)
+    assert db.queries == 1
+
+
+def test_remember_and_forget_replace_the_cached_miss(db):
+    media_url = f"{MEDIA_URL}media/picture.jpg"
+
+    async def run():
+        await TelegramFileService.get_file_id(media_url, "photo")
+        await TelegramFileService.remember(media_url, "photo", sent_photo("file-1"))
+        remembered = await TelegramFileService.get_file_id(media_url, "photo")
+        await TelegramFileService.forget(media_url, "photo")
+        forgotten = await TelegramFileService.get_file_id(media_url, "photo")
+        return remembered, forgotten
+
+    assert asyncio.run(run()) == ("file-1", None)
+    assert db.queries == 3  # The first lookup, the upsert and the delete
@@ -0,0 +1,65 @@
+# tests/test_token_bucket.py
+
+import pytest
+
+from utils import token_bucket
+from utils.token_bucket import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(token_bucket.time, "monotonic", clock)
+    return clock
+
+
+def test_reserve_within_the_burst_does_not_wait(clock):
+    bucket = TokenBucket(rate=10, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.tokens == 0
+
+
+def test_reserve_past_the_burst_queues_behind_the_earlier_reservations(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    bucket.reserve(2)
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    assert bucket.reserve(3) == pytest.approx(0.5)
+
+
+def test_refill_is_capped_by_the_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    bucket.reserve(2)
+    clock.now += 0.1
+    assert bucket.tokens == pytest.approx(1)
+    clock.now += 60
+    assert bucket.tokens == pytest.approx(2)
+
+
+def test_default_capacity_is_one_second_of_rate(clock):
+    assert TokenBucket(rate=25).capacity == 25
+    assert TokenBucket(rate=0.5).capacity == 1
+
+
+def test_penalize_empties_the_bucket_for_the_given_time(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.penalize(2)
+    assert bucket.reserve() == pytest.approx(2.1)
+
+    clock.now += 2.1
+    assert bucket.reserve() == pytest.approx(0.1)
+
+
+def test_penalize_does_not_shorten_a_longer_wait(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.penalize(3)
+    bucket.penalize(1)
+    assert bucket.reserve() == pytest.approx(3.1)
@@ -0,0 +1,146 @@
+# tests/test_update_dispatcher.py
+
+import asyncio
+from datetime import datetime
+
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from services.update_dispatcher import UpdateDispatcher
+
+
+def message_update(update_id: int, chat_id: int) -> Update:
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=chat_id, type="private"), text="hi",
+    ))
+
+
+def tap_update(update_id: int, chat_id: int, message_id: int, data: str) -> Update:
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id),
+        from_user=User(id=chat_id, is_bot=False, first_name="user"),
+        chat_instance="instance",
+        data=data,
+        message=Message(message_id=message_id, date=datetime.now(), chat=Chat(id=chat_id, type="private")),
+    ))
+
+
+class FakeBot:
+    def __init__(self):
+        self.answered: list[str] = []
+
+    async def answer_callback_query(self, callback_query_id: str) -> bool:
+        self.answered.append(callback_query_id)
+        return True
+
+
+class FakeDispatcher:
+    """Records the order of the handled updates, the updates listed in `blocked` wait for their event"""
+    def __init__(self, blocked: dict[int, asyncio.Event] | None = None):
+        self.started: list[int] = []
+        self.finished: list[int] = []
+        self.blocked = blocked or {}
+
+    async def feed_update(self, bot, update: Update) -> None:
+        self.started.append(update.update_id)
+        if update.update_id in self.blocked:
+            await self.blocked[update.update_id].wait()
+        await asyncio.sleep(0)
+        self.finished.append(update.update_id)
+
+
+def test_same_chat_is_handled_in_order_and_other_chats_in_parallel():
+    async def run():
+        release = asyncio.Event()
+        dp = FakeDispatcher(blocked={1: release})
+        dispatcher = UpdateDispatcher(dp, FakeBot(), max_pending=10, workers=2)
+        dispatcher.start()
+
+        for update in (message_update(1, chat_id=100), message_update(2, chat_id=100), message_update(3, chat_id=200)):
+            assert dispatcher.submit(update)
+
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # Update 1 holds its chat, the second worker goes to the other chat instead of update 2
+        assert dp.started == [1, 3]
+        assert 2 not in dp.started
+
+        release.set()
+        await dispatcher.stop(timeout=1)
+        assert dp.finished.index(1) < dp.finished.index(2)
+        assert dispatcher.stats.processed == 3
+        assert dispatcher.stats.pending == 0
+
+    asyncio.run(run())
+
+
+def test_repeated_tap_is_answered_and_dropped():
+    async def run():
+        release = asyncio.Event()
+        bot = FakeBot()
+        dp = FakeDispatcher(blocked={0: release})
+        dispatcher = UpdateDispatcher(dp, bot, max_pending=10, workers=1)
+        dispatcher.start()
+        # The only worker is busy with another chat, so the taps stay queued
+        assert dispatcher.submit(message_update(0, chat_id=200))
+        await asyncio.sleep(0)
+
+        assert dispatcher.submit(tap_update(1, chat_id=100, message_id=5, data="next"))
+        assert dispatcher.submit(tap_update(2, chat_id=100, message_id=5, data="next"))
+        # Other button of the message and the same button of another message are not duplicates
+        assert dispatcher.submit(tap_update(3, chat_id=100, message_id=5, data="back"))
+        assert dispatcher.submit(tap_update(4, chat_id=100, message_id=6, data="next"))
+        await asyncio.sleep(0)
+
+        assert dispatcher.stats.duplicates == 1
+        assert dispatcher.stats.pending == 4
+        assert bot.answered == ["2"]
+
+        release.set()
+        await dispatcher.stop(timeout=1)
+        assert dp.finished == [0, 1, 3, 4]
+
+    asyncio.run(run())
+
+
+def test_tap_being_handled_is_a_duplicate_until_it_is_done():
+    async def run():
+        release = asyncio.Event()
+        bot = FakeBot()
+        dp = FakeDispatcher(blocked={1: release})
+        dispatcher = UpdateDispatcher(dp, bot, max_pending=10, workers=1)
+        dispatcher.start()
+
+        assert dispatcher.submit(tap_update(1, chat_id=100, message_id=5, data="next"))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert dp.started == [1]
+
+        assert dispatcher.submit(tap_update(2, chat_id=100, message_id=5, data="next"))
+        assert dispatcher.stats.duplicates == 1
+
+        release.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        # The first tap is done, the next one is a new tap
+        assert dispatcher.submit(tap_update(3, chat_id=100, message_id=5, data="next"))
+        await dispatcher.stop(timeout=1)
+        assert dp.finished == [1, 3]
+        assert bot.answered == ["2"]
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects_updates():
+    async def run():
+        release = asyncio.Event()
+        dispatcher = UpdateDispatcher(FakeDispatcher(blocked={1: release}), FakeBot(), max_pending=1, workers=1)
+        dispatcher.start()
+        assert dispatcher.submit(message_update(1, chat_id=100))
+        assert not dispatcher.submit(message_update(2, chat_id=200))
+        assert dispatcher.stats.rejected == 1
+
+        release.set()
+        await dispatcher.stop(timeout=1)
+        assert not dispatcher.submit(message_update(3, chat_id=200))  # Stopped
+
+    asyncio.run(run())
@@ -1,6 +1,10 @@
 __all__ = [
     "camel_case_to_snake_case",
+    "TTLCache",
+    "TokenBucket",
 ]
 
 
 from .camel_case_to_snake_case import camel_case_to_snake_case
+from .ttl_cache import TTLCache
+from .token_bucket import TokenBucket
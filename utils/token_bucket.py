@@ -0,0 +1,55 @@
+# utils/token_bucket.py
+
+"""
+Token bucket rate limiter for asyncio.
+Tokens are reserved in the order of the calls, so waiting coroutines are served first come first served
+and the bucket never needs a background refill task: the balance is recalculated on every call.
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        :param rate: Tokens added per second
+        :param capacity: Max tokens stored while idle (burst size), defaults to one second of rate
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket, the balance may go below zero.
+
+        :param tokens: Number of tokens to take
+        :return: Seconds to wait before the reserved tokens are actually available
+        """
+        self._refill()
+        self._tokens -= tokens
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    async def acquire(self, tokens: float = 1) -> None:
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def penalize(self, seconds: float) -> None:
+        """Make the bucket empty for the given time, used on flood control errors like RetryAfter"""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
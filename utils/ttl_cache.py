@@ -0,0 +1,74 @@
+# utils/ttl_cache.py
+
+"""
+Small in-process cache with LRU eviction and per-entry TTL.
+Used by the services to keep rarely changed content (texts, buttons, tests) in memory
+between requests, every entry is stamped with the cache version it was created with,
+so a single `invalidate()` call drops everything without walking the storage.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._data: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get value by key, expired entries and entries from the old versions are treated as missing.
+
+        :param key: Cache key
+        :param default: Value returned if key is not cached
+        :return: Cached value or default
+        """
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, version, value = entry
+        if version != self.version or expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, self.version, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def invalidate(self) -> int:
+        """
+        Drop all cached entries by bumping the cache version.
+
+        :return: New cache version
+        """
+        self.version += 1
+        self._data.clear()
+        return self.version
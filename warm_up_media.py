@@ -0,0 +1,35 @@
+# warm_up_media.py
+
+"""
+Upload all the active media and test pictures to Telegram and store their file_ids.
+The app does the same on startup (MEDIA_WARMUP_ON_STARTUP), the script is for running it by hand,
+e.g. after a bulk upload of the media or next to the psycho_tests_creation scripts.
+
+Usage: python3 warm_up_media.py [chat_id]  (MEDIA_WARMUP_CHAT_ID by default)
+"""
+
+import asyncio
+import sys
+
+from bot_factory import create_bot
+from core import log, settings
+from core.models import db_helper
+from services.media_warmup import warm_up_media
+
+
+async def main() -> None:
+    chat_id = int(sys.argv[1]) if len(sys.argv) > 1 else settings.media_warmup.chat_id
+    if not chat_id:
+        log.error("No chat to upload the media to, pass it as an argument or set MEDIA_WARMUP_CHAT_ID")
+        return
+
+    bot = create_bot(settings.bot.token)
+    try:
+        await warm_up_media(bot, chat_id, settings.media_warmup.concurrency)
+    finally:
+        await bot.session.close()
+        await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())